@@ -0,0 +1,107 @@
+# coding=utf-8
+
+"""Benchmarks the memory held by, construction and formatting of Metadata.
+
+Instances are populated as TVDb episode results are, sharing their field
+values so that only the per-instance overhead is measured. Construction is
+timed using both the validating constructor and from_provider, and formatting
+using both format() and format_many() with each class's default template.
+
+Usage: python -m benchmarks.bench_metadata [instances]
+"""
+
+import sys
+import tracemalloc
+from time import time
+
+from mapi.metadata import (
+    Metadata,
+    MetadataMovie,
+    MetadataTelevision,
+    format_many,
+)
+
+PARAMS = {
+    Metadata: {"title": "Home Movies", "date": "2019-05-23"},
+    MetadataMovie: {
+        "title": "The Goonies",
+        "date": "1985-06-07",
+        "synopsis": "A group of young misfits...",
+        "id_imdb": "tt0089218",
+        "id_tmdb": "9340",
+    },
+    MetadataTelevision: {
+        "series": "Lost",
+        "season": "1",
+        "episode": "1",
+        "date": "2004-09-22",
+        "title": "Pilot (1)",
+        "synopsis": "Stripped of everything, the survivors...",
+        "id_tvdb": "73739",
+    },
+}
+
+
+def run(cls, instances):
+    params = PARAMS[cls]
+    tracemalloc.start()
+    held = [cls(**params) for _ in range(instances)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(held) == instances
+    return size / float(instances)
+
+
+def construct(cls, instances, trusted):
+    params = PARAMS[cls]
+    factory = cls.from_provider if trusted else cls
+    start = time()
+    for _ in range(instances):
+        factory(**params)
+    return instances / (time() - start)
+
+
+def render(cls, instances, batch):
+    metadata_list = [cls(**PARAMS[cls]) for _ in range(instances)]
+    start = time()
+    if batch:
+        format_many(metadata_list)
+    else:
+        for metadata in metadata_list:
+            format(metadata, "")
+    return instances / (time() - start)
+
+
+def main():
+    instances = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("%d instances" % instances)
+    print("%-20s %12s" % ("class", "bytes/inst"))
+    for cls in (Metadata, MetadataMovie, MetadataTelevision):
+        print("%-20s %12.1f" % (cls.__name__, run(cls, instances)))
+    print("")
+    print("%-20s %16s %16s" % ("class", "__init__/s", "from_provider/s"))
+    for cls in (Metadata, MetadataMovie, MetadataTelevision):
+        print(
+            "%-20s %16.1f %16.1f"
+            % (
+                cls.__name__,
+                construct(cls, instances, False),
+                construct(cls, instances, True),
+            )
+        )
+
+    print("")
+    print("%-20s %16s %16s" % ("class", "format/s", "format_many/s"))
+    for cls in (Metadata, MetadataMovie, MetadataTelevision):
+        print(
+            "%-20s %16.1f %16.1f"
+            % (
+                cls.__name__,
+                render(cls, instances, False),
+                render(cls, instances, True),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
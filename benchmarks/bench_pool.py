@@ -0,0 +1,57 @@
+# coding=utf-8
+
+"""Benchmarks request_json throughput versus connection pool size.
+
+Requests are made uncached by a fixed number of threads against a local HTTP
+stand-in which delays each response slightly, emulating a provider's latency.
+
+Usage: python -m benchmarks.bench_pool [threads] [requests]
+"""
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from mapi.utils import mount_adapter, request_json, unmount_adapter
+from tests.stub_server import StubServer
+
+POOL_SIZES = (1, 4, 10, 16, 32)
+
+
+def run(pool_maxsize, pool_block, threads, requests):
+    with StubServer(delay=0.005) as server:
+        mount_adapter(server.url, pool_maxsize, pool_block)
+        urls = ["%s/item/%d" % (server.url, i) for i in range(requests)]
+        start = time()
+        try:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                responses = list(
+                    executor.map(
+                        lambda url: request_json(url, cache=False), urls
+                    )
+                )
+        finally:
+            unmount_adapter(server.url)
+        elapsed = time() - start
+    assert all(status == 200 for status, _ in responses)
+    return requests / elapsed, server.connections
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    print("%d threads, %d requests" % (threads, requests))
+    print("%-10s %-6s %12s %12s" % ("pool_size", "block", "req/s", "conns"))
+    for pool_maxsize in POOL_SIZES:
+        for pool_block in (False, True):
+            throughput, connections = run(
+                pool_maxsize, pool_block, threads, requests
+            )
+            print(
+                "%-10d %-6s %12.1f %12d"
+                % (pool_maxsize, pool_block, throughput, connections)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# coding=utf-8
+
+"""Benchmarks Metadata title casing throughput.
+
+The regression corpus is title cased repeatedly, both without memoization
+(i.e. as if every title were distinct) and with it.
+
+Usage: python -m benchmarks.bench_title_case [rounds]
+"""
+
+import sys
+from time import time
+
+from mapi import metadata
+from mapi.metadata import Metadata
+from tests import TITLE_CASE_CORPUS
+
+TITLES = [s for s, _ in TITLE_CASE_CORPUS]
+
+
+def run(title_case, rounds):
+    start = time()
+    for _ in range(rounds):
+        for s in TITLES:
+            title_case(s)
+    return rounds * len(TITLES) / (time() - start)
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print("%d titles, %d rounds" % (len(TITLES), rounds))
+    print("%-12s %14s" % ("memoized", "titles/s"))
+    print("%-12s %14.1f" % (False, run(metadata._title_case, rounds)))
+    print("%-12s %14.1f" % (True, run(Metadata._str_title_case, rounds)))
+
+
+if __name__ == "__main__":
+    main()
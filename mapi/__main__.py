@@ -0,0 +1,105 @@
+# coding=utf-8
+
+"""Command line entry point, i.e. 'python -m mapi'."""
+
+import argparse
+import sys
+from os import path, remove
+from time import time
+
+from mapi.warm import read_items, warm
+
+__all__ = ["main"]
+
+MAX_ERRORS_SHOWN = 10
+
+
+def _progress(stream):
+    """Returns a progress callback which redraws a status line on stream."""
+    state = {"drawn": 0.0}
+
+    def progress(stats):
+        finished = stats.done + stats.failed + stats.skipped
+        if finished < stats.total and time() - state["drawn"] < 0.1:
+            return
+        state["drawn"] = time()
+        stream.write("\r%s" % stats)
+        if finished == stats.total:
+            stream.write("\n")
+        stream.flush()
+
+    return progress
+
+
+def _warm(arguments):
+    state_path = arguments.state or arguments.file + ".state"
+    if arguments.restart and path.exists(state_path):
+        remove(state_path)
+    items = read_items(arguments.file)
+    options = {}
+    if arguments.cache:
+        options["cache"] = arguments.cache
+    stats = warm(
+        items,
+        concurrency=arguments.concurrency,
+        state_path=state_path,
+        progress=None if arguments.quiet else _progress(sys.stderr),
+        **options
+    )
+    print(
+        "Warmed %d items (%d failed, %d skipped) in %.1fs; %.1f items/s"
+        % (stats.done, stats.failed, stats.skipped, stats.elapsed, stats.rate)
+    )
+    for key in sorted(stats.errors)[:MAX_ERRORS_SHOWN]:
+        print("  %s: %s" % (key, stats.errors[key]))
+    if stats.failed > MAX_ERRORS_SHOWN:
+        print("  ... and %d more" % (stats.failed - MAX_ERRORS_SHOWN))
+    return 1 if stats.failed else 0
+
+
+def main(argv=None):
+    """Parses command line arguments and runs the requested command."""
+    parser = argparse.ArgumentParser(prog="python -m mapi")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True  # as on Python 2, rather than optional on 3
+    warm_parser = commands.add_parser(
+        "warm",
+        help="pre-populate the cache for a list of ids or titles",
+        description=(
+            "Fetches each item of FILE into the cache; one per line as an IMDb "
+            "tt-const, 'tmdb:<id>', 'tvdb:<series id>', or a title optionally "
+            "followed by a year, e.g. 'The Goonies (1985)'. Completed items "
+            "are recorded in a state file so that interrupted runs resume "
+            "where they left off. API keys are read from the environment."
+        ),
+    )
+    warm_parser.add_argument("file", help="file listing items to fetch")
+    warm_parser.add_argument(
+        "-c",
+        "--concurrency",
+        default=8,
+        type=int,
+        help="number of items to fetch at once (default: %(default)s)",
+    )
+    warm_parser.add_argument(
+        "--cache",
+        help="cache backend to populate; memory, sqlite, filesystem or redis",
+    )
+    warm_parser.add_argument(
+        "--state", help="state file path (default: FILE.state)"
+    )
+    warm_parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="discard the state file and fetch every item again",
+    )
+    warm_parser.add_argument(
+        "-q", "--quiet", action="store_true", help="don't show progress"
+    )
+    warm_parser.set_defaults(function=_warm)
+    arguments = parser.parse_args(argv)
+    return arguments.function(arguments)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
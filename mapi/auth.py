@@ -0,0 +1,174 @@
+# coding=utf-8
+
+"""Manages TVDb JSON Web Tokens.
+
+Tokens are shared by every TVDb provider instance and thread using the same
+API key through get_token_manager. They are refreshed using
+mapi.endpoints.tvdb_refresh_token shortly before they expire, and persisted to
+the directory given by the MAPI_TOKEN_DIR environment variable (defaulting to
+TOKEN_DIR; set it to an empty string to disable persistence) so that
+short-lived processes can reuse them without logging in again.
+"""
+
+import base64
+import hashlib
+import json
+import threading
+from os import environ, makedirs, path
+from tempfile import NamedTemporaryFile
+from time import time
+
+from appdirs import user_cache_dir
+
+from mapi import log
+from mapi.compatibility import replace
+from mapi.endpoints import tvdb_login, tvdb_refresh_token
+from mapi.exceptions import MapiNetworkException, MapiProviderException
+
+__all__ = [
+    "get_token_manager",
+    "REFRESH_MARGIN",
+    "TOKEN_DIR",
+    "TOKEN_LIFETIME",
+    "TokenManager",
+]
+
+REFRESH_MARGIN = 3600  # refresh tokens expiring within an hour
+TOKEN_DIR = path.join(user_cache_dir(), "mapi-tokens")
+TOKEN_LIFETIME = 86400  # assumed if a token's expiry can't be decoded
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def _token_expiry(token):
+    """Decodes the expiry timestamp from a JWT's payload, if possible."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        payload = base64.urlsafe_b64decode(payload.encode("ascii"))
+        return float(json.loads(payload.decode("utf-8"))["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenManager(object):
+    """Provides a valid TVDb token for an API key, logging in or refreshing
+    as needed; safe to share between threads.
+    """
+
+    def __init__(self, api_key, token_path=None, refresh_margin=REFRESH_MARGIN):
+        self.api_key = api_key
+        self.path = token_path
+        self.refresh_margin = refresh_margin
+        # replaced as a whole so it can be read without holding the lock
+        self._current = "", 0  # token, expiry timestamp
+        self._lock = threading.RLock()
+
+    def peek(self):
+        """Returns the current token if it hasn't expired, or an empty string.
+
+        Note: never makes network requests; the token file is only read once
+        the token held in memory has expired.
+        """
+        token, expires = self._current
+        if expires > time():
+            return token
+        with self._lock:
+            self._load()  # may have been renewed by another process
+            token, expires = self._current
+            return token if expires > time() else ""
+
+    def get(self):
+        """
+        Returns a valid token, refreshing or logging in if required.
+
+        Note: Network errors renewing a token which hasn't expired yet are
+        logged rather than raised, returning the current token instead.
+        """
+        token, expires = self._current
+        if expires - self.refresh_margin > time():
+            return token
+        with self._lock:
+            self._load()  # may have been renewed by another process
+            token, expires = self._current
+            if expires - self.refresh_margin > time():
+                return token
+            if expires <= time():
+                token = ""
+            current = token  # still valid, though due to be renewed
+            try:
+                if token:
+                    try:
+                        log.info("refreshing tvdb token")
+                        token = tvdb_refresh_token(token)
+                    except MapiProviderException:
+                        token = ""
+                if not token:
+                    log.info("logging into tvdb")
+                    token = tvdb_login(self.api_key)
+            except MapiNetworkException:
+                if not current:
+                    raise
+                # retried by the next call, until the token actually expires
+                log.info("failed to renew tvdb token early; reusing it")
+                return current
+            self._set(token)
+            self._save()
+            return token
+
+    def invalidate(self, token):
+        """Discards token if it is still current, e.g. if it was rejected."""
+        with self._lock:
+            if token and token == self._current[0]:
+                self._set("", 0)
+                self._save()
+
+    def _set(self, token, expires=None):
+        if expires is None:
+            expires = _token_expiry(token) or time() + TOKEN_LIFETIME
+        self._current = token, expires
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r") as fp:
+                stored = json.load(fp)
+            token, expires = stored["token"], float(stored["expires"])
+        except (IOError, OSError, KeyError, TypeError, ValueError):
+            return
+        if expires > self._current[1]:
+            self._set(token, expires)
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = path.dirname(self.path)
+        try:
+            if not path.isdir(directory):
+                makedirs(directory)
+            # temporary files are only readable by their owner
+            with NamedTemporaryFile(
+                "w", dir=directory, suffix=".tmp", delete=False
+            ) as fp:
+                token, expires = self._current
+                json.dump({"token": token, "expires": expires}, fp)
+            replace(fp.name, self.path)
+        except (IOError, OSError) as e:
+            log.debug("failed to persist tvdb token: %s", e)
+
+
+def get_token_manager(api_key):
+    """Returns the TokenManager singleton for an API key."""
+    with _managers_lock:
+        manager = _managers.get(api_key)
+        if manager is None:
+            directory = environ.get("MAPI_TOKEN_DIR", TOKEN_DIR)
+            token_path = None
+            if directory:
+                # hashed so API keys aren't leaked through file names
+                name = hashlib.sha1(api_key.encode("utf-8")).hexdigest()
+                token_path = path.join(directory, "tvdb-%s.json" % name)
+            manager = _managers[api_key] = TokenManager(api_key, token_path)
+    return manager
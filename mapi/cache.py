@@ -0,0 +1,473 @@
+# coding=utf-8
+
+"""Pluggable response cache backends used by mapi.utils.request_json.
+
+A backend stores JSON-serializable values under string keys for a number of
+seconds, which is looked up per endpoint function from TTL_POLICY. The default
+backend is selected using the MAPI_CACHE_BACKEND environment variable (one of
+'memory', 'sqlite', 'filesystem', or 'redis', defaulting to 'sqlite'), or
+overridden at runtime using set_cache. Providers may also be given a backend
+instance or name using their 'cache' option.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from abc import abstractmethod
+from collections import OrderedDict
+from datetime import date, timedelta
+from os import environ, listdir, makedirs, path, remove
+from sys import version_info
+from tempfile import NamedTemporaryFile
+from time import time
+
+from appdirs import user_cache_dir
+
+from mapi import log
+from mapi.compatibility import AbstractClass, replace, ustr
+from mapi.exceptions import MapiException
+
+__all__ = [
+    "CACHE_DIR",
+    "CACHE_PATH",
+    "CacheBackend",
+    "clear_series",
+    "DEFAULT_TTL",
+    "FileCache",
+    "get_backend",
+    "get_cache",
+    "get_memo",
+    "get_ttl",
+    "make_key",
+    "MemoryCache",
+    "record_series",
+    "RedisCache",
+    "set_cache",
+    "set_memo",
+    "set_ttl",
+    "SQLiteCache",
+    "TTL_POLICY",
+]
+
+CACHE_DIR = path.join(user_cache_dir(), "mapi-py%d" % version_info.major)
+CACHE_PATH = CACHE_DIR + ".sqlite"
+DEFAULT_TTL = 518400  # 6 days
+MEMO_MAX_BYTES = 33554432  # 32 MiB
+MEMO_MAX_ENTRIES = 4096
+PURGE_INTERVAL = 3600  # 1 hour
+AIRING_WINDOW = 30  # days since an episode aired for its series to be airing
+TTL_POLICY = {
+    "omdb_search": 86400,  # 1 day
+    "omdb_title": 2592000,  # 30 days
+    "tmdb_find": 2592000,
+    "tmdb_movies": 2592000,
+    "tmdb_search_movies": 86400,
+    "tvdb_airing": 21600,  # 6 hours; caps tvdb series ttls while airing
+    "tvdb_episodes_id": 604800,  # 7 days
+    "tvdb_search_series": 86400,
+    "tvdb_series_id": 604800,
+    "tvdb_series_id_episodes": 604800,
+    "tvdb_series_id_episodes_query": 604800,
+}
+
+_singleton_lock = threading.Lock()
+
+
+def _is_airing(content, id_tvdb=None):
+    """
+    Determines whether TVDb series or episode content is currently airing.
+
+    Note: Pages of a series' episodes are also considered airing if id_tvdb,
+    the series' id, is given and the series is continuing or its status hasn't
+    been recorded, since its first pages list only older episodes.
+    """
+    data = content.get("data") if isinstance(content, dict) else None
+    if isinstance(data, dict):
+        return data.get("status") == "Continuing"
+    elif isinstance(data, list):
+        if (
+            id_tvdb is not None
+            and _series_airing.get(int(id_tvdb)) is not False
+        ):
+            return True
+        cutoff = (date.today() - timedelta(days=AIRING_WINDOW)).isoformat()
+        return any((entry.get("firstAired") or "") >= cutoff for entry in data)
+    return False
+
+
+def record_series(id_tvdb, content):
+    """
+    Records whether a TVDb series is airing from its tvdb_series_id content,
+    which get_ttl uses to cap the TTLs of its episode pages.
+
+    Note: Records are kept in process memory, shared by every provider and
+    thread, until the series' own TTL expires or clear_series is called.
+    """
+    _series_airing.set(
+        int(id_tvdb), _is_airing(content), get_ttl("tvdb_series_id", content)
+    )
+
+
+def clear_series():
+    """Forgets whether every TVDb series recorded by record_series is airing."""
+    _series_airing.clear()
+
+
+def get_ttl(endpoint, content=None, id_tvdb=None):
+    """
+    Looks up the number of seconds to cache an endpoint's response for.
+
+    Note: TTL_POLICY values may be a number of seconds or a callable which is
+    passed the response content and returns a number of seconds. The TTLs of
+    TVDb series endpoints are capped to TTL_POLICY["tvdb_airing"] when their
+    content indicates that the series is currently airing, or for pages of its
+    episodes, when the series with id id_tvdb is; see record_series.
+    """
+    ttl = TTL_POLICY.get(endpoint, DEFAULT_TTL)
+    if callable(ttl):
+        ttl = ttl(content)
+    elif endpoint.startswith("tvdb_series_id") and _is_airing(content, id_tvdb):
+        ttl = min(ttl, TTL_POLICY["tvdb_airing"])
+    return ttl
+
+
+def set_ttl(endpoint, ttl):
+    """Sets the cache TTL policy for an endpoint function's responses."""
+    TTL_POLICY[endpoint] = ttl
+
+
+def make_key(method, url, parameters=None, body=None, language=None):
+    """Creates a cache key for a normalized request."""
+    request = [method.upper(), url, parameters or [], body, language]
+    serialized = json.dumps(request, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(serialized.encode("utf-8")).hexdigest()
+
+
+class CacheBackend(AbstractClass):
+    """ABC for cache backends."""
+
+    @abstractmethod
+    def get(self, key):
+        """Returns the value stored for key, or None if missing or expired."""
+
+    def get_with_ttl(self, key):
+        """
+        Returns the value stored for key along with its remaining number of
+        seconds, or None if missing or expired; the number of seconds is None
+        if the backend can't tell.
+        """
+        value = self.get(key)
+        return None if value is None else (value, None)
+
+    @abstractmethod
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        """Stores value for key, expiring after ttl seconds."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Removes key if present."""
+
+    @abstractmethod
+    def clear(self):
+        """Removes all keys."""
+
+
+class MemoryCache(CacheBackend):
+    """In-process least recently used cache, bounded by entries and optionally
+    by the total JSON-serialized size of its values in bytes.
+
+    Note: values are stored and returned as-is rather than being copied.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        found = self.get_with_ttl(key)
+        return None if found is None else found[0]
+
+    def get_with_ttl(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            now = time()
+            if entry is not None and entry[0] < now:
+                self._bytes -= entry[2]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1], entry[0] - now
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        size = len(json.dumps(value)) if self.max_bytes else 0
+        with self._lock:
+            self._pop(key)
+            if self.max_bytes and size > self.max_bytes:
+                return
+            self._entries[key] = time() + ttl, value, size
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes and self._bytes > self.max_bytes
+            ):
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Returns hit and miss counters along with the cache's current size."""
+        with self._lock:
+            return {
+                "bytes": self._bytes,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+
+class SQLiteCache(CacheBackend):
+    """SQLite database cache, safe to share between threads and processes."""
+
+    def __init__(
+        self, cache_path=CACHE_PATH, timeout=30, purge_interval=PURGE_INTERVAL
+    ):
+        self.path = cache_path
+        self.timeout = timeout
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._purged = 0  # time of the last purge of expired rows
+
+    @property
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = path.dirname(self.path)
+            if directory and not path.isdir(directory):
+                try:
+                    makedirs(directory)
+                except OSError:  # pragma: no cover
+                    pass  # created concurrently
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS mapi_responses "
+                "(key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        found = self.get_with_ttl(key)
+        return None if found is None else found[0]
+
+    def get_with_ttl(self, key):
+        now = time()
+        row = self._connection.execute(
+            "SELECT value, expires FROM mapi_responses "
+            "WHERE key = ? AND expires >= ?",
+            (key, now),
+        ).fetchone()
+        return (json.loads(row[0]), row[1] - now) if row else None
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        now = time()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO mapi_responses VALUES (?, ?, ?)",
+            (key, json.dumps(value), now + ttl),
+        )
+        if now - self._purged >= self.purge_interval:
+            self.purge()
+
+    def purge(self):
+        """Deletes expired rows; called by set every purge_interval seconds."""
+        self._purged = time()
+        self._connection.execute(
+            "DELETE FROM mapi_responses WHERE expires < ?", (self._purged,)
+        )
+
+    def delete(self, key):
+        self._connection.execute(
+            "DELETE FROM mapi_responses WHERE key = ?", (key,)
+        )
+
+    def clear(self):
+        self._connection.execute("DELETE FROM mapi_responses")
+
+
+class FileCache(CacheBackend):
+    """Filesystem cache storing one JSON file per key."""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, key):
+        return path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        found = self.get_with_ttl(key)
+        return None if found is None else found[0]
+
+    def get_with_ttl(self, key):
+        try:
+            with open(self._path(key), "r") as fp:
+                expires, value = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+        now = time()
+        return (value, expires - now) if expires >= now else None
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        if not path.isdir(self.directory):
+            try:
+                makedirs(self.directory)
+            except OSError:  # pragma: no cover
+                pass  # created concurrently
+        # write then rename so readers never see a partially written file
+        with NamedTemporaryFile(
+            "w", dir=self.directory, suffix=".tmp", delete=False
+        ) as fp:
+            json.dump([time() + ttl, value], fp)
+        replace(fp.name, self._path(key))
+
+    def delete(self, key):
+        try:
+            remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        if not path.isdir(self.directory):
+            return
+        for filename in listdir(self.directory):
+            if filename.endswith(".json"):
+                self.delete(filename[:-5])
+
+
+class RedisCache(CacheBackend):
+    """Redis cache; client may be any object implementing the get, set (with
+    the 'ex' keyword argument), delete, scan_iter, and ttl methods of
+    redis.Redis.
+    """
+
+    def __init__(self, client, prefix="mapi:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return json.loads(value)
+
+    def get_with_ttl(self, key):
+        value = self.get(key)
+        if value is None:
+            return None
+        ttl = self.client.ttl(self.prefix + key)
+        # negative if the key has since expired or has no expiry
+        return value, ttl if ttl is not None and ttl >= 0 else None
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+
+def _redis_backend():
+    try:
+        import redis
+    except ImportError:
+        raise MapiException("the redis cache backend requires redis-py")
+    url = environ.get("MAPI_REDIS_URL", "redis://localhost:6379/0")
+    return RedisCache(redis.Redis.from_url(url))
+
+
+# TVDb series id: whether it is airing, recorded by record_series; process-wide
+_series_airing = MemoryCache(max_entries=MEMO_MAX_ENTRIES)
+
+
+def get_backend(backend):
+    """Factory function for cache backends by name."""
+    backends = {
+        "filesystem": lambda: FileCache(
+            environ.get("MAPI_CACHE_PATH", CACHE_DIR)
+        ),
+        "memory": MemoryCache,
+        "redis": _redis_backend,
+        "sqlite": lambda: SQLiteCache(
+            environ.get("MAPI_CACHE_PATH", CACHE_PATH)
+        ),
+    }
+    try:
+        return backends[ustr(backend).lower()]()
+    except KeyError:
+        msg = "Attempted to initialize non-existing cache backend"
+        log.error(msg)
+        raise MapiException(msg)
+
+
+def get_cache():
+    """Convenience function that returns the default cache backend singleton."""
+    with _singleton_lock:
+        if not hasattr(get_cache, "backend"):
+            get_cache.backend = get_backend(
+                environ.get("MAPI_CACHE_BACKEND", "sqlite")
+            )
+    return get_cache.backend
+
+
+def set_cache(backend):
+    """Replaces the default cache backend with a backend instance or name."""
+    if not isinstance(backend, CacheBackend):
+        backend = get_backend(backend)
+    get_cache.backend = backend
+
+
+def get_memo():
+    """
+    Convenience function that returns the in-process memoization tier.
+
+    Note: The memoization tier sits in front of all other backends, returning
+    already parsed responses without deserializing them. Returns None if it has
+    been disabled using set_memo.
+    """
+    with _singleton_lock:
+        if not hasattr(get_memo, "backend"):
+            get_memo.backend = MemoryCache(
+                max_entries=MEMO_MAX_ENTRIES, max_bytes=MEMO_MAX_BYTES
+            )
+    return get_memo.backend
+
+
+def set_memo(backend):
+    """Replaces the memoization tier with a MemoryCache, or None to disable."""
+    get_memo.backend = backend
@@ -2,6 +2,7 @@
 
 """Manages compatibility for Python versions 2.7 and 3+."""
 
+import os
 from abc import ABCMeta
 
 try:  # pragma: no cover
@@ -9,7 +10,8 @@ try:  # pragma: no cover
 except ImportError:  # pragma: no cover
     from collections import MutableMapping
 
-__all__ = ["MutableMapping", "AbstractClass", "ustr"]
+__all__ = ["MutableMapping", "AbstractClass", "replace", "ustr"]
 
 AbstractClass = ABCMeta("ABC", (object,), {"__slots__": ()})
+replace = getattr(os, "replace", os.rename)  # atomic on posix
 ustr = type(u"")  # unicode string type
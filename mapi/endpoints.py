@@ -1,12 +1,15 @@
 # coding=utf-8
 
+from functools import partial
 from re import match
 
+from mapi.cache import get_ttl, record_series
 from mapi.exceptions import (
     MapiNetworkException,
     MapiNotFoundException,
     MapiProviderException,
 )
+from mapi.ratelimit import get_limiter
 from mapi.utils import clean_dict, request_json
 
 __all__ = [
@@ -53,6 +56,16 @@ TVDB_LANGUAGE_CODES = [
 ]
 
 
+def _limiter(limiter, provider, api_key=None):
+    """
+    Resolves an endpoint's limiter argument: None selects the provider's shared
+    limiter for api_key and False disables rate limiting.
+    """
+    if limiter is None:
+        return get_limiter(provider, api_key)
+    return limiter or None
+
+
 def omdb_title(
     api_key,
     id_imdb=None,
@@ -63,6 +76,8 @@ def omdb_title(
     year=None,
     plot=None,
     cache=True,
+    retry=None,
+    limiter=None,
 ):
     """
     Lookup media using the Open Movie Database.
@@ -91,7 +106,14 @@ def omdb_title(
         "plot": plot,
     }
     parameters = clean_dict(parameters)
-    status, content = request_json(url, parameters, cache=cache)
+    status, content = request_json(
+        url,
+        parameters,
+        cache=cache,
+        ttl=partial(get_ttl, "omdb_title"),
+        limiter=_limiter(limiter, "omdb", api_key),
+        retry=retry,
+    )
     error = content.get("Error") if isinstance(content, dict) else None
     if status == 401:
         raise MapiProviderException("invalid API key")
@@ -102,7 +124,16 @@ def omdb_title(
     return content
 
 
-def omdb_search(api_key, query, year=None, media_type=None, page=1, cache=True):
+def omdb_search(
+    api_key,
+    query,
+    year=None,
+    media_type=None,
+    page=1,
+    cache=True,
+    retry=None,
+    limiter=None,
+):
     """
     Search for media using the Open Movie Database.
 
@@ -123,7 +154,14 @@ def omdb_search(api_key, query, year=None, media_type=None, page=1, cache=True):
         "page": page,
     }
     parameters = clean_dict(parameters)
-    status, content = request_json(url, parameters, cache=cache)
+    status, content = request_json(
+        url,
+        parameters,
+        cache=cache,
+        ttl=partial(get_ttl, "omdb_search"),
+        limiter=_limiter(limiter, "omdb", api_key),
+        retry=retry,
+    )
     if status == 401:
         raise MapiProviderException("invalid API key")
     elif content and not content.get("totalResults"):
@@ -134,7 +172,13 @@ def omdb_search(api_key, query, year=None, media_type=None, page=1, cache=True):
 
 
 def tmdb_find(
-    api_key, external_source, external_id, language="en-US", cache=True
+    api_key,
+    external_source,
+    external_id,
+    language="en-US",
+    cache=True,
+    retry=None,
+    limiter=None,
 ):
     """
     Search for The Movie Database objects using another DB's foreign key.
@@ -163,7 +207,14 @@ def tmdb_find(
         "tv_results",
         "tv_season_results",
     ]
-    status, content = request_json(url, parameters, cache=cache)
+    status, content = request_json(
+        url,
+        parameters,
+        cache=cache,
+        ttl=partial(get_ttl, "tmdb_find"),
+        limiter=_limiter(limiter, "tmdb", api_key),
+        retry=retry,
+    )
     if status == 401:
         raise MapiProviderException("invalid API key")
     elif status != 200 or not any(content.keys()):  # pragma: no cover
@@ -173,7 +224,9 @@ def tmdb_find(
     return content
 
 
-def tmdb_movies(api_key, id_tmdb, language="en-US", cache=True):
+def tmdb_movies(
+    api_key, id_tmdb, language="en-US", cache=True, retry=None, limiter=None
+):
     """
     Lookup a movie item using The Movie Database.
 
@@ -184,7 +237,14 @@ def tmdb_movies(api_key, id_tmdb, language="en-US", cache=True):
     except ValueError:
         raise MapiProviderException("id_tmdb must be numeric")
     parameters = {"api_key": api_key, "language": language}
-    status, content = request_json(url, parameters, cache=cache)
+    status, content = request_json(
+        url,
+        parameters,
+        cache=cache,
+        ttl=partial(get_ttl, "tmdb_movies"),
+        limiter=_limiter(limiter, "tmdb", api_key),
+        retry=retry,
+    )
     if status == 401:
         raise MapiProviderException("invalid API key")
     elif status == 404:
@@ -195,7 +255,15 @@ def tmdb_movies(api_key, id_tmdb, language="en-US", cache=True):
 
 
 def tmdb_search_movies(
-    api_key, title, year=None, adult=False, region=None, page=1, cache=True
+    api_key,
+    title,
+    year=None,
+    adult=False,
+    region=None,
+    page=1,
+    cache=True,
+    retry=None,
+    limiter=None,
 ):
     """
     Search for movies using The Movie Database.
@@ -216,7 +284,14 @@ def tmdb_search_movies(
         "region": region,
         "year": year,
     }
-    status, content = request_json(url, parameters, cache=cache)
+    status, content = request_json(
+        url,
+        parameters,
+        cache=cache,
+        ttl=partial(get_ttl, "tmdb_search_movies"),
+        limiter=_limiter(limiter, "tmdb", api_key),
+        retry=retry,
+    )
     if status == 401:
         raise MapiProviderException("invalid API key")
     elif status != 200 or not any(content.keys()):  # pragma: no cover
@@ -235,7 +310,9 @@ def tvdb_login(api_key):
     """
     url = "https://api.thetvdb.com/login"
     body = {"apikey": api_key}
-    status, content = request_json(url, body=body, cache=False)
+    status, content = request_json(
+        url, body=body, cache=False, limiter=get_limiter("tvdb")
+    )
     if status == 401:
         raise MapiProviderException("invalid api key")
     elif status != 200 or not content.get("token"):  # pragma: no cover
@@ -251,7 +328,9 @@ def tvdb_refresh_token(token):
     """
     url = "https://api.thetvdb.com/refresh_token"
     headers = {"Authorization": "Bearer %s" % token}
-    status, content = request_json(url, headers=headers, cache=False)
+    status, content = request_json(
+        url, headers=headers, cache=False, limiter=get_limiter("tvdb")
+    )
     if status == 401:
         raise MapiProviderException("invalid token")
     elif status != 200 or not content.get("token"):  # pragma: no cover
@@ -259,7 +338,9 @@ def tvdb_refresh_token(token):
     return content["token"]
 
 
-def tvdb_episodes_id(token, id_tvdb, lang="en", cache=True):
+def tvdb_episodes_id(
+    token, id_tvdb, lang="en", cache=True, retry=None, limiter=None
+):
     """
     Returns the full information for a given episode id.
 
@@ -274,7 +355,14 @@ def tvdb_episodes_id(token, id_tvdb, lang="en", cache=True):
     except ValueError:
         raise MapiProviderException("id_tvdb must be numeric")
     headers = {"Accept-Language": lang, "Authorization": "Bearer %s" % token}
-    status, content = request_json(url, headers=headers, cache=cache)
+    status, content = request_json(
+        url,
+        headers=headers,
+        cache=cache,
+        ttl=partial(get_ttl, "tvdb_episodes_id"),
+        limiter=_limiter(limiter, "tvdb"),
+        retry=retry,
+    )
     if status == 401:
         raise MapiProviderException("invalid token")
     elif status == 404:
@@ -286,7 +374,9 @@ def tvdb_episodes_id(token, id_tvdb, lang="en", cache=True):
     return content
 
 
-def tvdb_series_id(token, id_tvdb, lang="en", cache=True):
+def tvdb_series_id(
+    token, id_tvdb, lang="en", cache=True, retry=None, limiter=None
+):
     """
     Returns a series records that contains all information known about a
     particular series id.
@@ -302,17 +392,27 @@ def tvdb_series_id(token, id_tvdb, lang="en", cache=True):
     except ValueError:
         raise MapiProviderException("id_tvdb must be numeric")
     headers = {"Accept-Language": lang, "Authorization": "Bearer %s" % token}
-    status, content = request_json(url, headers=headers, cache=cache)
+    status, content = request_json(
+        url,
+        headers=headers,
+        cache=cache,
+        ttl=partial(get_ttl, "tvdb_series_id"),
+        limiter=_limiter(limiter, "tvdb"),
+        retry=retry,
+    )
     if status == 401:
         raise MapiProviderException("invalid token")
     elif status == 404:
         raise MapiNotFoundException
     elif status != 200 or not content.get("data"):  # pragma: no cover
         raise MapiNetworkException("TVDb down or unavailable?")
+    record_series(id_tvdb, content)
     return content
 
 
-def tvdb_series_id_episodes(token, id_tvdb, page=1, lang="en", cache=True):
+def tvdb_series_id_episodes(
+    token, id_tvdb, page=1, lang="en", cache=True, retry=None, limiter=None
+):
     """
     All episodes for a given series.
 
@@ -330,7 +430,13 @@ def tvdb_series_id_episodes(token, id_tvdb, page=1, lang="en", cache=True):
     headers = {"Accept-Language": lang, "Authorization": "Bearer %s" % token}
     parameters = {"page": page}
     status, content = request_json(
-        url, parameters, headers=headers, cache=cache
+        url,
+        parameters,
+        headers=headers,
+        cache=cache,
+        ttl=partial(get_ttl, "tvdb_series_id_episodes", id_tvdb=id_tvdb),
+        limiter=_limiter(limiter, "tvdb"),
+        retry=retry,
     )
     if status == 401:
         raise MapiProviderException("invalid token")
@@ -342,7 +448,15 @@ def tvdb_series_id_episodes(token, id_tvdb, page=1, lang="en", cache=True):
 
 
 def tvdb_series_id_episodes_query(
-    token, id_tvdb, episode=None, season=None, page=1, lang="en", cache=True
+    token,
+    id_tvdb,
+    episode=None,
+    season=None,
+    page=1,
+    lang="en",
+    cache=True,
+    retry=None,
+    limiter=None,
 ):
     """
     Allows the user to query against episodes for the given series.
@@ -362,7 +476,13 @@ def tvdb_series_id_episodes_query(
     headers = {"Accept-Language": lang, "Authorization": "Bearer %s" % token}
     parameters = {"airedSeason": season, "airedEpisode": episode, "page": page}
     status, content = request_json(
-        url, parameters, headers=headers, cache=cache
+        url,
+        parameters,
+        headers=headers,
+        cache=cache,
+        ttl=partial(get_ttl, "tvdb_series_id_episodes_query", id_tvdb=id_tvdb),
+        limiter=_limiter(limiter, "tvdb"),
+        retry=retry,
     )
     if status == 401:
         raise MapiProviderException("invalid token")
@@ -374,7 +494,14 @@ def tvdb_series_id_episodes_query(
 
 
 def tvdb_search_series(
-    token, series=None, id_imdb=None, id_zap2it=None, lang="en", cache=True
+    token,
+    series=None,
+    id_imdb=None,
+    id_zap2it=None,
+    lang="en",
+    cache=True,
+    retry=None,
+    limiter=None,
 ):
     """
     Allows the user to search for a series based on the following parameters.
@@ -390,7 +517,13 @@ def tvdb_search_series(
     parameters = {"name": series, "imdbId": id_imdb, "zap2itId": id_zap2it}
     headers = {"Accept-Language": lang, "Authorization": "Bearer %s" % token}
     status, content = request_json(
-        url, parameters, headers=headers, cache=cache
+        url,
+        parameters,
+        headers=headers,
+        cache=cache,
+        ttl=partial(get_ttl, "tvdb_search_series"),
+        limiter=_limiter(limiter, "tvdb"),
+        retry=retry,
     )
     if status == 401:
         raise MapiProviderException("invalid token")
@@ -0,0 +1,94 @@
+# coding=utf-8
+
+"""Awaitable equivalents of the functions provided by mapi.endpoints.
+
+Each coroutine function accepts the same parameters, performs the same
+validation and raises the same exceptions as its blocking counterpart. Calls
+are not made using asynchronous I/O, but dispatched to a shared thread pool,
+so a single event loop can await many requests without blocking; concurrency
+is capped by its threads, at most the pool's max_workers being in flight at
+once, the rest waiting in its queue. The default pool has MAX_CONNECTIONS
+workers, matching the connection pool of the session returned by
+mapi.utils.get_session; set_executor replaces it, e.g. with a larger one paired
+with a larger connection pool using mapi.utils.mount_adapter.
+
+Note: requires Python 3.7+.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from mapi import endpoints
+from mapi.utils import MAX_CONNECTIONS
+
+__all__ = [
+    "get_executor",
+    "omdb_search",
+    "set_executor",
+    "omdb_title",
+    "tmdb_find",
+    "tmdb_movies",
+    "tmdb_search_movies",
+    "tvdb_episodes_id",
+    "tvdb_login",
+    "tvdb_refresh_token",
+    "tvdb_search_series",
+    "tvdb_series_id",
+    "tvdb_series_id_episodes",
+    "tvdb_series_id_episodes_query",
+]
+
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Convenience function that returns the shared thread pool singleton."""
+    with _executor_lock:
+        if not hasattr(get_executor, "executor"):
+            get_executor.executor = ThreadPoolExecutor(
+                max_workers=MAX_CONNECTIONS, thread_name_prefix="mapi"
+            )
+    return get_executor.executor
+
+
+def set_executor(executor):
+    """
+    Replaces the shared thread pool singleton; the previous one is shut down
+    once its queued calls complete.
+    """
+    with _executor_lock:
+        previous = getattr(get_executor, "executor", None)
+        get_executor.executor = executor
+    if previous is not None and previous is not executor:
+        previous.shutdown(wait=False)
+
+
+def _awaitable(function):
+    """Wraps a blocking endpoint function in a coroutine function."""
+
+    @wraps(function)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_executor(), partial(function, *args, **kwargs)
+        )
+
+    return wrapper
+
+
+omdb_search = _awaitable(endpoints.omdb_search)
+omdb_title = _awaitable(endpoints.omdb_title)
+tmdb_find = _awaitable(endpoints.tmdb_find)
+tmdb_movies = _awaitable(endpoints.tmdb_movies)
+tmdb_search_movies = _awaitable(endpoints.tmdb_search_movies)
+tvdb_episodes_id = _awaitable(endpoints.tvdb_episodes_id)
+tvdb_login = _awaitable(endpoints.tvdb_login)
+tvdb_refresh_token = _awaitable(endpoints.tvdb_refresh_token)
+tvdb_search_series = _awaitable(endpoints.tvdb_search_series)
+tvdb_series_id = _awaitable(endpoints.tvdb_series_id)
+tvdb_series_id_episodes = _awaitable(endpoints.tvdb_series_id_episodes)
+tvdb_series_id_episodes_query = _awaitable(
+    endpoints.tvdb_series_id_episodes_query
+)
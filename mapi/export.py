@@ -0,0 +1,219 @@
+# coding=utf-8
+
+"""Columnar export of search results.
+
+to_columns consumes Metadata objects, e.g. from a provider's search generator,
+into a dict of columns without building a dict per result. Integer columns
+(season, episode and year) are typed arrays using NULL for missing values,
+which NumPy can wrap without copying (e.g. numpy.frombuffer(column, dtype=
+column.typecode)); media and series are dictionary encoded; and the remaining
+columns are lists of strings or None. Tables can be written as CSV or JSON
+Lines, which LocalStore can import, or as Parquet if pyarrow is installed.
+"""
+
+import csv
+import io
+import json
+from array import array
+from collections import OrderedDict
+from sys import version_info
+
+from mapi import log
+from mapi.compatibility import ustr
+from mapi.exceptions import MapiException
+from mapi.metadata import Metadata
+from mapi.utils import year_parse
+
+__all__ = [
+    "COLUMNS",
+    "DictionaryColumn",
+    "NULL",
+    "export",
+    "to_arrow",
+    "to_columns",
+    "write_csv",
+    "write_json_lines",
+    "write_parquet",
+]
+
+COLUMNS = (
+    "media",
+    "series",
+    "season",
+    "episode",
+    "year",
+    "date",
+    "title",
+    "synopsis",
+    "id_imdb",
+    "id_tmdb",
+    "id_tvdb",
+)
+DICTIONARY_COLUMNS = {"media", "series"}
+INTEGER_COLUMNS = {"season", "episode", "year"}
+NULL = -1  # missing value of integer columns and dictionary codes
+
+
+class DictionaryColumn(object):
+    """Dictionary encoded string column.
+
+    codes is a typed array of indexes into values, or NULL for missing values.
+    """
+
+    def __init__(self):
+        self.codes = array("l")
+        self.values = []
+        self._lookup = {}  # value: code
+
+    def __getitem__(self, index):
+        code = self.codes[index]
+        return None if code == NULL else self.values[code]
+
+    def __iter__(self):
+        values = self.values
+        for code in self.codes:
+            yield None if code == NULL else values[code]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(NULL)
+            return
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+
+def _decoded(column):
+    """Iterates over a column's values, using None for missing values."""
+    if isinstance(column, array):
+        return (None if value == NULL else value for value in column)
+    return iter(column)
+
+
+def _rows(columns):
+    """Iterates over a table's rows as tuples."""
+    return zip(*[_decoded(column) for column in columns.values()])
+
+
+def to_columns(results, columns=COLUMNS):
+    """
+    Consumes Metadata objects into an OrderedDict of columns, each as long as
+    the number of results; see the module docstring for their types. Raises
+    MapiException for results which aren't Metadata objects.
+    """
+    table = OrderedDict()
+    appenders = []
+    for name in columns:
+        if name in INTEGER_COLUMNS:
+            column = array("l")
+        elif name in DICTIONARY_COLUMNS:
+            column = DictionaryColumn()
+        else:
+            column = []
+        table[name] = column
+        appenders.append((name, name in INTEGER_COLUMNS, column.append))
+    fields = list(columns) + ["date"]  # year falls back to the date's
+    for metadata in results:
+        if not isinstance(metadata, Metadata):
+            msg = "Attempted to export non-Metadata result"
+            log.error(msg)
+            raise MapiException(msg)
+        values = metadata.raw_values(fields)
+        for (name, integer, append), value in zip(appenders, values):
+            if integer:
+                if name == "year" and not value:
+                    value = year_parse(values[-1])
+                append(int(value) if value or value == 0 else NULL)
+            elif value is None or isinstance(value, ustr):
+                append(value)
+            else:
+                append(ustr(value))
+    return table
+
+
+def to_arrow(columns):
+    """Converts a table of columns into a pyarrow Table."""
+    try:
+        import pyarrow
+    except ImportError:
+        raise MapiException("arrow conversion requires pyarrow")
+    arrays = []
+    for column in columns.values():
+        if isinstance(column, DictionaryColumn):
+            codes = pyarrow.array(_decoded(column.codes), pyarrow.int32())
+            arrays.append(
+                pyarrow.DictionaryArray.from_arrays(
+                    codes, pyarrow.array(column.values, pyarrow.string())
+                )
+            )
+        elif isinstance(column, array):
+            arrays.append(pyarrow.array(_decoded(column), pyarrow.int64()))
+        else:
+            arrays.append(pyarrow.array(column, pyarrow.string()))
+    return pyarrow.Table.from_arrays(arrays, names=list(columns))
+
+
+def write_csv(columns, file_path):
+    """
+    Writes a table of columns as CSV with a header row of column names.
+
+    Note: Requires Python 3, since Python 2's csv module can't write unicode
+    text.
+    """
+    if version_info.major < 3:  # pragma: no cover
+        raise MapiException("exporting CSV files requires Python 3")
+    with io.open(file_path, "w", encoding="utf-8", newline="") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(list(columns))
+        for row in _rows(columns):
+            writer.writerow(["" if value is None else value for value in row])
+
+
+def write_json_lines(columns, file_path):
+    """Writes a table of columns as JSON Lines objects, omitting nulls."""
+    names = list(columns)
+    with io.open(file_path, "w", encoding="utf-8") as fp:
+        for row in _rows(columns):
+            entry = {
+                name: value
+                for name, value in zip(names, row)
+                if value is not None
+            }
+            fp.write(ustr(json.dumps(entry, ensure_ascii=False)) + u"\n")
+
+
+def write_parquet(columns, file_path):
+    """Writes a table of columns as Parquet; requires pyarrow."""
+    table = to_arrow(columns)
+    import pyarrow.parquet
+
+    pyarrow.parquet.write_table(table, file_path)
+
+
+def export(results, file_path, file_format=None, columns=COLUMNS):
+    """
+    Writes Metadata objects to file_path as 'csv', 'jsonl', or 'parquet',
+    inferred from its extension if file_format isn't given; returns the number
+    of results written.
+    """
+    writers = {
+        "csv": write_csv,
+        "json": write_json_lines,
+        "jsonl": write_json_lines,
+        "parquet": write_parquet,
+    }
+    file_format = file_format or file_path.rsplit(".", 1)[-1]
+    try:
+        writer = writers[file_format.lower()]
+    except KeyError:
+        msg = "Attempted to export to non-existing format"
+        log.error(msg)
+        raise MapiException(msg)
+    table = to_columns(results, columns)
+    writer(table, file_path)
+    return len(table[columns[0]]) if columns else 0
@@ -0,0 +1,222 @@
+# coding=utf-8
+
+"""In-process indexes of TVDb series episodes.
+
+A SeriesIndex is built from every page of mapi.endpoints.tvdb_series_id_episodes
+and answers season, episode, and air date (or air date prefix, i.e. year or
+year and month) lookups without further requests. Indexes are shared by every
+TVDb provider instance through get_index, which rebuilds them once they are
+older than the staleness window they are requested with.
+"""
+
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import partial
+from itertools import chain
+from time import time
+
+from mapi.compatibility import ustr
+from mapi.endpoints import tvdb_series_id, tvdb_series_id_episodes
+from mapi.exceptions import MapiNotFoundException
+from mapi.metadata import MetadataTelevision
+from mapi.utils import imap_ordered
+
+__all__ = ["DATE_INDEX_TTL", "get_index", "INDEX_MAX_SERIES", "SeriesIndex"]
+
+DATE_INDEX_TTL = 3600  # 1 hour; used for TVDb date searches by default
+INDEX_MAX_SERIES = 256
+
+_indexes = OrderedDict()  # (id_tvdb, lang): SeriesIndex, least recent first
+_indexes_lock = threading.Lock()
+_build_locks = {}  # (id_tvdb, lang): [lock, number of callers using it]
+
+
+class SeriesIndex(object):
+    """Episodes of a series keyed by (season, episode) and by air date.
+
+    Episodes are kept as compact tuples in the order TVDb lists them, and are
+    only converted into MetadataTelevision objects when looked up. Air dates
+    are kept sorted alongside their episodes' positions so that date prefixes
+    can be found by bisection.
+    """
+
+    def __init__(self, id_tvdb, series, entries, built=None):
+        self.id_tvdb = ustr(id_tvdb)
+        self.series = series
+        self.built = time() if built is None else built
+        self._episodes = []  # (season, episode, date, title, synopsis)
+        self._by_number = {}
+        by_date = []
+        for entry in entries:
+            try:
+                title = entry["episodeName"].split(";", 1)[0]
+            except AttributeError:
+                continue  # unnamed, e.g. unaired
+            synopsis = (
+                (entry["overview"] or "")
+                .replace("\r\n", "")
+                .replace("  ", "")
+                .strip()
+            )
+            season = entry["airedSeason"]
+            episode = entry["airedEpisodeNumber"]
+            date = entry["firstAired"]
+            position = len(self._episodes)
+            self._episodes.append((season, episode, date, title, synopsis))
+            self._by_number.setdefault((season, episode), position)
+            if date:
+                by_date.append((date, position))
+        by_date.sort()
+        self._dates = [date for date, _ in by_date]
+        self._date_positions = [position for _, position in by_date]
+
+    def __len__(self):
+        return len(self._episodes)
+
+    @classmethod
+    def fetch(
+        cls,
+        token,
+        id_tvdb,
+        lang="en",
+        cache=True,
+        concurrency=1,
+        retry=None,
+        limiter=None,
+    ):
+        """
+        Builds an index using every page of a series' episodes, fetched using
+        concurrency threads or a WorkerPool shared with the caller.
+        """
+        options = {"cache": cache, "retry": retry, "limiter": limiter}
+
+        def search_series():
+            return tvdb_series_id(token, id_tvdb, lang=lang, **options)
+
+        def search_page(page):
+            return tvdb_series_id_episodes(
+                token, id_tvdb, page=page, lang=lang, **options
+            )
+
+        series_data, episode_data = imap_ordered(
+            lambda call: call(),
+            (search_series, partial(search_page, 1)),
+            concurrency,
+        )
+        page_last = episode_data["links"]["last"]
+        pages = chain(
+            [episode_data],
+            imap_ordered(search_page, range(2, page_last + 1), concurrency),
+        )
+        entries = chain.from_iterable(page["data"] for page in pages)
+        return cls(id_tvdb, series_data["data"]["seriesName"], entries)
+
+    def is_stale(self, ttl):
+        """Determines whether the index was built more than ttl seconds ago."""
+        return time() - self.built > ttl
+
+    def search(self, season=None, episode=None):
+        """
+        Yields MetadataTelevision objects for episodes matching season and
+        episode, either of which may be None to match any; raises
+        MapiNotFoundException if none match.
+        """
+        season = None if season is None else int(season)
+        episode = None if episode is None else int(episode)
+        if season is not None and episode is not None:
+            position = self._by_number.get((season, episode))
+            positions = [] if position is None else [position]
+        else:
+            positions = (
+                i
+                for i, entry in enumerate(self._episodes)
+                if (season is None or entry[0] == season)
+                and (episode is None or entry[1] == episode)
+            )
+        return self._results(positions)
+
+    def on_date(self, date):
+        """
+        Yields MetadataTelevision objects for episodes which aired on date, a
+        YYYY-MM-DD formatted date or a prefix thereof, in the order TVDb lists
+        them; raises MapiNotFoundException if none did.
+        """
+        start = end = bisect_left(self._dates, date)
+        while end < len(self._dates) and self._dates[end].startswith(date):
+            end += 1
+        return self._results(sorted(self._date_positions[start:end]))
+
+    def _results(self, positions):
+        found = False
+        for position in positions:
+            season, episode, date, title, synopsis = self._episodes[position]
+            try:
+                yield MetadataTelevision.from_provider(
+                    series=self.series,
+                    season=ustr(season),
+                    episode=ustr(episode),
+                    date=date,
+                    title=title,
+                    synopsis=synopsis,
+                    media="television",
+                    id_tvdb=self.id_tvdb,
+                )
+                found = True
+            except ValueError:
+                continue  # invalid or missing air date
+        if not found:
+            raise MapiNotFoundException
+
+
+def get_index(
+    token,
+    id_tvdb,
+    ttl,
+    lang="en",
+    cache=True,
+    concurrency=1,
+    retry=None,
+    limiter=None,
+):
+    """
+    Returns the shared SeriesIndex for a series, building it if it is missing
+    or older than ttl seconds. Concurrent callers for the same series wait for
+    a single build.
+    """
+    key = ustr(id_tvdb), lang
+    with _indexes_lock:
+        index = _touch(key)
+        if index is not None and not index.is_stale(ttl):
+            return index
+        entry = _build_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            with _indexes_lock:
+                index = _touch(key)
+            if index is None or index.is_stale(ttl):
+                index = SeriesIndex.fetch(
+                    token, id_tvdb, lang, cache, concurrency, retry, limiter
+                )
+                with _indexes_lock:
+                    _indexes.pop(key, None)
+                    _indexes[key] = index
+                    while len(_indexes) > INDEX_MAX_SERIES:
+                        _indexes.popitem(last=False)
+    finally:
+        # removed by the last caller using it, whether or not its build failed
+        with _indexes_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _build_locks[key]
+    return index
+
+
+def _touch(key):
+    """Looks up an index, marking it most recently used; requires the lock."""
+    index = _indexes.get(key)
+    if index is not None:
+        _indexes.pop(key)
+        _indexes[key] = index
+    return index
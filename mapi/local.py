@@ -0,0 +1,430 @@
+# coding=utf-8
+
+"""Offline metadata database.
+
+LocalStore keeps movie and television metadata in an indexed SQLite database,
+which can be bulk populated from provider results or from JSON, JSON Lines, or
+CSV dumps whose fields are named like Metadata fields. LocalProvider searches
+a store using the same parameters as the remote providers, optionally falling
+back to one of them when the store can't answer a query completely and writing
+its results through to the store.
+"""
+
+import csv
+import io
+import json
+import sqlite3
+import threading
+from datetime import datetime as dt
+from os import environ, makedirs, path
+from sys import version_info
+
+from appdirs import user_data_dir
+
+from mapi import log
+from mapi.compatibility import ustr
+from mapi.exceptions import (
+    MapiException,
+    MapiNotFoundException,
+    MapiProviderException,
+)
+from mapi.metadata import MetadataMovie, MetadataTelevision
+from mapi.providers import Provider, provider_factory
+from mapi.utils import year_expand
+
+__all__ = ["LOCAL_PATH", "LocalProvider", "LocalStore"]
+
+LOCAL_PATH = path.join(user_data_dir("mapi"), "local.sqlite")
+FIELDS = (
+    "media",
+    "title",
+    "series",
+    "season",
+    "episode",
+    "date",
+    "year",
+    "synopsis",
+    "id_imdb",
+    "id_tmdb",
+    "id_tvdb",
+)
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS metadata ("
+    "key TEXT PRIMARY KEY, media TEXT NOT NULL, title TEXT COLLATE NOCASE, "
+    "series TEXT COLLATE NOCASE, season INTEGER, episode INTEGER, date TEXT, "
+    "year INTEGER, synopsis TEXT, id_imdb TEXT, id_tmdb TEXT, id_tvdb TEXT)",
+    "CREATE INDEX IF NOT EXISTS metadata_id_imdb ON metadata (id_imdb)",
+    "CREATE INDEX IF NOT EXISTS metadata_id_tmdb ON metadata (id_tmdb)",
+    "CREATE INDEX IF NOT EXISTS metadata_id_tvdb "
+    "ON metadata (id_tvdb, season, episode)",
+    "CREATE INDEX IF NOT EXISTS metadata_id_tvdb_date "
+    "ON metadata (id_tvdb, date)",
+    "CREATE INDEX IF NOT EXISTS metadata_title ON metadata (title, year)",
+    "CREATE INDEX IF NOT EXISTS metadata_series "
+    "ON metadata (series, season, episode)",
+    "CREATE TABLE IF NOT EXISTS queries (key TEXT PRIMARY KEY)",
+)
+
+_ID_FIELDS = {"omdb": "id_imdb", "tmdb": "id_tmdb", "tvdb": "id_tvdb"}
+_IDENTIFYING = {"id_imdb", "id_tmdb", "id_tvdb", "series", "title"}
+_PARAMETERS = {
+    "movie": ("id_imdb", "id_tmdb", "title", "year"),
+    "television": ("id_tvdb", "series", "season", "episode", "date"),
+}
+# parameters which match at most one entry when given together
+_UNIQUE = (
+    ("movie", {"id_imdb"}),
+    ("movie", {"id_tmdb"}),
+    ("television", {"id_tvdb", "season", "episode"}),
+)
+
+
+def _integer(value):
+    return int(value) if value not in (None, "") else None
+
+
+def _record(metadata):
+    """
+    Converts Metadata or a dict of its fields into a row of FIELDS; raises
+    ValueError if a field's value is invalid.
+    """
+    record = {
+        field: metadata.get(field) or None
+        for field in FIELDS
+        if field not in ("season", "episode", "year")
+    }
+    record["season"] = _integer(metadata.get("season"))
+    record["episode"] = _integer(metadata.get("episode"))
+    if record["date"]:
+        dt.strptime(record["date"], "%Y-%m-%d")  # just checks date format
+    year = metadata.get("year") or (record["date"] or "")[:4]
+    record["year"] = _integer(year)
+    if not record["media"]:
+        record["media"] = "television" if record["series"] else "movie"
+    elif record["media"] not in _PARAMETERS:
+        raise ValueError("invalid media '%s'" % record["media"])
+    for field in ("id_imdb", "id_tmdb", "id_tvdb"):
+        if record[field] is not None:
+            record[field] = ustr(record[field])
+    if record["media"] == "television":
+        if record["id_tvdb"]:
+            key = "tvdb:%(id_tvdb)s:%(season)s:%(episode)s" % record
+        else:
+            key = "series:%s:%s:%s" % (
+                (record["series"] or "").lower(),
+                record["season"],
+                record["episode"],
+            )
+    elif record["id_imdb"]:
+        key = "imdb:%(id_imdb)s" % record
+    elif record["id_tmdb"]:
+        key = "tmdb:%(id_tmdb)s" % record
+    else:
+        key = "title:%s:%s" % ((record["title"] or "").lower(), record["year"])
+    return [key] + [record[field] for field in FIELDS]
+
+
+def _metadata(row):
+    """Converts a validated row of FIELDS into a Metadata object."""
+    record = dict(zip(FIELDS, row))
+    del record["year"]  # derived from date
+    for field in ("season", "episode"):
+        if record[field] is not None:
+            record[field] = ustr(record[field])
+    if record.pop("media") == "television":
+        del record["id_tmdb"]
+        return MetadataTelevision.from_provider(**record)
+    for field in ("series", "season", "episode", "id_tvdb"):
+        del record[field]
+    return MetadataMovie.from_provider(**record)
+
+
+def _search_parameters(media, parameters):
+    """Filters out parameters which aren't searched for media."""
+    accepted = set(_PARAMETERS.get(media, FIELDS))
+    return {
+        k: v
+        for k, v in parameters.items()
+        if k in accepted and v not in (None, "")
+    }
+
+
+def _is_unique(media, parameters):
+    """Determines whether a query matches at most one entry."""
+    for unique_media, fields in _UNIQUE:
+        if media in (None, unique_media) and fields <= set(parameters):
+            return True
+    return False
+
+
+def _query_key(media, parameters):
+    """Creates a key for a normalized query of media by parameters."""
+    query = sorted((k, ustr(v).lower()) for k, v in parameters.items())
+    return json.dumps([media, query], separators=(",", ":"))
+
+
+def _wider_query_keys(media, parameters):
+    """
+    Creates keys for a query and the queries matching a superset of its
+    entries, i.e. those with a subset of its parameters, including ones not
+    restricted to media; queries without identifying parameters are omitted.
+    """
+    keys = []
+    items = sorted(parameters.items())
+    for mask in range(1, 2 ** len(items)):
+        subset = dict(item for i, item in enumerate(items) if mask & (1 << i))
+        if any(k in subset for k in _IDENTIFYING):
+            keys.append(_query_key(media, subset))
+            if media:
+                keys.append(_query_key(None, subset))
+    return keys
+
+
+class LocalStore(object):
+    """SQLite metadata database, safe to share between threads."""
+
+    def __init__(self, store_path=None, timeout=30):
+        self.path = store_path or environ.get("MAPI_LOCAL_PATH", LOCAL_PATH)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __len__(self):
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM metadata"
+        ).fetchone()[0]
+
+    @property
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = path.dirname(self.path)
+            if directory and not path.isdir(directory):
+                try:
+                    makedirs(directory)
+                except OSError:  # pragma: no cover
+                    pass  # created concurrently
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.commit()
+            self._local.connection = connection
+        return connection
+
+    def add(self, metadata_iterable):
+        """
+        Adds or replaces Metadata objects (or dicts of their fields) within a
+        single transaction; returns the number of entries added.
+
+        Note: Entries are validated before any are added, raising
+        MapiException if any has an invalid date, number, or media.
+        """
+        rows = []
+        for i, metadata in enumerate(metadata_iterable):
+            try:
+                rows.append(_record(metadata))
+            except (TypeError, ValueError) as e:
+                msg = "Attempted to add invalid entry %d: %s" % (i + 1, e)
+                log.error(msg)
+                raise MapiException(msg)
+        with self._connection as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO metadata VALUES (%s)"
+                % ", ".join("?" * (len(FIELDS) + 1)),
+                rows,
+            )
+        return len(rows)
+
+    def clear(self):
+        """Removes all entries and completed queries."""
+        with self._connection as connection:
+            connection.execute("DELETE FROM metadata")
+            connection.execute("DELETE FROM queries")
+
+    def complete(self, media=None, **parameters):
+        """
+        Records that the store holds every entry matching a query, e.g. once a
+        remote provider's results for it have been added.
+        """
+        with self._connection as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO queries VALUES (?)",
+                (_query_key(media, _search_parameters(media, parameters)),),
+            )
+
+    def is_complete(self, media=None, **parameters):
+        """
+        Determines whether the store holds every entry matching a query, i.e.
+        if it or a wider query (one with a subset of its parameters) was
+        recorded using complete.
+        """
+        keys = _wider_query_keys(media, _search_parameters(media, parameters))
+        if not keys:
+            return False
+        row = self._connection.execute(
+            "SELECT 1 FROM queries WHERE key IN (%s) LIMIT 1"
+            % ", ".join("?" * len(keys)),
+            keys,
+        ).fetchone()
+        return row is not None
+
+    def import_csv(self, file_path):
+        """
+        Adds entries from a CSV file with a header row of field names.
+
+        Note: Requires Python 3, since Python 2's csv module can't read
+        unicode text.
+        """
+        if version_info.major < 3:  # pragma: no cover
+            raise MapiException("importing CSV files requires Python 3")
+        with io.open(file_path, "r", encoding="utf-8", newline="") as fp:
+            return self.add(csv.DictReader(fp))
+
+    def import_json(self, file_path):
+        """Adds entries from a JSON array or JSON Lines file of objects."""
+        with io.open(file_path, "r", encoding="utf-8") as fp:
+            content = fp.read()
+        try:
+            entries = json.loads(content)
+        except ValueError:
+            entries = [json.loads(l) for l in content.splitlines() if l.strip()]
+        return self.add(entries)
+
+    def search(self, media=None, **parameters):
+        """
+        Yields Metadata objects matching the search parameters accepted by the
+        remote providers for media, or any media if None. Titles and series are
+        matched case-insensitively by prefix and dates may be given partially,
+        i.e. as YYYY-MM or YYYY.
+        """
+        parameters = _search_parameters(media, parameters)
+        if not any(k in parameters for k in _IDENTIFYING):
+            return
+        clauses, values = [], []
+
+        def where(clause, *clause_values):
+            clauses.append(clause)
+            values.extend(clause_values)
+
+        if media:
+            where("media = ?", media)
+        for field in ("id_imdb", "id_tmdb", "id_tvdb"):
+            if field in parameters:
+                where("%s = ?" % field, ustr(parameters[field]))
+        for field in ("title", "series"):
+            if field in parameters:
+                prefix = parameters[field]
+                where(
+                    "%s >= ? AND %s < ?" % (field, field),
+                    prefix,
+                    prefix + u"\uffff",
+                )
+        for field in ("season", "episode"):
+            if field in parameters:
+                where("%s = ?" % field, int(parameters[field]))
+        if "year" in parameters:
+            where("year BETWEEN ? AND ?", *year_expand(parameters["year"]))
+        if "date" in parameters:
+            date = parameters["date"]
+            where("date >= ? AND date < ?", date, date + "~")
+        rows = self._connection.execute(
+            "SELECT %s FROM metadata WHERE %s "
+            "ORDER BY media, series, season, episode, rowid"
+            % (", ".join(FIELDS), " AND ".join(clauses)),
+            values,
+        )
+        for row in rows:
+            yield _metadata(row)
+
+
+class LocalProvider(Provider):
+    """Searches a LocalStore, falling back to a remote provider on misses.
+
+    The 'store' option takes a LocalStore or the path to its database, and
+    'provider' the name (initialized using the same options) or instance of
+    the remote provider to fall back to, if any, which also restricts the media
+    searched for; other options, e.g. 'pool_maxsize', are passed along to it.
+    Results from the remote provider are added to the store unless
+    'write_through' is False, and once all of them have been added the query is
+    recorded as complete. With a remote provider, the store only
+    answers queries it is complete for (see LocalStore.is_complete) or which
+    match a single entry it holds, e.g. an IMDb or TMDb id, or a TVDb id with
+    a season and episode.
+    """
+
+    def __init__(self, **options):
+        # connection pool options only apply to the remote provider's host
+        super(LocalProvider, self).__init__(
+            **{
+                k: v
+                for k, v in options.items()
+                if k not in ("pool_maxsize", "pool_block")
+            }
+        )
+        store = options.get("store")
+        self._store = (
+            store if isinstance(store, LocalStore) else LocalStore(store)
+        )
+        provider = options.get("provider")
+        if isinstance(provider, (str, ustr)):
+            provider_options = {
+                k: v
+                for k, v in options.items()
+                if k not in ("provider", "store", "write_through")
+            }
+            provider = provider_factory(provider, **provider_options)
+        self._provider = provider
+        self._write_through = options.get("write_through", True)
+        name = provider.__class__.__name__.lower() if provider else None
+        self._id_field = _ID_FIELDS.get(name)
+        if name == "tvdb":
+            self._media = "television"
+        elif name:
+            self._media = "movie"
+        else:
+            self._media = None
+
+    def search(self, id_key=None, **parameters):
+        """
+        Searches the store, then the remote provider if the store's results
+        may be incomplete.
+        """
+        if id_key:
+            if not self._id_field:
+                raise MapiProviderException("id_key requires a remote provider")
+            parameters[self._id_field] = id_key
+        store = self._store
+        if not self._provider or store.is_complete(self._media, **parameters):
+            found = False
+            for result in store.search(self._media, **parameters):
+                found = True
+                yield result
+            if not found:
+                raise MapiNotFoundException
+            return
+        searched = _search_parameters(self._media, parameters)
+        if _is_unique(self._media, searched):
+            results = list(store.search(self._media, **parameters))
+            if results:
+                yield results[0]
+                return
+        results = []
+        exhausted = False
+        try:
+            for result in self._provider.search(**parameters):
+                results.append(result)
+                yield result
+            exhausted = True
+        finally:
+            if results and self._write_through:
+                store.add(results)
+                if exhausted:
+                    store.complete(self._media, **parameters)
+
+    @property
+    def provider(self):
+        return self._provider
+
+    @property
+    def store(self):
+        return self._store
@@ -4,17 +4,207 @@
 
 import re
 from datetime import datetime as dt
-from string import Formatter, capwords
+from string import capwords
+from threading import Lock
 
 from mapi.compatibility import MutableMapping, ustr
 from mapi.utils import year_parse
 
-__all__ = ["Metadata", "MetadataMovie", "MetadataTelevision"]
+__all__ = ["Metadata", "MetadataMovie", "MetadataTelevision", "format_many"]
+
+FORMAT_PLANS_MAX = 256
+TITLE_CASES_MAX = 4096
+
+# Words cased as such when separated from others by padding characters
+LOWERCASE_EXCEPTIONS = frozenset(
+    {
+        "a",
+        "an",
+        "and",
+        "as",
+        "at",
+        "but",
+        "by",
+        "ces",
+        "de",
+        "des",
+        "du",
+        "for",
+        "from",
+        "in",
+        "is",
+        "la",
+        "le",
+        "nor",
+        "of",
+        "on",
+        "or",
+        "the",
+        "to",
+        "un",
+        "une",
+        "with",
+        "via",
+        "h264",
+        "h265",
+    }
+)
+UPPERCASE_EXCEPTIONS = frozenset(
+    {
+        "i",
+        "ii",
+        "iii",
+        "iv",
+        "v",
+        "vi",
+        "vii",
+        "viii",
+        "ix",
+        "x",
+        "2d",
+        "3d",
+        "au",
+        "aka",
+        "atm",
+        "bbc",
+        "bff",
+        "cia",
+        "csi",
+        "dc",
+        "doa",
+        "espn",
+        "fbi",
+        "ira",
+        "jfk",
+        "la",
+        "lol",
+        "mlb",
+        "mlk",
+        "mtv",
+        "nba",
+        "nfl",
+        "nhl",
+        "nsfw",
+        "nyc",
+        "omg",
+        "pga",
+        "oj",
+        "rsvp",
+        "tnt",
+        "tv",
+        "ufc",
+        "ufo",
+        "uk",
+        "usa",
+        "vip",
+        "wtf",
+        "wwe",
+        "wwi",
+        "wwii",
+        "xxx",
+        "yolo",
+    }
+)
+
+_format_plans = {}  # format spec: plan
+_format_plans_lock = Lock()
+_title_cases = {}  # string: title cased string
+_title_cases_lock = Lock()
+_title_punctuation = frozenset("[\"!?$'(),-./:;<>@[]_`{}]")
+_re_dash_ends = re.compile(r"-\s*$|^\s*-")
+_re_dashes = re.compile(r"-\s*-")
+_re_field = re.compile(r"{(\w+)(?:\:(\d{1,2}))?}")
+_re_initialism = re.compile(r"(\w\.)+")
+_re_title_head = re.compile(r"[^\[\"!?$'(),\-./:;<>@\]_`{}]*")
+_re_title_word = re.compile(r"[^.\- ]+")
+_re_whitespace = re.compile(r"\s+")
+
+
+def _check_date(date):
+    """Cheaply checks that date is a valid YYYY-MM-DD date string."""
+    if len(date) != 10 or date[4] != "-" or date[7] != "-":
+        raise ValueError("invalid date '%s'" % date)
+    dt(int(date[:4]), int(date[5:7]), int(date[8:]))  # checks ranges
+
+
+def _format_plan(format_spec):
+    """
+    Parses a format spec into a tuple of literal strings and (key, format
+    spec) field tuples, cached per format spec.
+    """
+    plan = _format_plans.get(format_spec)
+    if plan is None:
+        plan = []
+        position = 0
+        for match in _re_field.finditer(format_spec):
+            if match.start() > position:
+                plan.append(format_spec[position : match.start()])
+            plan.append((match.group(1), match.group(2) or ""))
+            position = match.end()
+        if position < len(format_spec):
+            plan.append(format_spec[position:])
+        plan = tuple(plan)
+        with _format_plans_lock:
+            if len(_format_plans) >= FORMAT_PLANS_MAX:
+                _format_plans.clear()
+            _format_plans[format_spec] = plan
+    return plan
+
+
+def format_many(metadata_iterable, format_spec=None):
+    """
+    Formats each of metadata_iterable using format_spec, or each of their
+    default format if None, parsing it only once; returns a list of strings.
+    """
+    plan = _format_plan(format_spec) if format_spec else None
+    return [
+        metadata._render(plan or _format_plan(metadata._format_default))
+        for metadata in metadata_iterable
+    ]
 
 
-class Metadata(MutableMapping):
-    """Base Metadata class.
+def _title_case(s):
     """
+    Capitalizes each word of s, then cases exception words in a single pass.
+
+    Words are runs of characters between padding characters. Those whose
+    leading characters, up to any punctuation, are an uppercase exception are
+    uppercased, e.g. 'TV's'. Otherwise those which are a lowercase exception
+    are lowercased unless they are the first word or follow punctuation, e.g.
+    'Star Wars: A New Hope'. Finally, initialisms are uppercased.
+    """
+    s = capwords(s)
+    parts = []
+    position = 0
+    for match in _re_title_word.finditer(s):
+        start = match.start()
+        word = match.group().lower()
+        head = _re_title_head.match(word).group()
+        if head in UPPERCASE_EXCEPTIONS:
+            cased = head.upper()
+        elif (
+            word in LOWERCASE_EXCEPTIONS
+            and start > 1
+            and s[start - 2] not in _title_punctuation
+        ):
+            cased = word
+        else:
+            continue
+        parts.append(s[position:start])
+        parts.append(cased)
+        position = start + len(cased)
+    if parts:
+        parts.append(s[position:])
+        s = "".join(parts)
+    return _re_initialism.sub(_upper_match, s)
+
+
+def _upper_match(match):
+    return match.group(0).upper()
+
+
+class Metadata(MutableMapping):
+    """Base Metadata class."""
 
     fields_default = {
         "date",
@@ -30,37 +220,100 @@ class Metadata(MutableMapping):
     fields_numeric = {"season", "episode", "year"}
     fields_accepted = fields_default | fields_extra
 
+    # Instances store their values in a list ordered by _fields, rather than in
+    # a dict per instance; see _field_positions
+    _fields = ()
+    _positions = None
+    _media = None  # fixed media value of subclasses
+
     _fallback_str = "[unset metadata]"
-    _formatter = type(
-        "MetaFormatter",
-        (Formatter,),
-        {"format_field": lambda _, v, f: format(v, f) if v else ""},
-    )()
+    _format_default = "{title}"
+
+    # Only avoids a __dict__ per instance on Python 3, since Python 2's
+    # MutableMapping and its bases don't define __slots__
+    __slots__ = ("_values",)
 
     def __init__(self, **params):
-        self._dict = {k: None for k in self.fields_accepted}
+        self._values = [None] * len(self._field_positions())
         self.update(params)
+        if self._media:
+            self._values[self._positions["media"]] = self._media
+
+    @classmethod
+    def from_provider(cls, **params):
+        """
+        Creates an instance from trusted provider data, i.e. lowercase keys
+        known to be accepted and values which need no normalizing; much
+        faster than the validating constructor.
+
+        Note: dates are still checked to be valid YYYY-MM-DD dates, raising
+        ValueError otherwise, as providers use this to skip unaired episodes
+        and unreleased movies.
+        """
+        positions = cls._field_positions()
+        values = [None] * len(positions)
+        for key, value in params.items():
+            if value or value == 0:
+                values[positions[key]] = value
+        date = params.get("date")
+        if date is not None:
+            _check_date(date)
+        if cls._media:
+            values[positions["media"]] = cls._media
+        meta = cls.__new__(cls)
+        meta._values = values
+        return meta
+
+    @classmethod
+    def _field_positions(cls):
+        """
+        Returns a dict mapping each of the class's accepted fields to its
+        position within instances' value lists, built once per class.
+        """
+        positions = cls.__dict__.get("_positions")
+        if positions is None:
+            fields = tuple(sorted(cls.fields_accepted))
+            positions = {field: i for i, field in enumerate(fields)}
+            cls._fields = fields
+            cls._positions = positions
+        return positions
+
+    def raw_values(self, fields):
+        """
+        Returns a list of fields' values as stored, i.e. without the
+        normalizing done by item access, using None for those which are unset
+        or not accepted; e.g. for converting many instances at once.
+        """
+        positions = self._field_positions()
+        values = self._values
+        return [
+            None if positions.get(field) is None else values[positions[field]]
+            for field in fields
+        ]
+
+    def _items(self):
+        """Yields set (key, value) pairs in field order."""
+        for key, value in zip(self._fields, self._values):
+            if value:
+                yield key, value
 
     def __delitem__(self, key):
         self[key] = None
 
     def __format__(self, format_spec):
-        format_spec = format_spec or "{title}"
-        re_pattern = r"({(\w+)(?:\:\d{1,2})?})"
-        s = re.sub(re_pattern, self._format_repl, format_spec)
-        s = self._str_fix_whitespace(s)
-        return s
+        return self._render(_format_plan(format_spec or self._format_default))
 
     def __iter__(self):
-        return {k: v for k, v in self._dict.items() if v}.__iter__()
+        return (key for key, _ in self._items())
 
     def __getitem__(self, key):
         # Case insensitive keys
         key = key.lower()
-        value = self._dict.get(key)
+        position = self._positions.get(key)
+        value = None if position is None else self._values[position]
         # Special case for year
-        if key == "year" and not self._dict.get("year"):
-            date = self._dict.get("date")
+        if key == "year" and not value:
+            date = self._values[self._positions["date"]]
             value = year_parse(date)
         # Numeric keys
         elif key in self.fields_numeric and value != 0:
@@ -71,13 +324,13 @@ class Metadata(MutableMapping):
         return value
 
     def __hash__(self):
-        return frozenset(self._dict.items()).__hash__()
+        return frozenset(zip(self._fields, self._values)).__hash__()
 
     def __len__(self):
-        return {k: v for k, v in self._dict.items() if v}.__len__()
+        return sum(1 for value in self._values if value)
 
     def __repr__(self):
-        return {k: v for k, v in self._dict.items() if v}.__repr__()
+        return repr(dict(self._items()))
 
     def __setitem__(self, key, value):
         # Validate key
@@ -104,190 +357,72 @@ class Metadata(MutableMapping):
             value = None
 
         # Looks good if its gotten this far, store it!
-        self._dict[key] = value
+        self._values[self._positions[key]] = value
 
     def __str__(self):
         return self.get("title") or self._fallback_str
 
-    def _format_repl(self, mobj):
-        format_string, key = mobj.groups()
-        value = self._formatter.vformat(format_string, None, self)
-        if key not in self.fields_extra:
-            value = self._str_title_case(value)
-        return value
+    def _render(self, plan):
+        """Renders a plan returned by _format_plan."""
+        parts = []
+        for part in plan:
+            if isinstance(part, tuple):
+                key, format_spec = part
+                value = self[key]
+                value = format(value, format_spec) if value else ""
+                if value and key not in self.fields_extra:
+                    value = self._str_title_case(value)
+                part = value
+            parts.append(part)
+        return self._str_fix_whitespace("".join(parts))
 
     @staticmethod
     def _str_fix_whitespace(s):
         # Concatenate dashes
-        s = re.sub(r"-\s*-", "-", s)
+        s = _re_dashes.sub("-", s)
         # Remove empty brackets
         s = s.replace("()", "")
         s = s.replace("[]", "")
         # Strip leading/ trailing dashes
-        s = re.sub(r"-\s*$|^\s*-", "", s)
+        s = _re_dash_ends.sub("", s)
         # Concatenate whitespace
-        s = re.sub(r"\s+", " ", s)
+        s = _re_whitespace.sub(" ", s)
         # Strip leading/ trailing whitespace
         s = s.strip()
         return s
 
     @staticmethod
     def _str_title_case(s):
-        lowercase_exceptions = {
-            "a",
-            "an",
-            "and",
-            "as",
-            "at",
-            "but",
-            "by",
-            "ces",
-            "de",
-            "des",
-            "du",
-            "for",
-            "from",
-            "in",
-            "is",
-            "la",
-            "le",
-            "nor",
-            "of",
-            "on",
-            "or",
-            "the",
-            "to",
-            "un",
-            "une",
-            "with",
-            "via",
-            "h264",
-            "h265",
-        }
-        uppercase_exceptions = {
-            "i",
-            "ii",
-            "iii",
-            "iv",
-            "v",
-            "vi",
-            "vii",
-            "viii",
-            "ix",
-            "x",
-            "2d",
-            "3d",
-            "au",
-            "aka",
-            "atm",
-            "bbc",
-            "bff",
-            "cia",
-            "csi",
-            "dc",
-            "doa",
-            "espn",
-            "fbi",
-            "ira",
-            "jfk",
-            "la",
-            "lol",
-            "mlb",
-            "mlk",
-            "mtv",
-            "nba",
-            "nfl",
-            "nhl",
-            "nsfw",
-            "nyc",
-            "omg",
-            "pga",
-            "oj",
-            "rsvp",
-            "tnt",
-            "tv",
-            "ufc",
-            "ufo",
-            "uk",
-            "usa",
-            "vip",
-            "wtf",
-            "wwe",
-            "wwi",
-            "wwii",
-            "xxx",
-            "yolo",
-        }
-        padding_chars = ".- "
-        punctuation_chars = "[\"!?$'(),-./:;<>@[]_`{}]"
-        string_lower = s.lower()
-        string_length = len(s)
-        s = capwords(s)
-
-        # process lowercase transformations
-        for exception in lowercase_exceptions:
-            pos = string_lower.find(exception)
-            if pos == -1:
-                continue
-            starts = pos < 2
-            if starts:
-                continue
-            prev_char = string_lower[pos - 1]
-            leading_char = string_lower[pos - 2]
-            left_partitioned = (
-                prev_char in padding_chars
-                and leading_char not in punctuation_chars
-            )
-            word_length = len(exception)
-            ends = pos + word_length == string_length
-            next_char = "" if ends else string_lower[pos + word_length]
-            right_partitioned = ends or next_char in padding_chars
-            if left_partitioned and right_partitioned:
-                s = s[:pos] + exception.lower() + s[pos + word_length :]
-
-        # process uppercase transformations
-        for exception in uppercase_exceptions:
-            pos = string_lower.find(exception)
-            if pos == -1:
-                continue
-            starts = pos == 0
-            prev_char = None if starts else string_lower[pos - 1]
-            left_partitioned = starts or prev_char in padding_chars
-            word_length = len(exception)
-            ends = pos + word_length == string_length
-            next_char = "" if ends else string_lower[pos + word_length]
-            right_partitioned = (
-                ends or next_char in padding_chars + punctuation_chars
-            )
-            if left_partitioned and right_partitioned:
-                s = s[:pos] + exception.upper() + s[pos + word_length :]
-        s = re.sub(r"(\w\.)+", lambda p: p.group(0).upper(), s)
-        return s
+        cased = _title_cases.get(s)
+        if cased is None:
+            cased = _title_case(s)
+            with _title_cases_lock:
+                if len(_title_cases) >= TITLE_CASES_MAX:
+                    _title_cases.clear()
+                _title_cases[s] = cased
+        return cased
 
 
 class MetadataMovie(Metadata):
-    """Movie Metadata class.
-    """
-
-    fields_accepted = Metadata.fields_accepted | {"id_imdb", "id_tmdb"}
+    """Movie Metadata class."""
 
-    def __init__(self, **params):
-        super(MetadataMovie, self).__init__(**params)
-        self._dict["media"] = "movie"
+    __slots__ = ()
 
-    def __format__(self, format_spec):
-        return super(MetadataMovie, self).__format__(
-            format_spec or "{title} ({year})"
-        )
+    _media = "movie"
+    _format_default = "{title} ({year})"
+    fields_accepted = Metadata.fields_accepted | {"id_imdb", "id_tmdb"}
 
     def __str__(self):
         return self.__format__(None)
 
 
 class MetadataTelevision(Metadata):
-    """Television Metadata class.
-    """
+    """Television Metadata class."""
+
+    __slots__ = ()
 
+    _media = "television"
+    _format_default = "{series} - {season:02}x{episode:02} - {title}"
     fields_accepted = Metadata.fields_accepted | {
         "episode",
         "id_imdb",
@@ -296,14 +431,5 @@ class MetadataTelevision(Metadata):
         "series",
     }
 
-    def __init__(self, **params):
-        super(MetadataTelevision, self).__init__(**params)
-        self._dict["media"] = "television"
-
-    def __format__(self, format_spec):
-        return super(MetadataTelevision, self).__format__(
-            format_spec or "{series} - {season:02}x{episode:02} - {title}"
-        )
-
     def __str__(self):
         return self.__format__(None)
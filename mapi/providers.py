@@ -4,10 +4,15 @@
 
 import re
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime as dt
+from functools import partial
+from itertools import chain
 from os import environ
 
 from mapi import log
+from mapi.auth import get_token_manager
+from mapi.cache import get_backend
 from mapi.compatibility import AbstractClass, ustr
 from mapi.endpoints import *
 from mapi.exceptions import (
@@ -15,8 +20,16 @@ from mapi.exceptions import (
     MapiNotFoundException,
     MapiProviderException,
 )
+from mapi.index import DATE_INDEX_TTL, get_index
 from mapi.metadata import *
-from mapi.utils import year_expand
+from mapi.ratelimit import get_limiter
+from mapi.utils import (
+    MAX_CONNECTIONS,
+    WorkerPool,
+    d2l,
+    mount_adapter,
+    year_expand,
+)
 
 __all__ = [
     "API_ALL",
@@ -35,8 +48,9 @@ API_ALL = API_TELEVISION | API_MOVIE
 
 
 class Provider(AbstractClass):
-    """ABC for Providers, high-level interfaces for metadata media providers.
-    """
+    """ABC for Providers, high-level interfaces for metadata media providers."""
+
+    host = None
 
     def __init__(self, **options):
         """Initializes the provider."""
@@ -45,11 +59,71 @@ class Provider(AbstractClass):
             "api_key", environ.get("API_KEY_%s" % cls_name.upper())
         )
         self._cache = options.get("cache", True)
+        if isinstance(self._cache, (str, ustr)):
+            self._cache = get_backend(self._cache)
+        self._concurrency = max(int(options.get("concurrency", 1)), 1)
+        # shared by nested concurrent calls, e.g. pages of each candidate
+        self._pool = WorkerPool(self._concurrency)
+        if self.host and ("pool_maxsize" in options or "pool_block" in options):
+            mount_adapter(
+                self.host,
+                pool_maxsize=options.get("pool_maxsize", MAX_CONNECTIONS),
+                pool_block=options.get("pool_block", False),
+            )
+        self._retry = options.get("retry")
+        self._limiter = None  # default limits; False disables rate limiting
+        if "rate_limit" in options:
+            limit = options["rate_limit"]
+            if limit:
+                self._limiter = get_limiter(
+                    cls_name.lower(), self._api_key, limit
+                )
+            else:
+                self._limiter = False
 
     @abstractmethod
     def search(self, id_key=None, **parameters):
         pass
 
+    def search_many(self, queries, concurrency=None, ordered=False):
+        """Searches for many queries at once using a shared thread pool.
+
+        Each query is a dict of search parameters; identical queries are only
+        searched once. Yields a (query, results) tuple for each unique query
+        where results is either a list of Metadata objects or the exception
+        raised by the search. Tuples are yielded as searches complete unless
+        ordered is set, in which case they follow the order of queries.
+
+        Note: searches' own concurrent requests share the provider's pool, so
+        at most concurrency plus the provider's concurrency threads are used.
+        """
+        unique_queries = []
+        seen = set()
+        for query in queries:
+            key = tuple(d2l(query))
+            if key not in seen:
+                seen.add(key)
+                unique_queries.append(query)
+
+        def search_all(query):
+            try:
+                return list(self.search(**query))
+            except Exception as e:
+                return e
+
+        executor = ThreadPoolExecutor(
+            max_workers=concurrency or self.concurrency
+        )
+        futures = [executor.submit(search_all, q) for q in unique_queries]
+        executor.shutdown(wait=False)
+        query_map = dict(zip(futures, unique_queries))
+        try:
+            for future in futures if ordered else as_completed(futures):
+                yield query_map[future], future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
     @property
     def api_key(self):
         return self._api_key
@@ -58,6 +132,27 @@ class Provider(AbstractClass):
     def cache(self):
         return self._cache
 
+    @property
+    def retry(self):
+        return self._retry
+
+    @property
+    def limiter(self):
+        return self._limiter
+
+    @property
+    def _request_options(self):
+        """Keyword arguments passed along to endpoint functions."""
+        return {
+            "cache": self._cache,
+            "retry": self._retry,
+            "limiter": self._limiter,
+        }
+
+    @property
+    def concurrency(self):
+        return self._concurrency
+
 
 def has_provider(provider):
     """Verifies that module has support for requested API provider."""
@@ -84,8 +179,9 @@ def provider_factory(provider, **options):
 
 
 class OMDb(Provider):
-    """Queries the OMDb API.
-    """
+    """Queries the OMDb API."""
+
+    host = "http://www.omdbapi.com"
 
     def __init__(self, **options):
         super(OMDb, self).__init__(**options)
@@ -107,7 +203,10 @@ class OMDb(Provider):
             yield result
 
     def _lookup_movie(self, id_imdb):
-        response = omdb_title(self.api_key, id_imdb, cache=self._cache)
+        yield self._movie(id_imdb)
+
+    def _movie(self, id_imdb):
+        response = omdb_title(self.api_key, id_imdb, **self._request_options)
         try:
             date = dt.strptime(response["Released"], "%d %b %Y").strftime(
                 "%Y-%m-%d"
@@ -117,7 +216,7 @@ class OMDb(Provider):
                 date = None
             else:
                 date = "%s-01-01" % response["Year"]
-        meta = MetadataMovie(
+        meta = MetadataMovie.from_provider(
             title=response["Title"],
             date=date,
             synopsis=response["Plot"],
@@ -125,39 +224,55 @@ class OMDb(Provider):
         )
         if meta["synopsis"] == "N/A":
             del meta["synopsis"]
-        yield meta
+        return meta
 
     def _search_movie(self, title, year):
         year_from, year_to = year_expand(year)
         found = False
-        page = 1
-        page_max = 10  # each page yields a maximum of 10 results
-        while True:
+        page_size = 10
+        page_max = 10
+
+        def search_page(page):
             try:
-                response = omdb_search(
+                return omdb_search(
                     api_key=self.api_key,
                     media_type="movie",
                     query=title,
                     page=page,
-                    cache=self.cache,
+                    **self._request_options
                 )
             except MapiNotFoundException:
+                return None
+
+        response = search_page(1)
+        if response:
+            page_count = -(-int(response["totalResults"]) // page_size)
+            page_last = min(page_count, page_max)
+        else:
+            page_last = 1
+        responses = chain(
+            [response],
+            self._pool.imap_ordered(search_page, range(2, page_last + 1)),
+        )
+        for response in responses:
+            if not response:
                 break
-            for entry in response["Search"]:
-                if year_from <= int(entry["Year"]) <= year_to:
-                    for result in self._lookup_movie(entry["imdbID"]):
-                        yield result
-                    found = True
-            if page >= page_max:
-                break
-            page += 1
+            ids = [
+                entry["imdbID"]
+                for entry in response["Search"]
+                if year_from <= int(entry["Year"]) <= year_to
+            ]
+            for meta in self._pool.imap_ordered(self._movie, ids):
+                yield meta
+                found = True
         if not found:
             raise MapiNotFoundException
 
 
 class TMDb(Provider):
-    """Queries the TMDb API.
-    """
+    """Queries the TMDb API."""
+
+    host = "https://api.themoviedb.org"
 
     def __init__(self, **options):
         super(TMDb, self).__init__(**options)
@@ -184,9 +299,9 @@ class TMDb(Provider):
 
     def _search_id_imdb(self, id_imdb):
         response = tmdb_find(
-            self.api_key, "imdb_id", id_imdb, cache=self.cache
+            self.api_key, "imdb_id", id_imdb, **self._request_options
         )["movie_results"][0]
-        yield MetadataMovie(
+        yield MetadataMovie.from_provider(
             title=response["title"],
             date=response["release_date"],
             synopsis=response["overview"],
@@ -196,8 +311,8 @@ class TMDb(Provider):
 
     def _search_id_tmdb(self, id_tmdb):
         assert id_tmdb
-        response = tmdb_movies(self.api_key, id_tmdb, cache=self.cache)
-        yield MetadataMovie(
+        response = tmdb_movies(self.api_key, id_tmdb, **self._request_options)
+        yield MetadataMovie.from_provider(
             title=response["title"],
             date=response["release_date"],
             synopsis=response["overview"],
@@ -209,16 +324,23 @@ class TMDb(Provider):
         assert title
         found = False
         year_from, year_to = year_expand(year)
-        page = 1
         page_max = 5  # each page yields a maximum of 20 results
 
-        while True:
-            response = tmdb_search_movies(
-                self.api_key, title, year, page=page, cache=self.cache
+        def search_page(page):
+            return tmdb_search_movies(
+                self.api_key, title, year, page=page, **self._request_options
             )
+
+        response = search_page(1)
+        page_last = min(response["total_pages"], page_max)
+        responses = chain(
+            [response],
+            self._pool.imap_ordered(search_page, range(2, page_last + 1)),
+        )
+        for response in responses:
             for entry in response["results"]:
                 try:
-                    meta = MetadataMovie(
+                    meta = MetadataMovie.from_provider(
                         title=entry["title"],
                         date=entry["release_date"],
                         synopsis=entry["overview"],
@@ -229,33 +351,60 @@ class TMDb(Provider):
                 if year_from <= int(meta["year"]) <= year_to:
                     yield meta
                     found = True
-            if page == response["total_pages"]:
-                break
-            elif page >= page_max:
-                break
-            page += 1
         if not found:
             raise MapiNotFoundException
 
 
 class TVDb(Provider):
-    """Queries the TVDb API.
-    """
+    """Queries the TVDb API."""
+
+    host = "https://api.thetvdb.com"
 
     def __init__(self, **options):
         super(TVDb, self).__init__(**options)
         if not self.api_key:
             raise MapiProviderException("TVDb requires an API key")
-        self.token = "" if self.cache else self._login()
+        self._early_exit = options.get("early_exit", False)
+        self._index_ttl = options.get("index_ttl", 0)
+        self._tokens = get_token_manager(self.api_key)
+        if not self.cache and not options.get("defer_login", False):
+            self._tokens.get()
+
+    @property
+    def token(self):
+        """The current token; empty if logging in has been deferred.
 
-    def _login(self):
-        return tvdb_login(self.api_key)
+        Note: When caching, logging in is deferred until a request misses the
+        cache, since cached responses can be retrieved without a token.
+        """
+        if not self.cache or self._tokens.peek():
+            return self._tokens.get()
+        return ""
 
     def search(self, id_key=None, **parameters):
         """Searches TVDb for movie metadata.
 
         TODO: Consider making parameters for episode ids
         """
+        token = self.token
+        try:
+            for result in self._search(id_key, **parameters):
+                yield result
+        except MapiProviderException as e:
+            if not token:
+                log.info(
+                    "Result not cached; logging in and reattempting search"
+                )
+            elif ustr(e) == "invalid token":
+                log.info("Token rejected; logging in and reattempting search")
+                self._tokens.invalidate(token)
+            else:
+                raise
+            self._tokens.get()
+            for result in self._search(id_key, **parameters):
+                yield result
+
+    def _search(self, id_key=None, **parameters):
         episode = parameters.get("episode")
         id_tvdb = id_key or parameters.get("id_tvdb")
         id_imdb = parameters.get("id_imdb")
@@ -264,60 +413,71 @@ class TVDb(Provider):
         date = parameters.get("date")
         date_fmt = r"(19|20)\d{2}(-(?:0[1-9]|1[012])(-(?:[012][1-9]|3[01]))?)?"
 
-        try:
-            if id_tvdb and date:
-                results = self._search_tvdb_date(id_tvdb, date)
-            elif id_tvdb:
-                results = self._search_id_tvdb(id_tvdb, season, episode)
-            elif id_imdb:
-                results = self._search_id_imdb(id_imdb, season, episode)
-            elif series and date:
-                if not re.match(date_fmt, date):
-                    raise MapiProviderException(
-                        "Date format must be YYYY-MM-DD"
-                    )
-                results = self._search_series_date(series, date)
-            elif series:
-                results = self._search_series(series, season, episode)
-            else:
-                raise MapiNotFoundException
-            for result in results:
-                yield result
-        except MapiProviderException:
-            if not self.token:
-                log.info(
-                    "Result not cached; logging in and reattempting search"
-                )
-                self.token = self._login()
-                for result in self.search(id_key, **parameters):
-                    yield result
-            else:
-                raise
+        if id_tvdb and date:
+            results = self._search_tvdb_date(id_tvdb, date)
+        elif id_tvdb:
+            results = self._search_id_tvdb(id_tvdb, season, episode)
+        elif id_imdb:
+            results = self._search_id_imdb(id_imdb, season, episode)
+        elif series and date:
+            if not re.match(date_fmt, date):
+                raise MapiProviderException("Date format must be YYYY-MM-DD")
+            results = self._search_series_date(series, date)
+        elif series:
+            results = self._search_series(series, season, episode)
+        else:
+            raise MapiNotFoundException
+        for result in results:
+            yield result
 
     def _search_id_imdb(self, id_imdb, season=None, episode=None):
         series_data = tvdb_search_series(
-            self.token, id_imdb=id_imdb, cache=self.cache
+            self.token, id_imdb=id_imdb, **self._request_options
         )
         id_tvdb = series_data["data"][0]["id"]
         return self._search_id_tvdb(id_tvdb, season, episode)
 
     def _search_id_tvdb(self, id_tvdb, season=None, episode=None):
         assert id_tvdb
+        if self._index_ttl:
+            index = get_index(
+                self.token,
+                id_tvdb,
+                self._index_ttl,
+                concurrency=self._pool,
+                **self._request_options
+            )
+            return index.search(season, episode)
+        return self._query_id_tvdb(id_tvdb, season, episode)
+
+    def _query_id_tvdb(self, id_tvdb, season=None, episode=None):
         found = False
-        series_data = tvdb_series_id(self.token, id_tvdb, cache=self.cache)
-        page = 1
-        while True:
-            episode_data = tvdb_series_id_episodes_query(
+
+        def search_series():
+            return tvdb_series_id(self.token, id_tvdb, **self._request_options)
+
+        def search_page(page):
+            return tvdb_series_id_episodes_query(
                 self.token,
                 id_tvdb,
                 episode,
                 season,
                 page=page,
-                cache=self.cache,
+                **self._request_options
             )
+
+        series_data, episode_data = self._pool.imap_ordered(
+            lambda call: call(), (search_series, partial(search_page, 1))
+        )
+        page_last = episode_data["links"]["last"]
+        pages = chain(
+            [episode_data],
+            self._pool.imap_ordered(search_page, range(2, page_last + 1)),
+        )
+        for episode_data in pages:
             for entry in episode_data["data"]:
                 try:
-                    yield MetadataTelevision(
+                    yield MetadataTelevision.from_provider(
                         series=series_data["data"]["seriesName"],
                         season=ustr(entry["airedSeason"]),
                         episode=ustr(entry["airedEpisodeNumber"]),
@@ -333,47 +493,81 @@ class TVDb(Provider):
                     found = True
                 except (AttributeError, ValueError):
                     continue
-            if page == episode_data["links"]["last"]:
-                break
-            page += 1
         if not found:
             raise MapiNotFoundException
 
     def _search_series(self, series, season, episode):
         assert series
-        found = False
-        series_data = tvdb_search_series(self.token, series, cache=self.cache)
-
-        for series_id in [entry["id"] for entry in series_data["data"][:5]]:
-            try:
-                for data in self._search_id_tvdb(series_id, season, episode):
-                    found = True
-                    yield data
-            except MapiNotFoundException:
-                continue  # may not have requested episode or may be banned
-        if not found:
-            raise MapiNotFoundException
+        series_data = tvdb_search_series(
+            self.token, series, **self._request_options
+        )
+        series_ids = [entry["id"] for entry in series_data["data"][:5]]
+        early_exit = (
+            self._early_exit and season is not None and episode is not None
+        )
+        results = self._search_candidates(
+            lambda series_id: self._search_id_tvdb(series_id, season, episode),
+            series_ids,
+            early_exit,
+        )
+        for result in results:
+            yield result
 
     def _search_tvdb_date(self, id_tvdb, date):
-        found = False
-        for meta in self._search_id_tvdb(id_tvdb):
-            if meta["date"] and meta["date"].startswith(date):
-                found = True
-                yield meta
-        if not found:
-            raise MapiNotFoundException
+        # date searches fetch every episode either way, so the index is kept
+        # for further date searches even when index_ttl isn't set
+        index = get_index(
+            self.token,
+            id_tvdb,
+            self._index_ttl or DATE_INDEX_TTL,
+            concurrency=self._pool,
+            **self._request_options
+        )
+        for meta in index.on_date(date):
+            yield meta
 
     def _search_series_date(self, series, date):
         assert series and date
-        series_data = tvdb_search_series(self.token, series, cache=self.cache)
+        series_data = tvdb_search_series(
+            self.token, series, **self._request_options
+        )
         tvdb_ids = [entry["id"] for entry in series_data["data"]][:5]
-        found = False
-        for tvdb_id in tvdb_ids:
+        results = self._search_candidates(
+            lambda tvdb_id: self._search_tvdb_date(tvdb_id, date), tvdb_ids
+        )
+        for result in results:
+            yield result
+
+    def _search_candidates(self, search, series_ids, early_exit=False):
+        """Yields search results for each candidate series id, in order.
+
+        Candidates which raise MapiNotFoundException are skipped since they
+        may not have the requested episode or may be banned. When the provider
+        is concurrent candidates are resolved using its pool, unless searching
+        stops at the first candidate with results, in which case they are
+        resolved one at a time so that later ones are only searched if needed.
+        """
+
+        def candidate_results(series_id):
             try:
-                for result in self._search_tvdb_date(tvdb_id, date):
+                for result in search(series_id):
                     yield result
-                found = True
             except MapiNotFoundException:
-                continue
+                return
+
+        if self.concurrency > 1 and not early_exit:
+            candidates = self._pool.imap_ordered(
+                lambda series_id: list(candidate_results(series_id)),
+                series_ids,
+            )
+        else:
+            candidates = (candidate_results(i) for i in series_ids)
+        found = False
+        for results in candidates:
+            for result in results:
+                found = True
+                yield result
+            if found and early_exit:
+                break
         if not found:
             raise MapiNotFoundException
@@ -0,0 +1,153 @@
+# coding=utf-8
+
+"""Provides an asyncio interface for metadata media providers.
+
+Async providers wrap their blocking counterparts from mapi.providers, running
+each search as a single call on the thread pool shared with
+mapi.endpoints_async, or the one given by their 'executor' option, and yielding
+its results as they are resolved. At most the pool's max_workers searches run
+at once; each fetches its own requests concurrently as configured by the
+'concurrency' option.
+
+Note: requires Python 3.7+.
+"""
+
+import asyncio
+import threading
+from concurrent import futures
+
+from mapi import log
+from mapi.endpoints_async import get_executor
+from mapi.exceptions import MapiException
+from mapi.providers import OMDb, TMDb, TVDb
+
+__all__ = [
+    "AsyncOMDb",
+    "AsyncProvider",
+    "AsyncTMDb",
+    "AsyncTVDb",
+    "provider_factory",
+]
+
+QUEUE_SIZE = 32  # results buffered per search
+
+_EXHAUSTED = object()
+
+
+class AsyncProvider(object):
+    """Base class for async Providers, wrapping a concrete Provider class."""
+
+    provider_class = None
+
+    def __init__(self, **options):
+        """Initializes the provider."""
+        self._executor = options.pop("executor", None)
+        self._provider = self.provider_class(**options)
+
+    async def search(self, id_key=None, **parameters):
+        """Searches the provider, asynchronously yielding Metadata objects.
+
+        Results are buffered in a bounded queue, so the search thread waits
+        for the consumer rather than running ahead of it.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        closed = threading.Event()
+
+        def put(result, error=None):
+            if closed.is_set():
+                return
+            try:
+                future = asyncio.run_coroutine_threadsafe(
+                    queue.put((result, error)), loop
+                )
+            except RuntimeError:  # event loop closed
+                closed.set()
+                return
+            while not closed.is_set():
+                try:
+                    return future.result(1)
+                except futures.TimeoutError:
+                    if loop.is_closed():
+                        closed.set()
+                except futures.CancelledError:  # event loop shutting down
+                    closed.set()
+
+        def produce():
+            error = None
+            try:
+                results = self._provider.search(id_key, **parameters)
+                try:
+                    for result in results:
+                        if closed.is_set():
+                            return
+                        put(result)
+                finally:
+                    results.close()
+            except BaseException as e:  # raised by the consumer instead
+                error = e
+            finally:
+                put(_EXHAUSTED, error)
+
+        loop.run_in_executor(self._executor or get_executor(), produce)
+        try:
+            while True:
+                result, error = await queue.get()
+                if error is not None:
+                    raise error
+                if result is _EXHAUSTED:
+                    break
+                yield result
+        finally:
+            closed.set()
+            while not queue.empty():  # unblocks a pending put
+                queue.get_nowait()
+
+    @property
+    def api_key(self):
+        return self._provider.api_key
+
+    @property
+    def cache(self):
+        return self._provider.cache
+
+    @property
+    def provider(self):
+        return self._provider
+
+
+class AsyncOMDb(AsyncProvider):
+    """Queries the OMDb API asynchronously."""
+
+    provider_class = OMDb
+
+
+class AsyncTMDb(AsyncProvider):
+    """Queries the TMDb API asynchronously."""
+
+    provider_class = TMDb
+
+
+class AsyncTVDb(AsyncProvider):
+    """Queries the TVDb API asynchronously.
+
+    Logging in is always deferred until the first search, which does so from
+    the thread pool rather than blocking the event loop.
+    """
+
+    provider_class = TVDb
+
+    def __init__(self, **options):
+        options.setdefault("defer_login", True)
+        super(AsyncTVDb, self).__init__(**options)
+
+
+def provider_factory(provider, **options):
+    """Factory function for async DB Provider concrete classes."""
+    providers = {"tmdb": AsyncTMDb, "tvdb": AsyncTVDb, "omdb": AsyncOMDb}
+    try:
+        return providers[provider.lower()](**options)
+    except KeyError:
+        msg = "Attempted to initialize non-existing DB Provider"
+        log.error(msg)
+        raise MapiException(msg)
@@ -0,0 +1,179 @@
+# coding=utf-8
+
+"""Client-side rate limiting for provider API keys.
+
+Requests made by mapi.endpoints acquire a token from the limiter returned by
+get_limiter for their provider and API key before hitting the network, waiting
+just long enough to stay within the limits in RATE_LIMITS rather than failing
+with 429 responses. Limiters are token buckets shared by every thread in the
+process; setting the MAPI_RATE_LIMIT_DIR environment variable stores their
+state in that directory instead, sharing them between processes too.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from abc import abstractmethod
+from os import environ, makedirs, path
+
+from mapi import log
+from mapi.compatibility import AbstractClass
+from mapi.exceptions import MapiException
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+__all__ = [
+    "FileTokenBucket",
+    "get_limiter",
+    "RATE_LIMITS",
+    "RateLimiter",
+    "set_rate_limit",
+    "TokenBucket",
+]
+
+# provider: (requests, per period seconds); OMDb's daily quotas depend on the
+# API key and reset with the calendar day, so it isn't limited by default
+RATE_LIMITS = {"tmdb": (40, 10)}
+
+_clock = getattr(time, "monotonic", time.time)
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimiter(AbstractClass):
+    """ABC for rate limiters."""
+
+    @abstractmethod
+    def reserve(self, tokens=1):
+        """Takes tokens, returning the number of seconds until they are due."""
+
+    def acquire(self, tokens=1):
+        """Takes tokens, waiting until they are due; returns the time waited."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            log.info("rate limited; waiting %.2fs", wait)
+            time.sleep(wait)
+        return wait
+
+
+class TokenBucket(RateLimiter):
+    """Thread-safe token bucket allowing requests per period seconds, with
+    bursts of up to capacity requests (defaults to requests).
+
+    Note: tokens are reserved up front, so concurrent callers queue up in the
+    order they called reserve rather than racing each other once they wake.
+    """
+
+    def __init__(self, requests, period=1, capacity=None):
+        self.rate = float(requests) / period
+        self.capacity = capacity or requests
+        self._tokens = float(self.capacity)
+        self._updated = _clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        with self._lock:
+            now = _clock()
+            self._tokens = min(
+                self._tokens + (now - self._updated) * self.rate,
+                self.capacity,
+            )
+            self._updated = now
+            self._tokens -= tokens
+            return max(-self._tokens / self.rate, 0)
+
+
+class FileTokenBucket(RateLimiter):
+    """Token bucket which keeps its state in a file, shared by every process
+    using that file.
+
+    Note: requires fcntl, i.e. a POSIX platform.
+    """
+
+    def __init__(self, file_path, requests, period=1, capacity=None):
+        if fcntl is None:  # pragma: no cover
+            raise MapiException("file rate limiters require fcntl")
+        self.path = file_path
+        self.rate = float(requests) / period
+        self.capacity = capacity or requests
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        directory = path.dirname(self.path)
+        if directory and not path.isdir(directory):
+            try:
+                makedirs(directory)
+            except OSError:  # pragma: no cover
+                pass  # created concurrently
+        with self._lock, open(self.path, "a+") as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                now = time.time()  # comparable between processes
+                fp.seek(0)
+                try:
+                    stored, updated = json.loads(fp.read())
+                except ValueError:
+                    stored, updated = self.capacity, now
+                stored = min(
+                    stored + max(now - updated, 0) * self.rate, self.capacity
+                )
+                stored -= tokens
+                fp.seek(0)
+                fp.truncate()
+                fp.write(json.dumps([stored, now]))
+                fp.flush()
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+        return max(-stored / self.rate, 0)
+
+
+def get_limiter(provider, api_key=None, limit=None):
+    """
+    Returns the shared rate limiter for a provider and API key, or None if the
+    provider isn't rate limited.
+
+    Note: limit, a (requests, period seconds) tuple, overrides the provider's
+    limit in RATE_LIMITS; limiters are shared by callers using the same limit.
+    """
+    limit = tuple(limit or RATE_LIMITS.get(provider) or ())
+    if not limit:
+        return None
+    key = provider, api_key, limit
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            directory = environ.get("MAPI_RATE_LIMIT_DIR")
+            if directory:
+                # hashed so API keys aren't leaked through file names
+                name = "%s:%s:%s/%s" % (provider, api_key, limit[0], limit[1])
+                name = hashlib.sha1(name.encode("utf-8")).hexdigest()
+                file_path = path.join(directory, name + ".json")
+                limiter = FileTokenBucket(file_path, *limit)
+            else:
+                limiter = TokenBucket(*limit)
+            _limiters[key] = limiter
+    return limiter
+
+
+def set_rate_limit(provider, requests, period=1):
+    """
+    Limits a provider's API keys to requests per period seconds each; requests
+    may be None to disable rate limiting for the provider.
+    """
+    limit = (requests, period) if requests else None
+    with _limiters_lock:
+        previous = RATE_LIMITS.get(provider)
+        if previous == limit:
+            return
+        if limit:
+            RATE_LIMITS[provider] = limit
+        else:
+            RATE_LIMITS.pop(provider, None)
+        # limiters given their own limit, e.g. by providers, are kept
+        for key in list(_limiters):
+            if key[0] == provider and key[2] == tuple(previous or ()):
+                del _limiters[key]
@@ -4,15 +4,29 @@
 
 import random
 import re
-from os import path
-from sys import version_info
+import threading
+from collections import OrderedDict, deque
+from copy import copy
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import mktime_tz, parsedate_tz
+from time import sleep, time
 
-import requests_cache
-from appdirs import user_cache_dir
+from requests import Session
 from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
 
 from mapi import log
+from mapi.cache import (
+    CACHE_PATH,
+    CacheBackend,
+    DEFAULT_TTL,
+    MemoryCache,
+    get_cache,
+    get_memo,
+    make_key,
+)
 from mapi.compatibility import ustr
+from mapi.exceptions import MapiException, MapiNetworkException
 
 __all__ = [
     "AGENT_ALL",
@@ -23,9 +37,18 @@ __all__ = [
     "clean_dict",
     "clear_cache",
     "d2l",
+    "DEFAULT_RETRY_POLICY",
+    "get_retry_policy",
     "get_session",
     "get_user_agent",
+    "imap_ordered",
+    "MAX_CONNECTIONS",
+    "mount_adapter",
     "request_json",
+    "RetryPolicy",
+    "set_retry_policy",
+    "unmount_adapter",
+    "WorkerPool",
     "year_expand",
     "year_parse",
 ]
@@ -44,9 +67,72 @@ AGENT_IOS = (
     "Safari/602.1"
 )
 AGENT_ALL = (AGENT_CHROME, AGENT_EDGE, AGENT_IOS)
-CACHE_PATH = path.join(
-    user_cache_dir(), "mapi-py%d.sqlite" % version_info.major
-)
+MAX_CONNECTIONS = 32
+
+_flights = {}  # in-flight GET requests keyed by cache key and authorization
+_flights_lock = threading.Lock()
+_session_lock = threading.Lock()
+
+
+class RetryPolicy(object):
+    """Describes how request_json times out and retries failed requests.
+
+    Connection errors, timeouts, and responses with a status in statuses are
+    retried up to retries times. Retries wait for a random duration between
+    zero and backoff * 2 ^ attempt seconds (i.e. "full jitter"), or for as long
+    as a response's Retry-After header requests, capped at backoff_max. The
+    read timeout doubles with each attempt, up to read_timeout_max.
+    """
+
+    def __init__(
+        self,
+        retries=3,
+        connect_timeout=3.05,
+        read_timeout=2,
+        read_timeout_max=16,
+        backoff=0.5,
+        backoff_max=30,
+        statuses=(429, 500, 502, 503, 504),
+        respect_retry_after=True,
+    ):
+        self.retries = retries
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.read_timeout_max = read_timeout_max
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.statuses = frozenset(statuses)
+        self.respect_retry_after = respect_retry_after
+
+    def delay(self, attempt, retry_after=None):
+        """Returns the number of seconds to wait before retrying an attempt."""
+        if retry_after is not None and self.respect_retry_after:
+            delay = _parse_retry_after(retry_after)
+            if delay is not None:
+                return min(delay, self.backoff_max)
+        cap = min(self.backoff * 2**attempt, self.backoff_max)
+        return random.uniform(0, cap)
+
+    def timeout(self, attempt):
+        """Returns a (connect, read) timeout tuple for an attempt."""
+        read_timeout = self.read_timeout * 2**attempt
+        return self.connect_timeout, min(read_timeout, self.read_timeout_max)
+
+
+def _parse_retry_after(value):
+    """Parses a Retry-After header given in seconds or as an HTTP date."""
+    try:
+        return max(float(value), 0)
+    except (TypeError, ValueError):
+        pass
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(mktime_tz(parsed) - time(), 0)
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+_retry_policies = []  # (prefix, policy) tuples, longest prefixes first
 
 
 def clean_dict(target_dict, whitelist=None):
@@ -61,8 +147,11 @@ def clean_dict(target_dict, whitelist=None):
 
 
 def clear_cache():
-    """Clears requests-cache cache."""
-    get_session().cache.clear()
+    """Clears the default response cache backend and the memoization tier."""
+    get_cache().clear()
+    memo = get_memo()
+    if memo:
+        memo.clear()
 
 
 def d2l(d):
@@ -70,16 +159,42 @@ def d2l(d):
     return sorted([(k, v) for k, v in d.items()])
 
 
+def get_retry_policy(url):
+    """Looks up the RetryPolicy for the longest url prefix registered."""
+    for prefix, policy in _retry_policies:
+        if url.startswith(prefix):
+            return policy
+    return DEFAULT_RETRY_POLICY
+
+
+def set_retry_policy(prefix, policy):
+    """
+    Sets the RetryPolicy for urls starting with prefix, e.g. a host; policy
+    may be None to remove a previously set one.
+    """
+    global _retry_policies
+    policies = dict(_retry_policies)
+    if policy is None:
+        policies.pop(prefix, None)
+    else:
+        policies[prefix] = policy
+    _retry_policies = sorted(policies.items(), key=lambda item: -len(item[0]))
+
+
 def get_session():
-    """Convenience function that returns request-cache session singleton."""
-    if not hasattr(get_session, "session"):
-        get_session.session = requests_cache.CachedSession(
-            cache_name=CACHE_PATH.rstrip(".sqlite"),
-            expire_after=518400,  # 6 days
-        )
-        adapter = HTTPAdapter(max_retries=3)
-        get_session.session.mount("http://", adapter)
-        get_session.session.mount("https://", adapter)
+    """
+    Convenience function that returns requests session singleton.
+
+    Note: The session is shared between threads; it holds no per-call state
+    since caching is handled by request_json itself.
+    """
+    with _session_lock:
+        if not hasattr(get_session, "session"):
+            session = Session()
+            adapter = HTTPAdapter(pool_maxsize=MAX_CONNECTIONS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            get_session.session = session
     return get_session.session
 
 
@@ -92,14 +207,198 @@ def get_user_agent(platform=None):
     )
 
 
+class WorkerPool(object):
+    """Bounded thread pool which nested concurrent calls can share.
+
+    Calls are only handed to a thread while fewer than workers are running,
+    otherwise the calling thread makes them itself. Calls can therefore map
+    over the same pool without waiting on threads held by their callers, and
+    at most workers threads are started however deeply they nest.
+    """
+
+    def __init__(self, workers=1):
+        self.workers = max(int(workers), 1)
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def imap_ordered(self, function, iterable):
+        """
+        Maps function over iterable, returning a generator of results in order.
+
+        Note: items are consumed from iterable as threads become free, rather
+        than all at once; calls which haven't started when the generator is
+        closed are cancelled.
+        """
+        if self.workers <= 1:
+            return (function(item) for item in iterable)
+        return self._imap_ordered(function, iter(iterable))
+
+    def shutdown(self):
+        """Stops the pool's threads once their calls are complete."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False)
+
+    def _call(self, function, item):
+        try:
+            return function(item)
+        finally:
+            self._slots.release()
+
+    def _imap_ordered(self, function, items):
+        futures = deque()
+        exhausted = False
+        try:
+            while True:
+                # hand items to threads while any are free
+                while not exhausted and self._slots.acquire(False):
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        self._slots.release()
+                        exhausted = True
+                        break
+                    futures.append(self._submit(function, item))
+                if futures:
+                    yield futures.popleft().result()
+                    continue
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                yield function(item)
+        finally:
+            for future in futures:
+                if future.cancel():
+                    self._slots.release()
+
+    def _submit(self, function, item):
+        """Submits a call for which a slot has been acquired."""
+        try:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers
+                    )
+                return self._executor.submit(self._call, function, item)
+        except Exception:
+            self._slots.release()
+            raise
+
+
+def imap_ordered(function, iterable, workers=1):
+    """
+    Maps function over iterable, returning a generator of results in order.
+
+    Note: workers is either a WorkerPool to share, or the size of one to use
+    for this call only; see WorkerPool.imap_ordered.
+    """
+    if isinstance(workers, WorkerPool):
+        return workers.imap_ordered(function, iterable)
+    if workers <= 1:
+        return (function(item) for item in iterable)
+    pool = WorkerPool(workers)
+    return _imap_once(pool, pool.imap_ordered(function, iterable))
+
+
+def _imap_once(pool, results):
+    try:
+        for result in results:
+            yield result
+    finally:
+        results.close()
+        pool.shutdown()
+
+
+def mount_adapter(prefix, pool_maxsize=MAX_CONNECTIONS, pool_block=False):
+    """
+    Mounts a dedicated connection pool adapter on the session singleton for
+    urls starting with prefix, e.g. a provider's host, and returns it.
+
+    Note: pool_maxsize is the number of keep-alive connections retained per
+    host; if pool_block is set, requests wait for a free connection instead of
+    opening (then discarding) extra ones once the pool is exhausted. Adapters
+    are shared by everything requesting urls under prefix; one already mounted
+    with the same settings is reused, otherwise it is replaced and closed.
+    """
+    session = get_session()
+    with _session_lock:
+        adapter = session.adapters.get(prefix)
+        if (
+            getattr(adapter, "_pool_maxsize", None) == pool_maxsize
+            and getattr(adapter, "_pool_block", None) == pool_block
+        ):
+            return adapter
+        replaced = adapter
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        _swap_adapter(session, prefix, adapter)
+    _close_adapter(session, replaced)
+    return adapter
+
+
+def unmount_adapter(prefix):
+    """Unmounts and closes an adapter mounted using mount_adapter, if any."""
+    session = get_session()
+    with _session_lock:
+        adapter = session.adapters.get(prefix)
+        if adapter is None or prefix in ("http://", "https://"):
+            return
+        _swap_adapter(session, prefix, None)
+    _close_adapter(session, adapter)
+
+
+def _close_adapter(session, adapter):
+    # the default adapter is mounted for both http:// and https://
+    if adapter and adapter not in session.adapters.values():
+        adapter.close()
+
+
+def _swap_adapter(session, prefix, adapter):
+    # swapped in whole so threads mid-request never see a partial update
+    adapters = OrderedDict(session.adapters)
+    if adapter is None:
+        del adapters[prefix]
+    else:
+        adapters[prefix] = adapter
+    session.adapters = OrderedDict(
+        sorted(adapters.items(), key=lambda item: -len(item[0]))
+    )
+
+
 def request_json(
-    url, parameters=None, body=None, headers=None, cache=True, agent=None
+    url,
+    parameters=None,
+    body=None,
+    headers=None,
+    cache=True,
+    agent=None,
+    ttl=DEFAULT_TTL,
+    limiter=None,
+    retry=None,
 ):
     """
     Queries a url for json data.
 
-    Note: Requests are cached using requests_cached for a week, this is done
-    transparently by using the package's monkey patching.
+    Note: Successful GET requests are cached for ttl seconds unless cache is
+    falsy; ttl may also be a callable which is passed the response content and
+    returns a number of seconds. If cache is True the default backend from
+    mapi.cache.get_cache is used, otherwise cache may be a
+    mapi.cache.CacheBackend instance. Parsed responses are also memoized
+    in-process by mapi.cache.get_memo in front of the backend. Requests which
+    aren't served from the cache take a token from limiter, a
+    mapi.ratelimit.RateLimiter, before each attempt if one is given. Failed
+    attempts are retried according to retry, a RetryPolicy, or else the one
+    registered for url; MapiNetworkException is raised if the request still
+    can't be completed. Identical GET requests made concurrently by several
+    threads share a single request when caching is enabled. Content shared
+    with other callers or kept in memory, i.e. by the memoization tier or a
+    MemoryCache, is copied before being returned, so callers may mutate it.
     """
     assert url
     session = get_session()
@@ -122,20 +421,79 @@ def request_json(
         method = "GET"
         headers["user-agent"] = get_user_agent(agent)
 
-    initial_cache_state = session._is_cache_disabled  # yes, i'm a bad person
+    backend = get_cache() if cache is True else cache
+    if backend and not isinstance(backend, CacheBackend):
+        msg = "cache must be a boolean or a CacheBackend instance"
+        log.error(msg)
+        raise MapiException(msg)
+    if method != "GET":
+        backend = None
+    memo = get_memo() if backend else None
+    if isinstance(backend, MemoryCache):
+        memo = None  # would only duplicate backend
+    key = make_key(
+        method, url, parameters, body, headers.get("Accept-Language")
+    )
+    if backend:
+        cached = memo.get(key) if memo else None
+        in_memory = cached is not None or isinstance(backend, MemoryCache)
+        if cached is None:
+            found = backend.get_with_ttl(key)
+            cached = found and found[0]
+            # memoized only for as long as the backend will keep serving it
+            if found and memo and found[1] is not None:
+                memo.set(key, cached, found[1])
+                in_memory = True
+        if cached is not None:
+            status, content = cached
+            log.debug("cache: True")
+            log.info("status: %d", status)
+            return status, _copy_json(content) if in_memory else content
+
+    def fetch():
+        status, content = _fetch(
+            session, url, parameters, body, headers, method, limiter, retry
+        )
+        if backend and status // 100 == 2:
+            resolved_ttl = _resolve_ttl(ttl, content)
+            backend.set(key, [status, content], resolved_ttl)
+            if memo:
+                memo.set(key, [status, content], resolved_ttl)
+        return status, content
+
+    if not backend:
+        return fetch()
+    # the cache key omits authorization, which may change the response
+    status, content = _single_flight((key, headers.get("Authorization")), fetch)
+    # shared with coalesced callers, and possibly kept in memory
+    return status, _copy_json(content)
+
+
+def _copy_json(content):
+    """Copies parsed JSON content; faster than copy.deepcopy."""
+    if isinstance(content, dict):
+        return {k: _copy_json(v) for k, v in content.items()}
+    elif isinstance(content, list):
+        return [_copy_json(v) for v in content]
+    return content
+
+
+def _fetch(session, url, parameters, body, headers, method, limiter, retry):
     try:
-        session._is_cache_disabled = not cache
-        response = session.request(
+        response = _request(
+            session,
+            retry or get_retry_policy(url),
+            limiter,
             url=url,
             params=parameters,
             json=body,
             headers=headers,
             method=method,
-            timeout=1,
         )
         status = response.status_code
         content = response.json() if status // 100 == 2 else None
-        cache = getattr(response, "from_cache", False)
+    except MapiNetworkException:
+        raise
     except Exception as e:
         content = None
         status = 500
@@ -144,14 +502,91 @@ def request_json(
         log.debug("method: %s", method)
         log.debug("headers: %r", headers)
         log.debug("parameters: %r", parameters)
-        log.debug("cache: %r", cache)
+        log.debug("cache: False")
         log.info("status: %d", status)
         log.debug("content: %s", content)
-    finally:
-        session._is_cache_disabled = initial_cache_state
     return status, content
 
 
+class _Flight(object):
+    """An in-flight request, which concurrent identical requests wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+        self.result = None
+
+
+def _single_flight(key, function):
+    """
+    Calls function, unless a call for the same key is already in progress in
+    another thread, in which case that call's result is waited for and shared.
+
+    Note: Waiting callers get the same result object as the first caller, so
+    callers copy it before handing it out; exceptions are copied so that each
+    caller raises its own instance.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        log.debug("coalesced: True")
+        flight.done.wait()
+        if flight.error is not None:
+            raise copy(flight.error)
+        return flight.result
+    try:
+        flight.result = function()
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+    return flight.result
+
+
+def _request(session, policy, limiter=None, **kwargs):
+    """Makes a request, retrying according to policy and waiting on limiter.
+
+    Raises MapiNetworkException, preserving the final reason, if the request
+    could not complete; returns the final response otherwise, including ones
+    with a retryable status once retries have been exhausted.
+    """
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire()
+        try:
+            response = session.request(
+                timeout=policy.timeout(attempt), **kwargs
+            )
+        except (ConnectionError, Timeout) as e:
+            if attempt >= policy.retries:
+                log.debug(e, exc_info=True)
+                raise MapiNetworkException(
+                    "%s failed after %d attempt(s): %s"
+                    % (kwargs["url"], attempt + 1, e)
+                )
+            delay = policy.delay(attempt)
+            log.info("retrying in %.2fs after error: %s", delay, e)
+        else:
+            status = response.status_code
+            if status not in policy.statuses or attempt >= policy.retries:
+                return response
+            delay = policy.delay(attempt, response.headers.get("Retry-After"))
+            log.info("retrying in %.2fs after status: %d", delay, status)
+        sleep(delay)
+        attempt += 1
+
+
+def _resolve_ttl(ttl, content):
+    return ttl(content) if callable(ttl) else ttl
+
+
 def year_parse(s):
     """Parses a year from a string."""
     regex = r"((?:19|20)\d{2})(?:$|[-/]\d{2}[-/]\d{2})"
@@ -0,0 +1,221 @@
+# coding=utf-8
+
+"""Pre-populates the response cache for a known library.
+
+Items are given one per line as IMDb tt-consts (e.g. 'tt0089218'), prefixed
+TMDb or TVDb ids (e.g. 'tmdb:9340', 'tvdb:73739'), or titles optionally
+followed by a year (e.g. 'The Goonies (1985)' or 'The Goonies,1985'). Movies
+are looked up using OMDb or TMDb, and TVDb series are fetched along with every
+page of their episodes, as used by TVDb id and date searches, then each of
+their episodes is searched for by season and episode number, as when tagging
+files (these are answered using the series' episode index instead if an
+index_ttl provider option is given). Titles are warmed for title searches only,
+not for lookups of their results by id.
+Completed items are appended to a state file so that interrupted runs can be
+resumed. See 'python -m mapi warm --help'.
+"""
+
+import io
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from os import environ, path
+from time import time
+
+from mapi import log
+from mapi.compatibility import ustr
+from mapi.exceptions import MapiNotFoundException
+from mapi.providers import provider_factory
+
+__all__ = ["parse_item", "read_items", "warm", "WarmStats"]
+
+_title_pattern = re.compile(r"^(.+?)\s*(?:[,\t]|\()\s*((?:19|20)\d{2})\)?$")
+
+
+class WarmStats(object):
+    """Counters describing the progress of a warm run."""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.errors = {}  # item key: error message
+        self.started = time()
+
+    @property
+    def elapsed(self):
+        return time() - self.started
+
+    @property
+    def rate(self):
+        """Items fetched per second, excluding skipped items."""
+        elapsed = self.elapsed
+        return (self.done + self.failed) / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return "%d/%d items, %d failed, %d skipped, %.1f items/s" % (
+            self.done + self.failed + self.skipped,
+            self.total,
+            self.failed,
+            self.skipped,
+            self.rate,
+        )
+
+
+def parse_item(line):
+    """
+    Parses a line into a (kind, value) tuple, where kind is one of 'imdb',
+    'tmdb', 'tvdb', or 'title', whose value is a (title, year) tuple; returns
+    None for blank lines and comments.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if re.match(r"^tt\d+$", line):
+        return "imdb", line
+    match = re.match(r"^(tmdb|tvdb):\s*(\d+)$", line, re.I)
+    if match:
+        return match.group(1).lower(), match.group(2)
+    match = _title_pattern.match(line)
+    if match:
+        return "title", (match.group(1), match.group(2))
+    return "title", (line, None)
+
+
+def read_items(file_path):
+    """Reads unique items from a file, preserving their order."""
+    items = []
+    seen = set()
+    with io.open(file_path, "r", encoding="utf-8") as fp:
+        for line in fp:
+            item = parse_item(line)
+            if item and item not in seen:
+                seen.add(item)
+                items.append(item)
+    return items
+
+
+def _item_key(item):
+    kind, value = item
+    if kind == "title":
+        return "title:%s:%s" % (value[0], value[1] or "")
+    return "%s:%s" % (kind, value)
+
+
+class _Providers(object):
+    """Lazily initializes the providers needed for each kind of item."""
+
+    def __init__(self, **options):
+        self._options = options
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._providers:
+                self._providers[name] = provider_factory(name, **self._options)
+            return self._providers[name]
+
+    def movie(self, preferred):
+        """
+        Returns the preferred movie provider, or the other if it has a key and
+        the preferred one doesn't.
+        """
+        other = "tmdb" if preferred == "omdb" else "omdb"
+        if environ.get("API_KEY_%s" % preferred.upper()) or not environ.get(
+            "API_KEY_%s" % other.upper()
+        ):
+            return self.get(preferred)
+        return self.get(other)
+
+
+def _warm_item(providers, item):
+    kind, value = item
+    if kind == "imdb":
+        list(providers.movie("omdb").search(id_imdb=value))
+    elif kind == "tmdb":
+        list(providers.get("tmdb").search(id_tmdb=value))
+    elif kind == "tvdb":
+        provider = providers.get("tvdb")
+        episodes = list(provider.search(id_tvdb=value))
+        # each season and episode number query is cached separately
+        numbers = {(meta["season"], meta["episode"]) for meta in episodes}
+        for season, episode in sorted(numbers):
+            try:
+                list(
+                    provider.search(
+                        id_tvdb=value, season=season, episode=episode
+                    )
+                )
+            except MapiNotFoundException:
+                continue
+    else:
+        title, year = value
+        list(providers.movie("tmdb").search(title=title, year=year))
+
+
+def warm(
+    items, concurrency=8, state_path=None, progress=None, **provider_options
+):
+    """
+    Fetches items into the cache concurrently, returning a WarmStats.
+
+    Note: items already listed in the state file at state_path are skipped and
+    completed items are appended to it; at most twice concurrency items are
+    queued at a time. progress, if given, is called with the WarmStats after
+    each item. Other keyword arguments are passed to the providers, e.g. cache,
+    concurrency, or index_ttl; API keys are read from the environment.
+    """
+    completed = set()
+    if state_path and path.exists(state_path):
+        with io.open(state_path, "r", encoding="utf-8") as fp:
+            completed = {line.rstrip("\n") for line in fp}
+    stats = WarmStats(len(items))
+    pending = []
+    for item in items:
+        if _item_key(item) in completed:
+            stats.skipped += 1
+        else:
+            pending.append(item)
+    providers = _Providers(**provider_options)
+    state_fp = None
+    if state_path:
+        state_fp = io.open(state_path, "a", encoding="utf-8")
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    queue = iter(pending)
+    futures = {}  # future: item
+
+    def submit(count):
+        for item in islice(queue, count):
+            futures[executor.submit(_warm_item, providers, item)] = item
+
+    try:
+        submit(concurrency * 2)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = _item_key(futures.pop(future))
+                try:
+                    future.result()
+                except Exception as e:
+                    log.info("failed to warm %s: %s", key, e)
+                    stats.errors[key] = ustr(e) or e.__class__.__name__
+                    stats.failed += 1
+                else:
+                    stats.done += 1
+                    if state_fp:
+                        state_fp.write(key + u"\n")
+                        state_fp.flush()
+                if progress:
+                    progress(stats)
+            submit(len(done))
+    finally:
+        # e.g. if interrupted; only items already in progress are finished
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        if state_fp:
+            state_fp.close()
+    return stats
@@ -92,11 +92,182 @@ TELEVISION_META = [
     },
 ]
 
+# Title casing of real titles; those marked as repeated case more than one
+# occurrence of the same exception word
+TITLE_CASE_CORPUS = [
+    ("the goonies", "The Goonies"),
+    ("saw iii", "Saw III"),
+    (  # repeated
+        "the lord of the rings: the return of the king",
+        "The Lord of the Rings: The Return of the King",
+    ),
+    (  # repeated
+        "the lord of the rings - the fellowship of the ring",
+        "The Lord of the Rings - The Fellowship of the Ring",
+    ),
+    (
+        "harry potter and the prisoner of azkaban",
+        "Harry Potter and the Prisoner of Azkaban",
+    ),
+    (
+        "star wars: episode iv - a new hope",
+        "Star Wars: Episode IV - A New Hope",
+    ),
+    (
+        "star wars episode v - the empire strikes back",
+        "Star Wars Episode V - The Empire Strikes Back",
+    ),
+    ("rocky iv", "Rocky IV"),
+    ("rocky ii", "Rocky II"),
+    ("final fantasy vii advent children", "Final Fantasy VII Advent Children"),
+    ("world war ii in hd colour", "World War II in Hd Colour"),
+    (  # repeated
+        "the day the earth stood still",
+        "The Day the Earth Stood Still",
+    ),
+    ("gone with the wind", "Gone with the Wind"),
+    ("a beautiful mind", "A Beautiful Mind"),
+    ("an american werewolf in london", "An American Werewolf in London"),
+    ("to kill a mockingbird", "To Kill a Mockingbird"),
+    ("of mice and men", "Of Mice and Men"),
+    ("the man from u.n.c.l.e.", "The Man from U.N.C.L.E."),
+    ("s.h.i.e.l.d.", "S.H.I.E.L.D."),
+    ("agents of s.h.i.e.l.d.", "Agents of S.H.I.E.L.D."),
+    ("l.a. confidential", "L.A. Confidential"),
+    ("la la land", "LA LA Land"),  # repeated
+    ("la vie en rose", "LA Vie En Rose"),
+    (
+        u"le fabuleux destin d'amélie poulain",
+        u"Le Fabuleux Destin D'amélie Poulain",
+    ),
+    (u"amélie", u"Amélie"),
+    (u"un long dimanche de fiançailles", u"Un Long Dimanche de Fiançailles"),
+    ("une femme est une femme", "Une Femme Est une Femme"),  # repeated
+    (  # repeated
+        "the girl with the dragon tattoo",
+        "The Girl with the Dragon Tattoo",
+    ),
+    ("csi: crime scene investigation", "CSI: Crime Scene Investigation"),
+    ("csi: miami", "CSI: Miami"),
+    ("ufc 229: khabib vs. mcgregor", "UFC 229: Khabib VS. Mcgregor"),
+    ("nba finals 2019", "NBA Finals 2019"),
+    ("the x-files", "The X-files"),
+    ("x-men: days of future past", "X-men: Days of Future Past"),
+    ("jfk", "JFK"),
+    ("the fbi story", "The FBI Story"),
+    ("mtv unplugged", "MTV Unplugged"),
+    ("bbc planet earth", "BBC Planet Earth"),
+    ("espn 30 for 30", "ESPN 30 for 30"),
+    ("nfl sunday ticket", "NFL Sunday Ticket"),
+    ("2001: a space odyssey", "2001: A Space Odyssey"),
+    ("(500) days of summer", "(500) Days of Summer"),
+    ("9 1/2 weeks", "9 1/2 Weeks"),
+    ("the 40-year-old virgin", "The 40-year-old Virgin"),
+    ("me, myself & irene", "Me, Myself & Irene"),
+    ("o brother, where art thou?", "O Brother, Where Art Thou?"),
+    ("who framed roger rabbit", "Who Framed Roger Rabbit"),
+    (  # repeated
+        "the good, the bad and the ugly",
+        "The Good, The Bad and the Ugly",
+    ),
+    (
+        "dr. strangelove or: how i learned to stop worrying and love the bomb",
+        "DR. Strangelove Or: How I Learned to Stop Worrying and Love the Bomb",
+    ),
+    ("i, robot", "I, Robot"),
+    ("i am legend", "I Am Legend"),
+    ("ghost in the shell", "Ghost in the Shell"),
+    (  # repeated
+        "the hitchhiker's guide to the galaxy",
+        "The Hitchhiker's Guide to the Galaxy",
+    ),
+    ("monty python and the holy grail", "Monty Python and the Holy Grail"),
+    ("des hommes et des dieux", "Des Hommes Et des Dieux"),  # repeated
+    ("de rouille et d'os", "De Rouille Et D'os"),
+    ("the king's speech", "The King's Speech"),
+    ("the lion king", "The Lion King"),
+    ("beauty and the beast", "Beauty and the Beast"),
+    ("alice in wonderland", "Alice in Wonderland"),
+    ("for a few dollars more", "For a Few Dollars More"),
+    ("from dusk till dawn", "From Dusk Till Dawn"),
+    ("as good as it gets", "As Good as It Gets"),  # repeated
+    ("but i'm a cheerleader", "But I'm a Cheerleader"),
+    ("the usual suspects", "The Usual Suspects"),
+    ("what we do in the shadows", "What We Do in the Shadows"),
+    ("by the sea", "By the Sea"),
+    ("nor'easter", "Nor'easter"),
+    ("on the waterfront", "On the Waterfront"),
+    ("the man with the golden gun", "The Man with the Golden Gun"),  # repeated
+    ("via dolorosa", "Via Dolorosa"),
+    ("the house by the cemetery", "The House by the Cemetery"),  # repeated
+    ("the wolf of wall street", "The Wolf of Wall Street"),
+    ("adventure time", "Adventure Time"),
+    ("five more short graybles", "Five More Short Graybles"),
+    ("rick and morty", "Rick and Morty"),
+    ("lost", "Lost"),
+    ("pilot (1)", "Pilot (1)"),
+    (u"más", u"Más"),
+    ("game of thrones", "Game of Thrones"),
+    ("the winds of winter", "The Winds of Winter"),
+    ("breaking bad", "Breaking Bad"),
+    ("better call saul", "Better Call Saul"),
+    ("it's always sunny in philadelphia", "It's Always Sunny in Philadelphia"),
+    ("the office (us)", "The Office (us)"),
+    ("the office uk", "The Office UK"),
+    ("wwe raw", "WWE Raw"),
+    ("wwii in colour", "WWII in Colour"),
+    ("the tv set", "The TV Set"),
+    ("tv's funniest moments", "TV's Funniest Moments"),
+    ("3d sex and zen: extreme ecstasy", "3D Sex and Zen: Extreme Ecstasy"),
+    ("avatar 3d", "Avatar 3D"),
+    ("ufo", "UFO"),
+    ("ufos: the secret history", "Ufos: The Secret History"),
+    ("aka ms. 45", "AKA MS. 45"),
+    ("omg! the movie", "OMG! The Movie"),
+    ("lol", "LOL"),
+    ("yolo", "YOLO"),
+    ("the vip's", "The VIP's"),
+    ("vi warshawski", "VI Warshawski"),
+    ("the magnificent vii", "The Magnificent VII"),
+    ("henry v", "Henry V"),
+    ("richard iii", "Richard III"),
+    ("king lear", "King Lear"),
+    ("doa: dead or alive", "DOA: Dead or Alive"),
+    ("the ira", "The IRA"),
+    ("rsvp", "RSVP"),
+    ("pga tour 2k21", "PGA Tour 2k21"),
+    ("mlb the show", "MLB the Show"),
+    ("a tale of two cities", "A Tale of Two Cities"),
+    ("the cat in the hat", "The Cat in the Hat"),  # repeated
+    ("the hobbit: an unexpected journey", "The Hobbit: An Unexpected Journey"),
+    ("an officer and a gentleman", "An Officer and a Gentleman"),  # repeated
+    ("into the wild", "Into the Wild"),
+    ("up", "Up"),
+    ("it", "It"),
+    ("us", "Us"),
+    ("tenet", "Tenet"),
+    ("la story", "LA Story"),
+    ("h264 encode test", "H264 Encode Test"),
+    ("movie.title.with.dots.the.end", "MoviE.titlE.witH.dotS.thE.end"),
+    ("some-title-with-dashes-of-the-sea", "Some-title-with-dashes-of-the-sea"),
+    ("the_underscored_title", "The_underscored_title"),
+    ("wall-e", "Wall-e"),
+    ("the man who knew too much", "The Man Who Knew Too Much"),
+    ("the a-team", "The a-team"),
+    ("the and", "The and"),
+    ("and the", "And the"),
+    ("a", "A"),
+    ("the", "The"),
+    ("from a to z", "From a to Z"),
+    ("x", "X"),
+]
+
 
 class MockRequestResponse:
-    def __init__(self, status, content):
+    def __init__(self, status, content, headers=None):
         self.status_code = status
         self.content = content
+        self.headers = headers or {}
 
     def json(self):
         from json import loads
@@ -3,9 +3,28 @@
 """Shared fixtures automatically imported by PyTest."""
 
 from os import environ
+from sys import version_info
 
 import pytest
 
+# Python 2 can't compile async syntax, and asyncio.get_running_loop is 3.7+
+collect_ignore = []
+if version_info < (3, 7):  # pragma: no cover
+    collect_ignore += [
+        "endpoints/test_endpoints_async.py",
+        "providers/test_providers_async.py",
+    ]
+
+
+@pytest.fixture(autouse=True)
+def series_airing():
+    """Forgets the airing TVDb series recorded by any previous test."""
+    from mapi.cache import clear_series
+
+    clear_series()
+    yield
+    clear_series()
+
 
 @pytest.fixture
 def metadata():
@@ -0,0 +1,84 @@
+# coding=utf-8
+
+"""Unit tests for mapi/endpoints_async.py."""
+
+import asyncio
+
+import pytest
+from mock import patch
+
+from mapi import endpoints_async
+from mapi.exceptions import (
+    MapiNetworkException,
+    MapiNotFoundException,
+    MapiProviderException,
+)
+
+
+@patch("mapi.endpoints.request_json")
+def test_omdb_title__success(mock_request):
+    mock_request.return_value = 200, {"Title": "The Goonies"}
+    content = asyncio.run(
+        endpoints_async.omdb_title("key", id_imdb="tt0089218")
+    )
+    assert content == {"Title": "The Goonies"}
+
+
+@patch("mapi.endpoints.request_json")
+def test_omdb_title__invalid_parameters(mock_request):
+    with pytest.raises(MapiProviderException):
+        asyncio.run(endpoints_async.omdb_title("key"))
+    mock_request.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "status, content, exception",
+    [
+        (401, None, MapiProviderException),
+        (404, None, MapiNotFoundException),
+        (500, None, MapiNetworkException),
+    ],
+)
+@patch("mapi.endpoints.request_json")
+def test_tmdb_movies__exceptions(mock_request, status, content, exception):
+    mock_request.return_value = status, content
+    with pytest.raises(exception):
+        asyncio.run(endpoints_async.tmdb_movies("key", 9340))
+
+
+@patch("mapi.endpoints.request_json")
+def test_tvdb_series_id__concurrent(mock_request):
+    mock_request.return_value = 200, {"data": {"seriesName": "Downtown"}}
+
+    async def gather():
+        return await asyncio.gather(
+            *[endpoints_async.tvdb_series_id("token", i) for i in range(50)]
+        )
+
+    results = asyncio.run(gather())
+    assert len(results) == 50
+    assert mock_request.call_count == 50
+
+
+def test_set_executor():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from mapi.utils import MAX_CONNECTIONS
+
+    previous = endpoints_async.get_executor()
+    executor = ThreadPoolExecutor(max_workers=64)
+    try:
+        endpoints_async.set_executor(executor)
+        assert endpoints_async.get_executor() is executor
+        assert previous._shutdown
+    finally:
+        endpoints_async.set_executor(ThreadPoolExecutor(MAX_CONNECTIONS))
+
+
+def test_endpoints__same_signatures():
+    from mapi import endpoints
+
+    for name in endpoints.__all__:
+        wrapper = getattr(endpoints_async, name)
+        assert wrapper.__wrapped__ is getattr(endpoints, name)
+        assert asyncio.iscoroutinefunction(wrapper)
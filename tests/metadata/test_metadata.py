@@ -2,6 +2,9 @@
 
 """Unit tests for mapi/metadata/metadata.py."""
 
+from ast import literal_eval
+from sys import version_info
+
 import pytest
 
 
@@ -79,3 +82,111 @@ def test_deletion__valid_key(metadata):
 def test_deletion__invalid_key(metadata):
     with pytest.raises(KeyError):
         del metadata["cats"]
+
+
+def test_repr(metadata):
+    assert literal_eval(repr(metadata)) == dict(metadata.items())
+
+
+def test_slots(television_metadata):
+    if version_info >= (3,):  # Python 2's MutableMapping has no __slots__
+        with pytest.raises(AttributeError):
+            television_metadata.__dict__
+    assert len(television_metadata._values) == len(
+        television_metadata.fields_accepted
+    )
+
+
+def test_subclass_fields(metadata):
+    from mapi.metadata import Metadata
+
+    class MetadataCustom(Metadata):
+        fields_accepted = Metadata.fields_accepted | {"custom"}
+
+    custom = MetadataCustom(title="Home Movies", custom="value")
+    assert custom["custom"] == "value"
+    assert dict(custom) == {"title": "Home Movies", "custom": "value"}
+    with pytest.raises(KeyError):
+        metadata["custom"] = "value"
+
+
+def test_from_provider(television_metadata):
+    from mapi.metadata import MetadataTelevision
+
+    meta = MetadataTelevision.from_provider(
+        series="adventure time",
+        season=5,
+        episode=3,
+        title="Five More Short Graybles",
+        synopsis="",
+    )
+    assert meta == television_metadata
+    assert meta["media"] == "television"
+    assert "synopsis" not in list(meta)
+
+
+def test_raw_values():
+    from mapi.metadata import MetadataTelevision
+
+    meta = MetadataTelevision.from_provider(series="adventure time", season="5")
+    assert meta.raw_values(["season", "series", "episode", "unknown"]) == [
+        "5",
+        "adventure time",
+        None,
+        None,
+    ]
+
+
+@pytest.mark.parametrize(
+    "date", ["2019-05-23", "2020-02-29", "1985-06-07", None]
+)
+def test_from_provider__date(date):
+    from mapi.metadata import MetadataMovie
+
+    meta = MetadataMovie.from_provider(title="Home Movies", date=date)
+    assert meta["date"] == (date or "")
+    assert meta["media"] == "movie"
+
+
+@pytest.mark.parametrize(
+    "date", ["", "N/A", "2019-5-23", "2019-13-01", "2019-02-29", "2019/05/23"]
+)
+def test_from_provider__invalid_date(date):
+    from mapi.metadata import MetadataMovie
+
+    with pytest.raises(ValueError):
+        MetadataMovie.from_provider(title="Home Movies", date=date)
+
+
+def test_format__plan_cached(metadata):
+    from mapi.metadata import _format_plan
+
+    assert _format_plan("{title} - {date}") is _format_plan("{title} - {date}")
+    assert _format_plan("[{title:>5}] {quality:2}") == (
+        "[{title:>5}] ",
+        ("quality", "2"),
+    )
+
+
+def test_format__unmatched_field(metadata):
+    s = format(metadata, "{title} {title:>5} {cats}")
+    assert s == "Home Movies {title:>5}"
+
+
+def test_format_many(movie_metadata, television_metadata):
+    from mapi.metadata import format_many
+
+    metadata_list = [movie_metadata, television_metadata]
+    assert format_many(metadata_list) == [str(m) for m in metadata_list]
+    assert format_many(metadata_list, "{title} [{media}]") == [
+        "Saw III [Movie]",
+        "Five More Short Graybles [Television]",
+    ]
+    assert format_many([], "{title}") == []
+
+
+def test_format__extra_fields_not_title_cased(metadata):
+    metadata["extension"] = "mkv"
+    metadata["quality"] = "720p"
+    s = format(metadata, "{title} {quality}{extension}")
+    assert s == "Home Movies 720p.mkv"
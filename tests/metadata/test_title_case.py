@@ -0,0 +1,48 @@
+# coding=utf-8
+
+"""Unit tests for Metadata title casing in mapi/metadata.py."""
+
+import pytest
+
+from mapi import metadata
+from mapi.metadata import Metadata
+from tests import TITLE_CASE_CORPUS
+
+
+@pytest.mark.parametrize("s, expected", TITLE_CASE_CORPUS)
+def test_title_case__corpus(s, expected):
+    assert Metadata._str_title_case(s) == expected
+
+
+@pytest.mark.parametrize(
+    "s, expected",
+    [
+        ("", ""),
+        ("the the the", "The the the"),
+        ("usa: the usa", "USA: The USA"),
+        ("usa-the-usa", "USA-the-USA"),
+        ("the man from the usa", "The Man from the USA"),
+        ("star wars: a new hope", "Star Wars: A New Hope"),
+        ("star wars - a new hope", "Star Wars - A New Hope"),
+        ("i'm a tv, you're a tv", "I'm a TV, You're a TV"),
+        ("ufology", "Ufology"),
+        ("h.e.r.o.", "H.E.R.O."),
+    ],
+)
+def test_title_case__rules(s, expected):
+    assert Metadata._str_title_case(s) == expected
+
+
+def test_title_case__memoized():
+    metadata._title_cases.clear()
+    cased = Metadata._str_title_case("the goonies")
+    assert metadata._title_cases == {"the goonies": cased}
+    assert Metadata._str_title_case("the goonies") is cased
+
+
+def test_title_case__memo_bounded(monkeypatch):
+    monkeypatch.setattr(metadata, "TITLE_CASES_MAX", 4)
+    metadata._title_cases.clear()
+    for i in range(10):
+        Metadata._str_title_case("title %d" % i)
+    assert 0 < len(metadata._title_cases) <= 4
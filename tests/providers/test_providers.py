@@ -3,8 +3,9 @@
 """Unit tests for mapi/providers/_provider.py."""
 
 import pytest
+from mock import patch
 
-from mapi.exceptions import MapiException
+from mapi.exceptions import MapiException, MapiNotFoundException
 from mapi.providers import (
     TMDb,
     TVDb,
@@ -12,6 +13,7 @@ from mapi.providers import (
     has_provider_support,
     provider_factory,
 )
+from tests import JUNK_TEXT
 
 
 def test_has_provider__true():
@@ -56,3 +58,84 @@ def test_provider_factory__tvdb(tvdb_api_key):
 def test_non_existant():
     with pytest.raises(MapiException):
         provider_factory("yolo")
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+@patch("mapi.providers.tmdb_movies")
+def test_search_many__ordered(mock_tmdb_movies, concurrency):
+    def movies(api_key, id_tmdb, **kwargs):
+        if id_tmdb == 2:
+            raise MapiNotFoundException
+        return {
+            "title": "Movie %d" % id_tmdb,
+            "release_date": "1985-06-07",
+            "overview": "",
+        }
+
+    mock_tmdb_movies.side_effect = movies
+    client = TMDb(api_key=JUNK_TEXT)
+    queries = [{"id_tmdb": i} for i in (1, 2, 3, 1, 3)]
+    results = list(client.search_many(queries, concurrency, ordered=True))
+    assert mock_tmdb_movies.call_count == 3
+    assert [query for query, _ in results] == queries[:3]
+    assert results[0][1][0]["title"] == "Movie 1"
+    assert isinstance(results[1][1], MapiNotFoundException)
+    assert results[2][1][0]["title"] == "Movie 3"
+
+
+@patch("mapi.providers.tmdb_movies")
+def test_search_many__unexpected_exception(mock_tmdb_movies):
+    mock_tmdb_movies.side_effect = [
+        KeyError("title"),
+        {"title": "Movie 2", "release_date": "1985-06-07", "overview": ""},
+    ]
+    client = TMDb(api_key=JUNK_TEXT)
+    queries = [{"id_tmdb": 1}, {"id_tmdb": 2}]
+    results = list(client.search_many(queries, concurrency=1, ordered=True))
+    assert isinstance(results[0][1], KeyError)
+    assert results[1][1][0]["title"] == "Movie 2"
+
+
+@patch("mapi.providers.tmdb_movies")
+def test_search_many__unordered(mock_tmdb_movies):
+    mock_tmdb_movies.return_value = {
+        "title": "Movie",
+        "release_date": "1985-06-07",
+        "overview": "",
+    }
+    client = TMDb(api_key=JUNK_TEXT)
+    queries = [{"id_tmdb": i} for i in range(20)]
+    results = dict(
+        (query["id_tmdb"], results)
+        for query, results in client.search_many(queries, concurrency=8)
+    )
+    assert sorted(results) == list(range(20))
+
+
+def test_provider__pool_options():
+    from mapi.utils import get_session, unmount_adapter
+
+    client = TMDb(api_key=JUNK_TEXT, pool_maxsize=7, pool_block=True)
+    try:
+        adapter = get_session().get_adapter(client.host + "/3/movie/1")
+        assert adapter._pool_maxsize == 7
+        assert adapter._pool_block is True
+    finally:
+        unmount_adapter(client.host)
+
+
+@patch("mapi.providers.tmdb_movies")
+def test_provider__retry_option(mock_tmdb_movies):
+    from mapi.utils import DEFAULT_RETRY_POLICY, RetryPolicy, get_retry_policy
+
+    mock_tmdb_movies.return_value = {
+        "title": "Movie",
+        "release_date": "1985-06-07",
+        "overview": "",
+    }
+    policy = RetryPolicy(retries=5)
+    client = TMDb(api_key=JUNK_TEXT, retry=policy)
+    list(client.search(id_tmdb=1))
+    assert mock_tmdb_movies.call_args[1]["retry"] is policy
+    # scoped to the provider rather than registered for its host
+    assert get_retry_policy(client.host + "/3/movie/1") is DEFAULT_RETRY_POLICY
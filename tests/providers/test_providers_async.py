@@ -0,0 +1,187 @@
+# coding=utf-8
+
+"""Unit tests for mapi/providers_async.py."""
+
+import asyncio
+
+import pytest
+from mock import patch
+
+from mapi.exceptions import MapiException, MapiNotFoundException
+from mapi.providers_async import (
+    QUEUE_SIZE,
+    AsyncOMDb,
+    AsyncTMDb,
+    AsyncTVDb,
+    provider_factory,
+)
+from tests import JUNK_TEXT
+
+
+def collect(agen):
+    """Drains an async generator on a fresh event loop."""
+    loop = asyncio.new_event_loop()
+    results = []
+    try:
+        while True:
+            results.append(loop.run_until_complete(agen.__anext__()))
+    except StopAsyncIteration:
+        pass
+    finally:
+        loop.close()
+    return results
+
+
+@pytest.mark.parametrize(
+    "name, cls", [("omdb", AsyncOMDb), ("tmdb", AsyncTMDb), ("tvdb", AsyncTVDb)]
+)
+def test_provider_factory(name, cls):
+    client = provider_factory(name, api_key=JUNK_TEXT)
+    assert isinstance(client, cls)
+    assert client.api_key == JUNK_TEXT
+
+
+def test_provider_factory__non_existant():
+    with pytest.raises(MapiException):
+        provider_factory("yolo")
+
+
+@patch("mapi.providers.tmdb_movies")
+def test_async_tmdb__search_id_tmdb(mock_tmdb_movies):
+    mock_tmdb_movies.return_value = {
+        "title": "The Goonies",
+        "release_date": "1985-06-07",
+        "overview": "",
+    }
+    client = AsyncTMDb(api_key=JUNK_TEXT)
+    results = collect(client.search(id_tmdb="9340"))
+    assert len(results) == 1
+    assert results[0]["title"] == "The Goonies"
+    assert results[0]["id_tmdb"] == "9340"
+
+
+@patch("mapi.providers.tmdb_search_movies")
+def test_async_tmdb__search_title__streams_pages(mock_search):
+    def page(n):
+        return {
+            "total_pages": 2,
+            "results": [
+                {
+                    "title": "Star Trek %d" % n,
+                    "release_date": "199%d-01-01" % n,
+                    "overview": "",
+                    "id": n,
+                }
+            ],
+        }
+
+    mock_search.side_effect = lambda *args, **kwargs: page(kwargs["page"])
+    client = AsyncTMDb(api_key=JUNK_TEXT)
+    results = collect(client.search(title="Star Trek"))
+    assert [r["title"] for r in results] == ["Star Trek 1", "Star Trek 2"]
+
+
+@patch("mapi.providers.omdb_title")
+def test_async_omdb__not_found(mock_omdb_title):
+    mock_omdb_title.side_effect = MapiNotFoundException
+    client = AsyncOMDb(api_key=JUNK_TEXT)
+    with pytest.raises(MapiNotFoundException):
+        collect(client.search(id_imdb="tt0089218"))
+
+
+@patch("mapi.providers.tvdb_series_id")
+def test_async_tvdb__deferred_login(mock_series_id):
+    from mapi.auth import TokenManager
+
+    mock_series_id.side_effect = MapiNotFoundException
+    tokens = TokenManager(JUNK_TEXT)
+    with patch("mapi.providers.get_token_manager", return_value=tokens):
+        with patch("mapi.auth.tvdb_login", return_value="token") as mock_login:
+            client = AsyncTVDb(api_key=JUNK_TEXT, cache=False)
+            assert mock_login.call_count == 0
+            with pytest.raises(MapiNotFoundException):
+                collect(client.search(id_tvdb="73739", season=1, episode=1))
+            assert mock_login.call_count == 1
+
+
+@patch("mapi.providers.tmdb_movies")
+def test_async_tmdb__executor(mock_tmdb_movies):
+    from concurrent.futures import ThreadPoolExecutor
+
+    mock_tmdb_movies.return_value = {
+        "title": "The Goonies",
+        "release_date": "1985-06-07",
+        "overview": "",
+    }
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        client = AsyncTMDb(api_key=JUNK_TEXT, executor=executor)
+        with patch("mapi.providers_async.get_executor") as mock_get_executor:
+            results = collect(client.search(id_tmdb="9340"))
+        assert results[0]["title"] == "The Goonies"
+        mock_get_executor.assert_not_called()
+    finally:
+        executor.shutdown()
+
+
+@patch("mapi.providers.tmdb_search_movies")
+def test_async_tmdb__close_early(mock_search):
+    def page(n):
+        return {
+            "total_pages": 5,
+            "results": [
+                {
+                    "title": "Star Trek %d" % n,
+                    "release_date": "199%d-01-01" % n,
+                    "overview": "",
+                    "id": n,
+                }
+            ],
+        }
+
+    async def first():
+        results = client.search(title="Star Trek")
+        result = await results.__anext__()
+        await results.aclose()
+        return result
+
+    mock_search.side_effect = lambda *args, **kwargs: page(kwargs["page"])
+    client = AsyncTMDb(api_key=JUNK_TEXT)
+    assert asyncio.run(first())["title"] == "Star Trek 1"
+
+
+def test_async_tmdb__base_exception():
+    class Interrupt(BaseException):
+        pass
+
+    def search(*args, **kwargs):
+        yield {"title": "The Goonies"}
+        raise Interrupt
+
+    client = AsyncTMDb(api_key=JUNK_TEXT)
+    with patch.object(client.provider, "search", search):
+        with pytest.raises(Interrupt):
+            collect(client.search(title="The Goonies"))
+
+
+def test_async_tmdb__bounded_queue():
+    produced = []
+
+    def search(*args, **kwargs):
+        for i in range(QUEUE_SIZE * 4):
+            produced.append(i)
+            yield {"title": "Star Trek %d" % i}
+
+    async def first():
+        results = client.search(title="Star Trek")
+        result = await results.__anext__()
+        await asyncio.sleep(0.2)  # lets the search thread fill the queue
+        count = len(produced)
+        await results.aclose()
+        return result, count
+
+    client = AsyncTMDb(api_key=JUNK_TEXT)
+    with patch.object(client.provider, "search", search):
+        result, count = asyncio.run(first())
+    assert result["title"] == "Star Trek 0"
+    assert count <= QUEUE_SIZE + 2
@@ -58,3 +58,32 @@ def test_omdb_provider__search__no_hits(omdb_provider):
 def test_omdb_provider__search__missing(omdb_provider):
     with pytest.raises(MapiNotFoundException):
         next(omdb_provider.search())
+
+
+@pytest.mark.parametrize("concurrency", [1, 8])
+@patch("mapi.providers.omdb_title")
+@patch("mapi.providers.omdb_search")
+def test_omdb_provider__search_title__fan_out(
+    mock_search, mock_title, concurrency
+):
+    def search(*args, **kwargs):
+        page = kwargs["page"]
+        entries = [
+            {"imdbID": "tt%02d%02d" % (page, i), "Year": "1990"}
+            for i in range(10 if page < 3 else 5)
+        ]
+        return {"totalResults": "25", "Search": entries}
+
+    def title(api_key, id_imdb, **kwargs):
+        return {"Title": id_imdb, "Released": "01 Jan 1990", "Plot": "N/A"}
+
+    mock_search.side_effect = search
+    mock_title.side_effect = title
+    client = OMDb(api_key=JUNK_TEXT, concurrency=concurrency)
+    results = list(client.search(title="Anything"))
+    assert mock_search.call_count == 3
+    assert [r["id_imdb"] for r in results] == [
+        "tt%02d%02d" % (page, i)
+        for page in (1, 2, 3)
+        for i in range(10 if page < 3 else 5)
+    ]
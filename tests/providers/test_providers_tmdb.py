@@ -49,3 +49,27 @@ def test_tmdb_provider__search_title(meta, tmdb_provider):
             found = True
             break
     assert found is True
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+@patch("mapi.providers.tmdb_search_movies")
+def test_tmdb_provider__search_title__pages(mock_search, concurrency):
+    def page(*args, **kwargs):
+        n = kwargs["page"]
+        return {
+            "total_pages": 8,
+            "results": [
+                {
+                    "title": "Star Trek %d" % n,
+                    "release_date": "199%d-01-01" % n,
+                    "overview": "",
+                    "id": n,
+                }
+            ],
+        }
+
+    mock_search.side_effect = page
+    client = TMDb(api_key=JUNK_TEXT, concurrency=concurrency)
+    results = list(client.search(title="Star Trek"))
+    assert [r["id_tmdb"] for r in results] == ["1", "2", "3", "4", "5"]
+    assert mock_search.call_count == 5
@@ -3,9 +3,30 @@
 """Unit tests for mapi/providers/tvdb.py."""
 
 import pytest
+from mock import patch
 
 from mapi.exceptions import MapiProviderException
-from tests import TELEVISION_META
+from mapi.providers import TVDb
+from tests import JUNK_TEXT, TELEVISION_META
+
+
+def mock_series(token, id_tvdb, **kwargs):
+    return {"data": {"seriesName": "Series %s" % id_tvdb}}
+
+
+def mock_episodes(token, id_tvdb, episode=None, season=None, page=1, **kwargs):
+    entries = [
+        {
+            "airedSeason": page,
+            "airedEpisodeNumber": i,
+            "firstAired": "2001-%02d-%02d" % (page, i),
+            "episodeName": "Episode %d" % i,
+            "overview": None,
+        }
+        for i in range(1, 4)
+        if episode is None or int(episode) == i
+    ]
+    return {"data": entries, "links": {"last": 4}}
 
 
 @pytest.mark.usefixtures("tmdb_provider")
@@ -137,3 +158,142 @@ def test_tvdb_provider__search_series_date__partial(tvdb_provider):
 def test_tvdb_provider__search_series_date__invalid_format(tvdb_provider):
     with pytest.raises(MapiProviderException):
         next(tvdb_provider.search(series="The Daily Show", date="13"))
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+@patch("mapi.providers.tvdb_series_id_episodes_query")
+@patch("mapi.providers.tvdb_series_id")
+def test_tvdb_provider__search_id_tvdb__pages(
+    mock_series_id, mock_query, concurrency
+):
+    mock_series_id.side_effect = mock_series
+    mock_query.side_effect = mock_episodes
+    client = TVDb(api_key=JUNK_TEXT, concurrency=concurrency)
+    results = list(client.search(id_tvdb=1))
+    assert mock_series_id.call_count == 1
+    assert mock_query.call_count == 4
+    assert [(r["season"], r["episode"]) for r in results] == [
+        (season, episode) for season in range(1, 5) for episode in range(1, 4)
+    ]
+    assert all(r["series"] == "Series 1" for r in results)
+
+
+@pytest.mark.parametrize("concurrency", [1, 5])
+@pytest.mark.parametrize("early_exit, expected", [(False, 3), (True, 1)])
+@patch("mapi.providers.tvdb_search_series")
+@patch("mapi.providers.tvdb_series_id_episodes_query")
+@patch("mapi.providers.tvdb_series_id")
+def test_tvdb_provider__search_series__candidates(
+    mock_series_id, mock_query, mock_search, early_exit, expected, concurrency
+):
+    from mapi.exceptions import MapiNotFoundException
+
+    def series_id(token, id_tvdb, **kwargs):
+        if id_tvdb in (1, 3):
+            raise MapiNotFoundException
+        return mock_series(token, id_tvdb)
+
+    mock_series_id.side_effect = series_id
+    mock_query.side_effect = mock_episodes
+    mock_search.return_value = {"data": [{"id": i} for i in range(1, 7)]}
+    client = TVDb(
+        api_key=JUNK_TEXT, concurrency=concurrency, early_exit=early_exit
+    )
+    results = list(client.search(series="Series", season=1, episode=2))
+    assert len(results) == expected * 4
+    assert results[0]["series"] == "Series 2"
+    assert results[-1]["series"] == "Series %d" % (5 if expected > 1 else 2)
+    # later candidates are only searched if needed when exiting early
+    assert mock_series_id.call_count == (2 if early_exit else 5)
+
+
+@pytest.mark.parametrize("stale_token", ["", "stale"])
+@patch("mapi.providers.tvdb_series_id_episodes_query")
+@patch("mapi.providers.tvdb_series_id")
+def test_tvdb_provider__search__login(mock_series_id, mock_query, stale_token):
+    from mapi.auth import TokenManager
+
+    def series_id(token, id_tvdb, **kwargs):
+        if token != "fresh":
+            raise MapiProviderException("invalid token")
+        return mock_series(token, id_tvdb)
+
+    mock_series_id.side_effect = series_id
+    mock_query.side_effect = mock_episodes
+    tokens = TokenManager(JUNK_TEXT)
+    if stale_token:
+        tokens._set(stale_token, 2**32)
+    with patch("mapi.providers.get_token_manager", return_value=tokens):
+        client = TVDb(api_key=JUNK_TEXT)
+    assert client.token == stale_token
+    with patch("mapi.auth.tvdb_login", return_value="fresh") as mock_login:
+        results = list(client.search(id_tvdb=1))
+    assert len(results) == 12
+    assert client.token == "fresh"
+    assert mock_login.call_count == 1
+
+
+@patch("mapi.index.tvdb_series_id_episodes")
+@patch("mapi.index.tvdb_series_id")
+@patch("mapi.providers.tvdb_series_id_episodes_query")
+def test_tvdb_provider__search_id_tvdb__index(
+    mock_query, mock_series_id, mock_series_episodes
+):
+    from mapi import index
+
+    mock_series_id.side_effect = mock_series
+    mock_series_episodes.side_effect = mock_episodes
+    client = TVDb(api_key=JUNK_TEXT, index_ttl=60)
+    with patch.dict(index._indexes, clear=True):
+        for season in range(1, 5):
+            for episode in range(1, 4):
+                results = list(
+                    client.search(id_tvdb=1, season=season, episode=episode)
+                )
+                assert [(r["season"], r["episode"]) for r in results] == [
+                    (season, episode)
+                ]
+    assert mock_query.call_count == 0
+    assert mock_series_id.call_count == 1
+    assert mock_series_episodes.call_count == 4
+
+
+@patch("mapi.index.tvdb_series_id_episodes")
+@patch("mapi.index.tvdb_series_id")
+@patch("mapi.providers.tvdb_series_id_episodes_query")
+def test_tvdb_provider__search_tvdb_date__default_index(
+    mock_query, mock_series_id, mock_series_episodes
+):
+    from mapi import index
+
+    mock_series_id.side_effect = mock_series
+    mock_series_episodes.side_effect = mock_episodes
+    client = TVDb(api_key=JUNK_TEXT)
+    with patch.dict(index._indexes, clear=True):
+        results = list(client.search(id_tvdb=1, date="2001-03"))
+        assert len(list(client.search(id_tvdb=1, date="2001"))) > 3
+    assert [(r["season"], r["episode"]) for r in results] == [
+        (3, 1),
+        (3, 2),
+        (3, 3),
+    ]
+    mock_query.assert_not_called()
+    assert mock_series_id.call_count == 1
+
+
+@patch("mapi.index.tvdb_series_id_episodes")
+@patch("mapi.index.tvdb_series_id")
+def test_tvdb_provider__search_tvdb_date(mock_series_id, mock_series_episodes):
+    from mapi import index
+
+    mock_series_id.side_effect = mock_series
+    mock_series_episodes.side_effect = mock_episodes
+    client = TVDb(api_key=JUNK_TEXT, index_ttl=60)
+    with patch.dict(index._indexes, clear=True):
+        results = list(client.search(id_tvdb=1, date="2001-03"))
+    assert [(r["season"], r["episode"]) for r in results] == [
+        (3, 1),
+        (3, 2),
+        (3, 3),
+    ]
+    assert mock_series_episodes.call_count == 4
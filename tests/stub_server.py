@@ -0,0 +1,75 @@
+# coding=utf-8
+
+"""Local HTTP stand-in for provider APIs, shared by tests and benchmarks."""
+
+import json
+import threading
+from collections import Counter
+from time import sleep
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+__all__ = ["StubServer"]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.record(self)
+        if self.server.delay:
+            sleep(self.server.delay)
+        body = json.dumps({"path": self.path}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """Local HTTP stand-in for provider APIs, echoing each GET path as json.
+
+    Counts requests by path and new connections, optionally delaying responses.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, delay=0):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), StubHandler)
+        self.delay = delay
+        self.hits = Counter()
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+    def process_request_thread(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        ThreadingMixIn.process_request_thread(self, request, client_address)
+
+    def record(self, handler):
+        with self._lock:
+            self.hits[handler.path] += 1
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
@@ -0,0 +1,168 @@
+# coding=utf-8
+
+"""Unit tests for mapi/auth.py."""
+
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, time
+
+import pytest
+from mock import patch
+
+from mapi import auth
+from mapi.auth import REFRESH_MARGIN, TokenManager, get_token_manager
+from mapi.exceptions import MapiNetworkException, MapiProviderException
+
+
+def make_token(expires_in, name="token"):
+    """Creates an unsigned JWT expiring after expires_in seconds."""
+    payload = json.dumps({"exp": time() + expires_in, "id": name})
+    payload = base64.urlsafe_b64encode(payload.encode("utf-8"))
+    return "header.%s.signature" % payload.decode("ascii").rstrip("=")
+
+
+@pytest.fixture
+def token_path(tmpdir):
+    return str(tmpdir.join("tokens", "tvdb.json"))
+
+
+@patch("mapi.auth.tvdb_login")
+def test_token_manager__login_once(mock_login, token_path):
+    def login(api_key):
+        sleep(0.1)
+        return make_token(86400)
+
+    mock_login.side_effect = login
+    manager = TokenManager("key", token_path)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        tokens = set(executor.map(lambda _: manager.get(), range(8)))
+    assert len(tokens) == 1
+    assert mock_login.call_count == 1
+
+
+@patch("mapi.auth.tvdb_login")
+def test_token_manager__persisted(mock_login, token_path):
+    mock_login.return_value = make_token(86400)
+    token = TokenManager("key", token_path).get()
+    assert TokenManager("key", token_path).get() == token
+    assert mock_login.call_count == 1
+
+
+@patch("mapi.auth.tvdb_login")
+def test_token_manager__not_persisted(mock_login):
+    mock_login.return_value = make_token(86400)
+    TokenManager("key").get()
+    assert TokenManager("key").peek() == ""
+
+
+@patch("mapi.auth.tvdb_refresh_token")
+@patch("mapi.auth.tvdb_login")
+def test_token_manager__refresh(mock_login, mock_refresh, token_path):
+    mock_login.return_value = make_token(REFRESH_MARGIN / 2, "login")
+    mock_refresh.return_value = make_token(86400, "refresh")
+    manager = TokenManager("key", token_path)
+    assert manager.get() == mock_login.return_value
+    assert manager.get() == mock_refresh.return_value
+    assert manager.get() == mock_refresh.return_value
+    mock_refresh.assert_called_once_with(mock_login.return_value)
+    assert mock_login.call_count == 1
+
+
+@patch("mapi.auth.tvdb_refresh_token")
+@patch("mapi.auth.tvdb_login")
+def test_token_manager__refresh_fail(mock_login, mock_refresh):
+    tokens = [make_token(60), make_token(86400)]
+    mock_login.side_effect = tokens
+    mock_refresh.side_effect = MapiProviderException("invalid token")
+    manager = TokenManager("key")
+    manager.get()
+    assert manager.get() == tokens[1]
+    assert mock_login.call_count == 2
+
+
+@patch("mapi.auth.tvdb_refresh_token")
+@patch("mapi.auth.tvdb_login")
+def test_token_manager__refresh_network_error(mock_login, mock_refresh):
+    token = make_token(600)  # due to be refreshed, though still valid
+    mock_login.side_effect = [token, MapiNetworkException("offline")]
+    mock_refresh.side_effect = MapiNetworkException("offline")
+    manager = TokenManager("key")
+    assert manager.get() == token
+    assert manager.get() == token
+    assert mock_refresh.call_count == 1
+    mock_refresh.side_effect = MapiProviderException("invalid token")
+    assert manager.get() == token  # logging in fails too
+    assert mock_login.call_count == 2
+
+
+@patch("mapi.auth.tvdb_refresh_token")
+@patch("mapi.auth.tvdb_login")
+def test_token_manager__expired_network_error(mock_login, mock_refresh):
+    mock_login.side_effect = [make_token(-60), MapiNetworkException("offline")]
+    manager = TokenManager("key")
+    manager.get()
+    with pytest.raises(MapiNetworkException):
+        manager.get()
+    assert mock_refresh.call_count == 0
+
+
+@patch("mapi.auth.tvdb_refresh_token")
+@patch("mapi.auth.tvdb_login")
+def test_token_manager__expired(mock_login, mock_refresh):
+    mock_login.side_effect = [make_token(-60), make_token(86400)]
+    manager = TokenManager("key")
+    manager.get()
+    assert manager.peek() == ""
+    manager.get()
+    assert mock_login.call_count == 2
+    assert mock_refresh.call_count == 0
+
+
+@patch("mapi.auth.tvdb_login")
+def test_token_manager__peek_in_memory(mock_login, token_path):
+    mock_login.return_value = make_token(REFRESH_MARGIN / 2)
+    manager = TokenManager("key", token_path)
+    token = manager.get()
+    with patch.object(manager, "_load") as mock_load:
+        assert manager.peek() == token
+    mock_load.assert_not_called()
+
+
+@patch("mapi.auth.tvdb_login")
+def test_token_manager__peek_expired_reloads(mock_login, token_path):
+    mock_login.side_effect = [make_token(-60), make_token(86400)]
+    manager = TokenManager("key", token_path)
+    manager.get()
+    token = TokenManager("key", token_path).get()  # e.g. another process
+    assert manager.peek() == token
+
+
+@patch("mapi.auth.tvdb_login")
+def test_token_manager__opaque_token(mock_login):
+    mock_login.return_value = "not a jwt"
+    manager = TokenManager("key")
+    assert manager.get() == "not a jwt"
+    assert manager.peek() == "not a jwt"
+
+
+@patch("mapi.auth.tvdb_login")
+def test_token_manager__invalidate(mock_login, token_path):
+    mock_login.return_value = make_token(86400)
+    manager = TokenManager("key", token_path)
+    token = manager.get()
+    manager.invalidate("stale token")
+    assert manager.peek() == token
+    manager.invalidate(token)
+    assert manager.peek() == ""
+    assert TokenManager("key", token_path).peek() == ""
+
+
+def test_get_token_manager(tmpdir):
+    with patch.dict("os.environ", {"MAPI_TOKEN_DIR": str(tmpdir)}):
+        with patch.dict(auth._managers, clear=True):
+            manager = get_token_manager("secret")
+            assert get_token_manager("secret") is manager
+            assert get_token_manager("other") is not manager
+    assert manager.path.startswith(str(tmpdir))
+    assert "secret" not in manager.path
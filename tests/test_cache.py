@@ -0,0 +1,379 @@
+# coding=utf-8
+
+"""Unit tests for mapi/cache.py."""
+
+from datetime import date, timedelta
+from fnmatch import fnmatch
+
+import pytest
+from mock import patch
+
+from mapi.cache import (
+    DEFAULT_TTL,
+    TTL_POLICY,
+    FileCache,
+    MemoryCache,
+    RedisCache,
+    SQLiteCache,
+    clear_series,
+    get_backend,
+    get_cache,
+    get_memo,
+    get_ttl,
+    make_key,
+    record_series,
+    set_cache,
+    set_memo,
+    set_ttl,
+)
+from mapi.exceptions import MapiException
+from mapi.utils import clear_cache, request_json
+from tests import MockRequestResponse
+
+
+class FakeRedis:
+    """Local stand-in implementing the subset of redis.Redis used by mapi."""
+
+    def __init__(self):
+        self.store = {}
+        self.expiry = {}
+
+    def get(self, name):
+        value = self.store.get(name)
+        return value.encode("utf-8") if value is not None else None
+
+    def set(self, name, value, ex=None):
+        self.store[name] = value
+        self.expiry[name] = ex
+
+    def ttl(self, name):
+        if name not in self.store:
+            return -2
+        ex = self.expiry.get(name)
+        return -1 if ex is None else ex
+
+    def delete(self, *names):
+        for name in names:
+            self.store.pop(name, None)
+
+    def scan_iter(self, match="*"):
+        return [k for k in list(self.store) if fnmatch(k, match)]
+
+
+@pytest.fixture(params=["memory", "sqlite", "filesystem", "redis"])
+def backend(request, tmpdir):
+    if request.param == "memory":
+        return MemoryCache()
+    elif request.param == "sqlite":
+        return SQLiteCache(str(tmpdir.join("cache.sqlite")))
+    elif request.param == "filesystem":
+        return FileCache(str(tmpdir.join("cache")))
+    return RedisCache(FakeRedis())
+
+
+def test_backend__get_missing(backend):
+    assert backend.get("missing") is None
+
+
+def test_backend__set_get(backend):
+    backend.set("key", [200, {"title": u"Amélie"}])
+    assert backend.get("key") == [200, {"title": u"Amélie"}]
+
+
+def test_backend__delete(backend):
+    backend.set("key", [200, {}])
+    backend.delete("key")
+    backend.delete("key")
+    assert backend.get("key") is None
+
+
+def test_backend__clear(backend):
+    backend.set("apple", [200, {}])
+    backend.set("orange", [200, {}])
+    backend.clear()
+    assert backend.get("apple") is None
+    assert backend.get("orange") is None
+
+
+def test_backend__get_with_ttl(backend):
+    assert backend.get_with_ttl("key") is None
+    backend.set("key", [200, {}], ttl=60)
+    value, ttl = backend.get_with_ttl("key")
+    assert value == [200, {}]
+    assert 50 < ttl <= 60
+
+
+def test_backend__expired(backend):
+    if isinstance(backend, RedisCache):
+        pytest.skip("expiry is delegated to the redis server")
+    backend.set("key", [200, {}], ttl=-1)
+    assert backend.get("key") is None
+
+
+def test_memory_cache__max_entries():
+    backend = MemoryCache(max_entries=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    backend.get("a")
+    backend.set("c", 3)
+    assert backend.get("a") == 1
+    assert backend.get("b") is None
+    assert backend.get("c") == 3
+
+
+def test_memory_cache__max_bytes():
+    backend = MemoryCache(max_bytes=20)
+    backend.set("a", "x" * 8)  # serializes to 10 bytes
+    backend.set("b", "x" * 8)
+    backend.set("c", "x" * 8)
+    assert backend.get("a") is None
+    assert backend.get("b") == "x" * 8
+    assert backend.stats()["bytes"] == 20
+    backend.set("d", "x" * 30)  # larger than max_bytes; not stored
+    assert backend.get("d") is None
+    assert backend.stats()["entries"] == 2
+
+
+def test_memory_cache__stats():
+    backend = MemoryCache()
+    backend.get("a")
+    backend.set("a", 1)
+    backend.get("a")
+    backend.get("a")
+    stats = backend.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_sqlite_cache__purge(tmpdir):
+    backend = SQLiteCache(str(tmpdir.join("cache.sqlite")), purge_interval=0)
+    backend.set("expired", [200, {}], ttl=-1)
+    backend.set("key", [200, {}])
+    rows = backend._connection.execute("SELECT key FROM mapi_responses")
+    assert [row[0] for row in rows] == ["key"]
+
+
+def test_sqlite_cache__purge_interval(tmpdir):
+    backend = SQLiteCache(str(tmpdir.join("cache.sqlite")))
+    backend.set("key", [200, {}])
+    backend.set("expired", [200, {}], ttl=-1)
+    with patch.object(backend, "purge") as mock_purge:
+        backend.set("key", [200, {}])
+    mock_purge.assert_not_called()
+
+
+def test_redis_cache__prefix():
+    client = FakeRedis()
+    client.set("other", "1")
+    backend = RedisCache(client, prefix="test:")
+    backend.set("key", [200, {}], ttl=60)
+    assert "test:key" in client.store
+    backend.clear()
+    assert client.store == {"other": "1"}
+
+
+@pytest.mark.parametrize("name", ["memory", "MEMORY", "sqlite", "filesystem"])
+def test_get_backend(name, tmpdir):
+    with patch.dict("os.environ", {"MAPI_CACHE_PATH": str(tmpdir)}):
+        assert get_backend(name)
+
+
+def test_get_backend__missing():
+    with pytest.raises(MapiException):
+        get_backend("yolo")
+
+
+def test_make_key():
+    key = make_key("get", "http://...", [("a", "1")])
+    assert key == make_key("GET", "http://...", [("a", "1")])
+    assert key != make_key("GET", "http://...", [("a", "2")])
+    assert key != make_key("GET", "http://...", [("a", "1")], language="fr")
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__backend(mock_request):
+    mock_request.return_value = MockRequestResponse(200, '{"status":true}')
+    backend = MemoryCache()
+    for _ in range(3):
+        status, content = request_json("http://...", cache=backend)
+        assert status == 200
+        assert content == {"status": True}
+    assert mock_request.call_count == 1
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__backend_errors_not_cached(mock_request):
+    mock_request.return_value = MockRequestResponse(404, "{}")
+    backend = MemoryCache()
+    request_json("http://...", cache=backend)
+    request_json("http://...", cache=backend)
+    assert mock_request.call_count == 2
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__cache_disabled(mock_request):
+    mock_request.return_value = MockRequestResponse(200, "{}")
+    with patch("mapi.utils.get_cache") as mock_get_cache:
+        request_json("http://...", cache=False)
+    mock_get_cache.assert_not_called()
+
+
+def test_get_ttl__lookup_vs_search():
+    assert get_ttl("tmdb_movies") > get_ttl("tmdb_search_movies")
+
+
+def test_get_ttl__unknown_endpoint():
+    assert get_ttl("yolo") == DEFAULT_TTL
+
+
+def test_get_ttl__airing_series():
+    continuing = {"data": {"status": "Continuing"}}
+    ended = {"data": {"status": "Ended"}}
+    assert get_ttl("tvdb_series_id", continuing) == TTL_POLICY["tvdb_airing"]
+    assert get_ttl("tvdb_series_id", ended) == TTL_POLICY["tvdb_series_id"]
+
+
+def test_get_ttl__airing_episodes():
+    recent = (date.today() - timedelta(days=3)).isoformat()
+    airing = {"data": [{"firstAired": "2001-01-01"}, {"firstAired": recent}]}
+    ended = {"data": [{"firstAired": "2001-01-01"}, {"firstAired": None}]}
+    endpoint = "tvdb_series_id_episodes_query"
+    assert get_ttl(endpoint, airing) == TTL_POLICY["tvdb_airing"]
+    assert get_ttl(endpoint, ended) == TTL_POLICY[endpoint]
+
+
+def test_get_ttl__airing_series_episodes():
+    old = {"data": [{"firstAired": "2001-01-01"}]}
+    endpoint = "tvdb_series_id_episodes"
+    # unknown series may be airing
+    assert get_ttl(endpoint, old, id_tvdb=1) == TTL_POLICY["tvdb_airing"]
+    record_series(1, {"data": {"status": "Continuing"}})
+    assert get_ttl(endpoint, old, id_tvdb=1) == TTL_POLICY["tvdb_airing"]
+    record_series("2", {"data": {"status": "Ended"}})
+    assert get_ttl(endpoint, old, id_tvdb=2) == TTL_POLICY[endpoint]
+
+
+def test_set_ttl():
+    initial = TTL_POLICY["omdb_title"]
+    try:
+        set_ttl("omdb_title", 10)
+        assert get_ttl("omdb_title") == 10
+        set_ttl("omdb_title", lambda content: content["ttl"])
+        assert get_ttl("omdb_title", {"ttl": 20}) == 20
+    finally:
+        set_ttl("omdb_title", initial)
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__ttl_callable(mock_request):
+    mock_request.return_value = MockRequestResponse(200, '{"ttl":-1}')
+    backend = MemoryCache()
+    request_json("http://...", cache=backend, ttl=lambda c: c["ttl"])
+    request_json("http://...", cache=backend, ttl=lambda c: c["ttl"])
+    assert mock_request.call_count == 2
+
+
+def test_request_json__invalid_cache():
+    with pytest.raises(MapiException):
+        request_json("http://...", cache="sqlite")
+
+
+@pytest.fixture
+def memo():
+    initial = get_memo()
+    memo = MemoryCache()
+    set_memo(memo)
+    yield memo
+    set_memo(initial)
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__memo(mock_request, memo, tmpdir):
+    mock_request.return_value = MockRequestResponse(200, '{"status":true}')
+    backend = FileCache(str(tmpdir))
+    with patch.object(
+        backend, "get_with_ttl", wraps=backend.get_with_ttl
+    ) as mock_get:
+        for _ in range(3):
+            _, content = request_json("http://...", cache=backend)
+            assert content == {"status": True}
+        assert mock_get.call_count == 1
+    assert mock_request.call_count == 1
+    assert memo.stats()["hits"] == 2
+
+
+@pytest.mark.parametrize("backend_type", ["memo", "memory"])
+@patch("mapi.utils.Session.request")
+def test_request_json__memo_copies(mock_request, memo, tmpdir, backend_type):
+    mock_request.return_value = MockRequestResponse(
+        200, '{"data": [{"id": 1}]}'
+    )
+    if backend_type == "memory":
+        backend = MemoryCache()
+    else:
+        backend = FileCache(str(tmpdir))
+    for _ in range(3):
+        _, content = request_json("http://...", cache=backend)
+        assert content == {"data": [{"id": 1}]}
+        content["data"][0]["id"] = 2  # mutating results doesn't affect others
+        content["data"].append(None)
+    assert mock_request.call_count == 1
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__memo_populated_from_backend(mock_request, memo, tmpdir):
+    backend = FileCache(str(tmpdir))
+    backend.set(make_key("GET", "http://..."), [200, {"cached": True}])
+    for _ in range(2):
+        _, content = request_json("http://...", cache=backend)
+        assert content == {"cached": True}
+    mock_request.assert_not_called()
+    assert memo.stats()["hits"] == 1
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__memo_remaining_ttl(mock_request, memo, tmpdir):
+    backend = FileCache(str(tmpdir))
+    key = make_key("GET", "http://...")
+    backend.set(key, [200, {"cached": True}], ttl=60)
+    request_json("http://...", cache=backend, ttl=DEFAULT_TTL)
+    _, ttl = memo.get_with_ttl(key)
+    assert 50 < ttl <= 60
+
+
+@patch("mapi.utils.Session.request")
+def test_clear_cache__memo(mock_request, memo, tmpdir):
+    mock_request.return_value = MockRequestResponse(200, "{}")
+    initial = get_cache()
+    set_cache(FileCache(str(tmpdir)))
+    try:
+        request_json("http://...")
+        clear_cache()
+        request_json("http://...")
+    finally:
+        set_cache(initial)
+    assert mock_request.call_count == 2
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__memo_disabled(mock_request, tmpdir):
+    initial = get_memo()
+    set_memo(None)
+    try:
+        mock_request.return_value = MockRequestResponse(200, "{}")
+        backend = FileCache(str(tmpdir))
+        request_json("http://...", cache=backend)
+        request_json("http://...", cache=backend)
+    finally:
+        set_memo(initial)
+    assert mock_request.call_count == 1
+
+
+def test_clear_series():
+    old = {"data": [{"firstAired": "2001-01-01"}]}
+    endpoint = "tvdb_series_id_episodes"
+    record_series(3, {"data": {"status": "Ended"}})
+    assert get_ttl(endpoint, old, id_tvdb=3) == TTL_POLICY[endpoint]
+    clear_series()
+    assert get_ttl(endpoint, old, id_tvdb=3) == TTL_POLICY["tvdb_airing"]
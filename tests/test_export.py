@@ -0,0 +1,163 @@
+# coding=utf-8
+
+"""Unit tests for mapi/export.py."""
+
+import csv
+import io
+import json
+import sys
+
+import pytest
+from mock import patch
+
+from mapi.compatibility import ustr
+from mapi.exceptions import MapiException
+from mapi.export import (
+    NULL,
+    DictionaryColumn,
+    export,
+    to_arrow,
+    to_columns,
+    write_csv,
+    write_json_lines,
+)
+from mapi.local import LocalStore
+from mapi.metadata import MetadataMovie, MetadataTelevision
+
+PY2 = sys.version_info < (3,)
+
+
+def results():
+    yield MetadataMovie(
+        title="The Goonies", date="1985-06-07", id_imdb="tt0089218"
+    )
+    for episode in (1, 2):
+        yield MetadataTelevision.from_provider(
+            series="Lost",
+            season="1",
+            episode=ustr(episode),
+            date="2004-09-22",
+            title="Pilot (%d)" % episode,
+            id_tvdb="73739",
+        )
+    yield MetadataTelevision(series=u"Más", season=0, title="Special")
+
+
+def test_to_columns():
+    table = to_columns(results())
+    assert list(table) == [
+        "media",
+        "series",
+        "season",
+        "episode",
+        "year",
+        "date",
+        "title",
+        "synopsis",
+        "id_imdb",
+        "id_tmdb",
+        "id_tvdb",
+    ]
+    assert table["season"].tolist() == [NULL, 1, 1, 0]
+    assert table["episode"].tolist() == [NULL, 1, 2, NULL]
+    assert table["year"].tolist() == [1985, 2004, 2004, NULL]
+    assert table["series"].codes.tolist() == [NULL, 0, 0, 1]
+    assert table["series"].values == ["Lost", u"Más"]
+    assert list(table["media"]) == ["movie"] + ["television"] * 3
+    assert table["title"] == [
+        "The Goonies",
+        "Pilot (1)",
+        "Pilot (2)",
+        "Special",
+    ]
+    assert table["id_tmdb"] == [None] * 4
+
+
+def test_to_columns__subset():
+    table = to_columns(results(), columns=("title", "episode"))
+    assert list(table) == ["title", "episode"]
+    assert len(table["title"]) == len(table["episode"]) == 4
+
+
+def test_to_columns__stringifies_ids():
+    table = to_columns([MetadataMovie.from_provider(title="Saw", id_tmdb=176)])
+    assert table["id_tmdb"] == ["176"]
+
+
+def test_to_columns__non_metadata():
+    with pytest.raises(MapiException):
+        to_columns([{"title": "The Goonies"}])
+
+
+def test_dictionary_column():
+    column = DictionaryColumn()
+    for value in ("a", None, "b", "a"):
+        column.append(value)
+    assert len(column) == 4
+    assert column.codes.tolist() == [0, NULL, 1, 0]
+    assert [column[i] for i in range(4)] == ["a", None, "b", "a"]
+
+
+@pytest.mark.skipif(PY2, reason="CSV requires python 3")
+def test_write_csv__local_store_import(tmpdir):
+    csv_path = str(tmpdir.join("results.csv"))
+    write_csv(to_columns(results()), csv_path)
+    with io.open(csv_path, "r", encoding="utf-8", newline="") as fp:
+        rows = list(csv.reader(fp))
+    assert len(rows) == 5
+    assert rows[2][:5] == ["television", "Lost", "1", "1", "2004"]
+    store = LocalStore(str(tmpdir.join("local.sqlite")))
+    assert store.import_csv(csv_path) == 4
+    assert list(store.search(id_imdb="tt0089218"))[0]["year"] == 1985
+
+
+def test_write_json_lines(tmpdir):
+    json_path = str(tmpdir.join("results.jsonl"))
+    write_json_lines(to_columns(results()), json_path)
+    with io.open(json_path, "r", encoding="utf-8") as fp:
+        entries = [json.loads(line) for line in fp]
+    assert entries[0] == {
+        "media": "movie",
+        "year": 1985,
+        "date": "1985-06-07",
+        "title": "The Goonies",
+        "id_imdb": "tt0089218",
+    }
+    assert entries[3]["series"] == u"Más"
+    assert entries[3]["season"] == 0
+
+
+@pytest.mark.parametrize(
+    "extension",
+    [
+        pytest.param(
+            "csv",
+            marks=pytest.mark.skipif(PY2, reason="CSV requires python 3"),
+        ),
+        "jsonl",
+    ],
+)
+def test_export(tmpdir, extension):
+    file_path = str(tmpdir.join("results." + extension))
+    assert export(results(), file_path) == 4
+    assert tmpdir.join("results." + extension).check()
+
+
+def test_export__unknown_format(tmpdir):
+    with pytest.raises(MapiException):
+        export(results(), str(tmpdir.join("results.xlsx")))
+
+
+def test_to_arrow():
+    pyarrow = pytest.importorskip("pyarrow")
+    table = to_arrow(to_columns(results()))
+    assert table.num_rows == 4
+    assert table.column("season").to_pylist() == [None, 1, 1, 0]
+    assert pyarrow.types.is_dictionary(table.schema.field("series").type)
+    assert table.column("series").to_pylist() == [None, "Lost", "Lost", u"Más"]
+
+
+def test_to_arrow__missing_pyarrow():
+    with patch.dict(sys.modules, {"pyarrow": None}):
+        with pytest.raises(MapiException):
+            to_arrow(to_columns(results()))
@@ -0,0 +1,184 @@
+# coding=utf-8
+
+"""Unit tests for mapi/index.py."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from mock import patch
+
+from mapi import index
+from mapi.exceptions import MapiNotFoundException
+from mapi.index import SeriesIndex, get_index
+
+
+def mock_series(token, id_tvdb, **kwargs):
+    return {"data": {"seriesName": "Series %s" % id_tvdb}}
+
+
+def mock_episodes(token, id_tvdb, page=1, **kwargs):
+    entries = [
+        {
+            "airedSeason": page,
+            "airedEpisodeNumber": i,
+            "firstAired": "2001-%02d-%02d" % (page, i),
+            "episodeName": "Episode %d" % i,
+            "overview": "Overview\r\n",
+        }
+        for i in range(1, 4)
+    ]
+    return {"data": entries, "links": {"last": 3}}
+
+
+@pytest.fixture
+def mock_endpoints():
+    with patch("mapi.index.tvdb_series_id") as mock_series_id, patch(
+        "mapi.index.tvdb_series_id_episodes"
+    ) as mock_series_episodes, patch.dict(index._indexes, clear=True):
+        mock_series_id.side_effect = mock_series
+        mock_series_episodes.side_effect = mock_episodes
+        yield mock_series_id, mock_series_episodes
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_series_index__fetch(mock_endpoints, concurrency):
+    series_index = SeriesIndex.fetch("token", 1, concurrency=concurrency)
+    assert len(series_index) == 9
+    assert series_index.series == "Series 1"
+    assert mock_endpoints[1].call_count == 3
+
+
+def test_series_index__search_season_episode(mock_endpoints):
+    series_index = SeriesIndex.fetch("token", 1)
+    results = list(series_index.search("2", 3))
+    assert len(results) == 1
+    assert results[0]["season"] == 2
+    assert results[0]["episode"] == 3
+    assert results[0]["date"] == "2001-02-03"
+    assert results[0]["synopsis"] == "Overview"
+    assert results[0]["id_tvdb"] == "1"
+
+
+@pytest.mark.parametrize(
+    "season, episode, expected",
+    [(None, None, 9), (2, None, 3), (None, 2, 3), ("1", "1", 1)],
+)
+def test_series_index__search(mock_endpoints, season, episode, expected):
+    series_index = SeriesIndex.fetch("token", 1)
+    results = list(series_index.search(season, episode))
+    assert len(results) == expected
+
+
+@pytest.mark.parametrize("season, episode", [(4, 1), (1, 4), (9, None)])
+def test_series_index__search_missing(mock_endpoints, season, episode):
+    series_index = SeriesIndex.fetch("token", 1)
+    with pytest.raises(MapiNotFoundException):
+        list(series_index.search(season, episode))
+
+
+def test_series_index__skips_invalid():
+    entries = [
+        {
+            "airedSeason": 1,
+            "airedEpisodeNumber": i,
+            "firstAired": date,
+            "episodeName": name,
+            "overview": None,
+        }
+        for i, (date, name) in enumerate(
+            [("2001-01-01", "Pilot"), ("", "Unaired"), ("", None)], 1
+        )
+    ]
+    series_index = SeriesIndex(1, "Series", entries)
+    assert len(series_index) == 2
+    assert [r["title"] for r in series_index.search(1)] == ["Pilot"]
+
+
+@pytest.mark.parametrize(
+    "date, expected",
+    [
+        ("2001-03-02", [(3, 2)]),
+        ("2001-02", [(2, 1), (2, 2), (2, 3)]),
+        ("2001", [(s, e) for s in range(1, 4) for e in range(1, 4)]),
+    ],
+)
+def test_series_index__on_date(mock_endpoints, date, expected):
+    series_index = SeriesIndex.fetch("token", 1)
+    results = list(series_index.on_date(date))
+    assert [(r["season"], r["episode"]) for r in results] == expected
+
+
+@pytest.mark.parametrize("date", ["2002-01-01", "2001-04", "2000", "13"])
+def test_series_index__on_date_missing(mock_endpoints, date):
+    series_index = SeriesIndex.fetch("token", 1)
+    with pytest.raises(MapiNotFoundException):
+        list(series_index.on_date(date))
+
+
+def test_series_index__on_date_order():
+    # listed order is kept even when air dates are out of order
+    entries = [
+        {
+            "airedSeason": 1,
+            "airedEpisodeNumber": i,
+            "firstAired": date,
+            "episodeName": "Episode %d" % i,
+            "overview": None,
+        }
+        for i, date in enumerate(["2001-01-09", "2001-01-02", "2001-02-01"], 1)
+    ]
+    series_index = SeriesIndex(1, "Series", entries)
+    results = list(series_index.on_date("2001-01"))
+    assert [r["episode"] for r in results] == [1, 2]
+
+
+def test_series_index__on_date_only_builds_matches(mock_endpoints):
+    series_index = SeriesIndex.fetch("token", 1)
+    with patch(
+        "mapi.index.MetadataTelevision", wraps=index.MetadataTelevision
+    ) as mock_metadata:
+        list(series_index.on_date("2001-02-02"))
+    assert mock_metadata.from_provider.call_count == 1
+
+
+def test_get_index__shared(mock_endpoints):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        indexes = set(
+            executor.map(lambda _: get_index("token", 1, 60), range(8))
+        )
+    assert len(indexes) == 1
+    assert mock_endpoints[0].call_count == 1
+    assert get_index("token", "1", 60) in indexes
+
+
+def test_get_index__stale(mock_endpoints):
+    series_index = get_index("token", 1, 60)
+    series_index.built -= 120
+    assert get_index("token", 1, 60) is not series_index
+    assert mock_endpoints[0].call_count == 2
+
+
+def test_get_index__evicted(mock_endpoints):
+    with patch("mapi.index.INDEX_MAX_SERIES", 2):
+        first = get_index("token", 1, 60)
+        get_index("token", 2, 60)
+        get_index("token", 1, 60)  # most recently used
+        get_index("token", 3, 60)
+    assert list(index._indexes) == [("1", "en"), ("3", "en")]
+    assert get_index("token", 1, 60) is first
+
+
+def test_get_index__build_locks_released(mock_endpoints):
+    get_index("token", 1, 60)
+    mock_endpoints[0].side_effect = MapiNotFoundException
+    with pytest.raises(MapiNotFoundException):
+        get_index("token", 2, 60)
+    assert index._build_locks == {}
+
+
+def test_get_index__fresh_without_build_lock(mock_endpoints):
+    series_index = get_index("token", 1, 60)
+    with patch.dict(index._build_locks, clear=True):
+        with patch("mapi.index.threading.Lock") as mock_lock:
+            assert get_index("token", 1, 60) is series_index
+    mock_lock.assert_not_called()
@@ -0,0 +1,244 @@
+# coding=utf-8
+
+"""Unit tests for mapi/local.py."""
+
+import io
+import json
+import sys
+
+import pytest
+from mock import MagicMock, patch
+
+from mapi.compatibility import ustr
+from mapi.exceptions import (
+    MapiException,
+    MapiNotFoundException,
+    MapiProviderException,
+)
+from mapi.local import LocalProvider, LocalStore
+from mapi.metadata import MetadataMovie, MetadataTelevision
+from mapi.providers import TMDb, TVDb
+from tests import JUNK_TEXT, MOVIE_META, TELEVISION_META
+
+
+@pytest.fixture
+def store(tmpdir):
+    return LocalStore(str(tmpdir.join("local.sqlite")))
+
+
+@pytest.fixture
+def populated_store(store):
+    store.add(
+        MetadataMovie(
+            title=meta["title"],
+            date="%s-01-01" % meta["year"],
+            id_imdb=meta["id_imdb"],
+        )
+        for meta in MOVIE_META
+    )
+    store.add(
+        MetadataTelevision(
+            series="Rick and Morty",
+            season=season,
+            episode=episode,
+            date="2015-%02d-%02d" % (7 + int(season), episode),
+            title="Episode %d" % episode,
+            id_tvdb="275274",
+        )
+        for season in ("1", "2")
+        for episode in range(1, 11)
+    )
+    return store
+
+
+def test_local_store__add(store):
+    assert store.add([{"title": "The Goonies", "id_tmdb": 9340}]) == 1
+    assert store.add([{"title": "The Goonies", "id_tmdb": "9340"}]) == 1
+    assert len(store) == 1
+    store.clear()
+    assert len(store) == 0
+
+
+@pytest.mark.parametrize("meta", MOVIE_META)
+def test_local_store__search_id_imdb(populated_store, meta):
+    results = list(populated_store.search("movie", id_imdb=meta["id_imdb"]))
+    assert len(results) == 1
+    assert results[0]["title"] == meta["title"]
+    assert results[0]["year"] == int(meta["year"])
+    assert results[0]["media"] == "movie"
+
+
+@pytest.mark.parametrize(
+    "title, year, expected",
+    [
+        ("the goonies", None, 1),
+        ("THE", None, 2),
+        ("the", "1980-", 1),
+        ("the", 1939, 1),
+        ("Goonies", None, 0),
+        ("The Goonies 2", None, 0),
+    ],
+)
+def test_local_store__search_title(populated_store, title, year, expected):
+    results = list(populated_store.search("movie", title=title, year=year))
+    assert len(results) == expected
+
+
+@pytest.mark.parametrize(
+    "parameters, expected",
+    [
+        ({"id_tvdb": 275274}, 20),
+        ({"id_tvdb": "275274", "season": 2}, 10),
+        ({"series": "rick and morty", "season": "1", "episode": "3"}, 1),
+        ({"series": "Rick", "date": "2015-09"}, 10),
+        ({"series": "Rick", "date": "2015-09-04"}, 1),
+        ({"series": "Rick", "title": "Episode 1"}, 20),  # title ignored
+        ({"season": 1}, 0),  # nothing identifying
+    ],
+)
+def test_local_store__search_television(populated_store, parameters, expected):
+    results = list(populated_store.search("television", **parameters))
+    assert len(results) == expected
+    for result in results:
+        assert result["media"] == "television"
+        assert result["series"] == "Rick and Morty"
+
+
+def test_local_store__search_television_order(populated_store):
+    results = list(populated_store.search("television", id_tvdb=275274))
+    assert [(r["season"], r["episode"]) for r in results] == [
+        (s, e) for s in (1, 2) for e in range(1, 11)
+    ]
+
+
+def test_local_store__import_json(store, tmpdir):
+    json_path = str(tmpdir.join("dump.json"))
+    with io.open(json_path, "w", encoding="utf-8") as fp:
+        fp.write(ustr(json.dumps(TELEVISION_META)))
+    assert store.import_json(json_path) == len(TELEVISION_META)
+    results = list(store.search(id_tvdb="81189"))
+    assert results[0]["title"] == u"Más"
+
+
+def test_local_store__import_json_lines(store, tmpdir):
+    json_path = str(tmpdir.join("dump.jsonl"))
+    with io.open(json_path, "w", encoding="utf-8") as fp:
+        for meta in MOVIE_META:
+            fp.write(ustr(json.dumps(meta)) + u"\n")
+    assert store.import_json(json_path) == len(MOVIE_META)
+    results = list(store.search(title=u"amélie"))
+    assert results[0]["id_tmdb"] == "194"
+
+
+@pytest.mark.skipif(sys.version_info < (3,), reason="CSV requires python 3")
+def test_local_store__import_csv(store, tmpdir):
+    csv_path = str(tmpdir.join("dump.csv"))
+    with io.open(csv_path, "w", encoding="utf-8") as fp:
+        fp.write(u"media,series,season,episode,date,title,id_tvdb\n")
+        fp.write(u"television,Lost,1,1,2004-09-22,Pilot (1),73739\n")
+        fp.write(u"television,Lost,1,2,2004-09-22,Pilot (2),73739\n")
+    assert store.import_csv(csv_path) == 2
+    results = list(store.search("television", id_tvdb=73739, episode=2))
+    assert results[0]["title"] == "Pilot (2)"
+    assert results[0]["season"] == 1
+
+
+def test_local_provider__hit(populated_store):
+    remote = MagicMock(spec=TVDb)
+    client = LocalProvider(store=populated_store, provider=remote)
+    results = list(client.search("275274", season=1, episode=1))
+    assert len(results) == 1
+    assert remote.search.call_count == 0
+
+
+def test_local_provider__miss_write_through(store):
+    remote = MagicMock(spec=TMDb)
+    remote.search.return_value = iter(
+        [MetadataMovie(title="The Goonies", date="1985-06-07", id_tmdb="9340")]
+    )
+    client = LocalProvider(store=store, provider=remote)
+    results = list(client.search("9340"))
+    assert results[0]["title"] == "The Goonies"
+    remote.search.assert_called_once_with(id_tmdb="9340")
+    results = list(client.search("9340"))
+    assert results[0]["title"] == "The Goonies"
+    assert remote.search.call_count == 1
+
+
+def test_local_provider__partial_hit(populated_store):
+    # a single episode doesn't answer a search for the whole season
+    remote = MagicMock(spec=TVDb)
+    remote.search.return_value = iter([])
+    client = LocalProvider(store=populated_store, provider=remote)
+    list(client.search("275274", season=1))
+    remote.search.assert_called_once_with(id_tvdb="275274", season=1)
+
+
+def test_local_provider__complete_query(store):
+    remote = MagicMock(spec=TMDb)
+    remote.search.return_value = iter(
+        [MetadataMovie(title="Saw %s" % i, id_tmdb=i) for i in range(1, 4)]
+    )
+    client = LocalProvider(store=store, provider=remote)
+    assert len(list(client.search(title="Saw"))) == 3
+    assert len(list(client.search(title="SAW"))) == 3
+    with pytest.raises(MapiNotFoundException):  # narrower query, no remote
+        next(client.search(title="Saw", year=2004))
+    assert remote.search.call_count == 1
+    assert not store.is_complete("movie", title="Sa")
+
+
+def test_local_provider__miss_no_write_through(store):
+    remote = MagicMock(spec=TMDb)
+    remote.search.return_value = iter([MetadataMovie(title="Saw", id_tmdb=1)])
+    client = LocalProvider(store=store, provider=remote, write_through=False)
+    list(client.search(title="Saw"))
+    assert len(store) == 0
+
+
+def test_local_store__add_invalid(store):
+    with pytest.raises(MapiException):
+        store.add([{"title": "Saw", "id_tmdb": 1}, {"date": "2004-13-01"}])
+    with pytest.raises(MapiException):
+        store.add([{"title": "Saw", "season": "one"}])
+    assert len(store) == 0
+
+
+def test_local_provider__miss_partial(store):
+    # only results consumed before the search is closed are written through
+    remote = MagicMock(spec=TMDb)
+    remote.search.return_value = iter(
+        [MetadataMovie(title="Saw %s" % i, id_tmdb=i) for i in range(5)]
+    )
+    client = LocalProvider(store=store, provider=remote)
+    results = client.search(title="Saw")
+    next(results)
+    results.close()
+    assert len(store) == 1
+
+
+def test_local_provider__not_found(store):
+    client = LocalProvider(store=store)
+    with pytest.raises(MapiNotFoundException):
+        next(client.search(title="Saw"))
+    with pytest.raises(MapiProviderException):
+        next(client.search("9340"))
+
+
+def test_local_provider__provider_name(store):
+    client = LocalProvider(store=store, provider="tmdb", api_key=JUNK_TEXT)
+    assert isinstance(client.provider, TMDb)
+
+
+@pytest.mark.parametrize("provider", [None, "tvdb"])
+def test_local_provider__pool_options(store, provider):
+    with patch("mapi.providers.mount_adapter") as mock_mount:
+        client = LocalProvider(
+            store=store, provider=provider, api_key=JUNK_TEXT, pool_maxsize=4
+        )
+    if provider:
+        mock_mount.assert_called_once_with(
+            client.provider.host, pool_maxsize=4, pool_block=False
+        )
+    else:
+        mock_mount.assert_not_called()
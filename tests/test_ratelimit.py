@@ -0,0 +1,156 @@
+# coding=utf-8
+
+"""Unit tests for mapi/ratelimit.py."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from mock import patch
+
+from mapi.cache import MemoryCache
+from mapi.ratelimit import (
+    RATE_LIMITS,
+    FileTokenBucket,
+    TokenBucket,
+    get_limiter,
+    set_rate_limit,
+)
+from mapi.utils import request_json
+from tests import MockRequestResponse
+
+
+@pytest.fixture
+def rate_limits():
+    """Restores the default rate limits after a test."""
+    defaults = dict(RATE_LIMITS)
+    yield RATE_LIMITS
+    for provider in set(RATE_LIMITS) | set(defaults):
+        set_rate_limit(provider, *defaults.get(provider, (None,)))
+
+
+def test_token_bucket__burst():
+    bucket = TokenBucket(2, 10)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(5, abs=0.1)
+    assert bucket.reserve() == pytest.approx(10, abs=0.1)
+
+
+def test_token_bucket__refill():
+    with patch("mapi.ratelimit._clock") as mock_clock:
+        mock_clock.return_value = 0
+        bucket = TokenBucket(2, 10)
+        bucket.reserve(2)
+        mock_clock.return_value = 5
+        assert bucket.reserve() == 0
+        mock_clock.return_value = 100
+        assert bucket.reserve(2) == 0  # capped to capacity
+        assert bucket.reserve() == pytest.approx(5)
+
+
+def test_token_bucket__threads():
+    bucket = TokenBucket(10, 1)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        waits = sorted(executor.map(lambda _: bucket.reserve(), range(20)))
+    assert waits[:10] == [0] * 10
+    assert waits[-1] == pytest.approx(1, abs=0.1)
+
+
+@patch("mapi.ratelimit.time.sleep")
+def test_rate_limiter__acquire(mock_sleep):
+    bucket = TokenBucket(1, 10)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(10, abs=0.1)
+    mock_sleep.assert_called_once()
+
+
+def test_file_token_bucket__shared(tmpdir):
+    file_path = str(tmpdir.join("bucket.json"))
+    first = FileTokenBucket(file_path, 2, 10)
+    second = FileTokenBucket(file_path, 2, 10)
+    assert first.reserve() == 0
+    assert second.reserve() == 0
+    assert first.reserve() == pytest.approx(5, abs=0.1)
+
+
+def test_get_limiter__per_key(rate_limits):
+    set_rate_limit("tmdb", 40, 10)
+    limiter = get_limiter("tmdb", "key")
+    assert get_limiter("tmdb", "key") is limiter
+    assert get_limiter("tmdb", "other key") is not limiter
+
+
+def test_get_limiter__unlimited(rate_limits):
+    set_rate_limit("tmdb", None)
+    assert get_limiter("tmdb", "key") is None
+    assert get_limiter("tvdb") is None
+
+
+def test_get_limiter__file(rate_limits, tmpdir):
+    set_rate_limit("tmdb", 40, 10)
+    with patch.dict("os.environ", {"MAPI_RATE_LIMIT_DIR": str(tmpdir)}):
+        set_rate_limit("tmdb", 50, 10)  # discards existing limiters
+        limiter = get_limiter("tmdb", "secret")
+    assert isinstance(limiter, FileTokenBucket)
+    assert "secret" not in limiter.path
+
+
+def test_set_rate_limit__resets(rate_limits):
+    set_rate_limit("omdb", 1, 10)
+    limiter = get_limiter("omdb", "key")
+    set_rate_limit("omdb", 1, 10)
+    assert get_limiter("omdb", "key") is limiter
+    set_rate_limit("omdb", 2, 10)
+    assert get_limiter("omdb", "key") is not limiter
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__limiter_cache_miss_only(mock_request):
+    mock_request.return_value = MockRequestResponse(200, '{"status":true}')
+    bucket = TokenBucket(1, 60)
+    cache = MemoryCache()
+    with patch.object(bucket, "acquire") as mock_acquire:
+        request_json("http://...", cache=cache, limiter=bucket)
+        request_json("http://...", cache=cache, limiter=bucket)
+    assert mock_acquire.call_count == 1
+
+
+def test_get_limiter__limit(rate_limits):
+    set_rate_limit("tmdb", 40, 10)
+    limiter = get_limiter("tmdb", "key", (5, 1))
+    assert limiter is not get_limiter("tmdb", "key")
+    assert get_limiter("tmdb", "key", (5, 1)) is limiter
+    assert limiter.rate == 5
+
+
+def test_get_limiter__omdb_default():
+    assert get_limiter("omdb", "key") is None
+
+
+def test_provider__rate_limit_option(rate_limits):
+    from mapi.providers import OMDb
+
+    defaults = dict(rate_limits)
+    client = OMDb(api_key="key", rate_limit=(5, 1))
+    assert client.limiter is get_limiter("omdb", "key", (5, 1))
+    assert client.limiter is not get_limiter("omdb", "key")
+    assert OMDb(api_key="key").limiter is None
+    assert OMDb(api_key="key", rate_limit=None).limiter is False
+    # scoped to the provider rather than changing the defaults
+    assert rate_limits == defaults
+
+
+@patch("mapi.endpoints.request_json")
+def test_endpoint__limiter(mock_request_json):
+    from mapi.endpoints import omdb_search
+
+    mock_request_json.return_value = 200, {"totalResults": "1"}
+    bucket = TokenBucket(1, 1)
+    omdb_search("key", "query", limiter=bucket)
+    assert mock_request_json.call_args[1]["limiter"] is bucket
+    omdb_search("key", "query", limiter=False)
+    assert mock_request_json.call_args[1]["limiter"] is None
+    omdb_search("key", "query")
+    assert mock_request_json.call_args[1]["limiter"] is get_limiter(
+        "omdb", "key"
+    )
@@ -2,16 +2,47 @@
 
 """Unit tests for mapi/utils.py."""
 
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from threading import Event, current_thread
+from time import sleep, time
+
 import pytest
 from mock import patch
 from requests import Session
-
-from mapi.utils import AGENT_ALL, clean_dict, d2l, get_user_agent, request_json
+from requests.exceptions import ConnectTimeout
+
+from mapi.cache import MemoryCache, SQLiteCache, get_memo, set_memo
+from mapi.exceptions import MapiNetworkException
+from mapi.utils import (
+    AGENT_ALL,
+    DEFAULT_RETRY_POLICY,
+    RetryPolicy,
+    clean_dict,
+    d2l,
+    get_user_agent,
+    get_retry_policy,
+    get_session,
+    imap_ordered,
+    WorkerPool,
+    mount_adapter,
+    request_json,
+    set_retry_policy,
+    unmount_adapter,
+)
 from tests import MockRequestResponse
+from tests.stub_server import StubServer
+
+
+@pytest.fixture(autouse=True)
+def mock_sleep():
+    """Skips retry backoff delays."""
+    with patch("mapi.utils.sleep") as mock_sleep:
+        yield mock_sleep
 
 
 @pytest.mark.parametrize("code", [200, 201, 209, 400, 500])
-@patch("mapi.utils.requests_cache.CachedSession.request")
+@patch("mapi.utils.Session.request")
 def test_request_json__status(mock_request, code):
     mock_response = MockRequestResponse(code, "{}")
     mock_request.return_value = mock_response
@@ -22,7 +53,7 @@ def test_request_json__status(mock_request, code):
 @pytest.mark.parametrize(
     "code, truthy", [(200, True), (299, True), (400, False), (500, False)]
 )
-@patch("mapi.utils.requests_cache.CachedSession.request")
+@patch("mapi.utils.Session.request")
 def test_request_json__data(mock_request, code, truthy):
     mock_response = MockRequestResponse(code, '{"status":true}')
     mock_request.return_value = mock_response
@@ -30,7 +61,7 @@ def test_request_json__data(mock_request, code, truthy):
     assert content if truthy else not content
 
 
-@patch("mapi.utils.requests_cache.CachedSession.request")
+@patch("mapi.utils.Session.request")
 def test_request_json__json_data(mock_request):
     json_data = """{
         "status": true,
@@ -51,7 +82,7 @@ def test_request_json__json_data(mock_request):
     assert content == json_dict
 
 
-@patch("mapi.utils.requests_cache.CachedSession.request")
+@patch("mapi.utils.Session.request")
 def test_request_json__xml_data(mock_request):
     xml_data = """
         <?xml version="1.0" encoding="UTF-8" ?>
@@ -70,7 +101,7 @@ def test_request_json__xml_data(mock_request):
     assert content is None
 
 
-@patch("mapi.utils.requests_cache.CachedSession.request")
+@patch("mapi.utils.Session.request")
 def test_request_json__html_data(mock_request):
     html_data = """
         <!DOCTYPE html>
@@ -92,7 +123,7 @@ def test_request_json__html_data(mock_request):
     assert content is None
 
 
-@patch("mapi.utils.requests_cache.CachedSession.request")
+@patch("mapi.utils.Session.request")
 def test_request_json__get_headers(mock_request):
     mock_request.side_effect = Session().request
     request_json(
@@ -105,7 +136,7 @@ def test_request_json__get_headers(mock_request):
     assert "user-agent" in kwargs["headers"]
 
 
-@patch("mapi.utils.requests_cache.CachedSession.request")
+@patch("mapi.utils.Session.request")
 def test_request_json__get_parameters(mock_request):
     test_parameters = {"apple": "pie"}
     mock_request.side_effect = Session().request
@@ -121,7 +152,7 @@ def test_request_json__get_invalid_url():
     assert content is None
 
 
-@patch("mapi.utils.requests_cache.CachedSession.request")
+@patch("mapi.utils.Session.request")
 def test_request_json__post_body(mock_request):
     data = {"apple": "pie"}
     mock_request.side_effect = Session().request
@@ -131,7 +162,7 @@ def test_request_json__post_body(mock_request):
     assert data == kwargs["json"]
 
 
-@patch("mapi.utils.requests_cache.CachedSession.request")
+@patch("mapi.utils.Session.request")
 def test_request_json__post_parameters(mock_request):
     mock_request.side_effect = Session().request
     data = {"apple": "pie", "orange": None}
@@ -141,7 +172,7 @@ def test_request_json__post_parameters(mock_request):
     assert kwargs["params"] == d2l(clean_dict(data))
 
 
-@patch("mapi.utils.requests_cache.CachedSession.request")
+@patch("mapi.utils.Session.request")
 def test_request_json__post_headers(mock_request):
     mock_request.side_effect = Session().request
     data = {"apple": "pie", "orange": None}
@@ -152,7 +183,7 @@ def test_request_json__post_headers(mock_request):
     assert "orange" not in kwargs["headers"]
 
 
-@patch("mapi.utils.requests_cache.CachedSession.request")
+@patch("mapi.utils.Session.request")
 def test_request_json__failure(mock_request):
     mock_request.side_effect = Exception
     status, content = request_json(url="http://google.com")
@@ -225,3 +256,329 @@ def test_get_user_agent__explicit(platform):
 def test_get_user_agent__random():
     for _ in range(10):
         assert get_user_agent(get_user_agent()) in AGENT_ALL
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_imap_ordered__order(workers):
+    results = imap_ordered(lambda x: x * 2, range(10), workers)
+    assert list(results) == [x * 2 for x in range(10)]
+
+
+def test_imap_ordered__concurrent():
+    # each call blocks until all four have started; deadlocks if serial
+    started = []
+    ready = Event()
+
+    def function(x):
+        started.append(x)
+        if len(started) == 4:
+            ready.set()
+        assert ready.wait(5)
+        return x
+
+    assert list(imap_ordered(function, range(4), workers=4)) == [0, 1, 2, 3]
+
+
+def test_imap_ordered__exception():
+    def function(x):
+        if x == 2:
+            raise ValueError
+        return x
+
+    results = imap_ordered(function, range(4), workers=2)
+    assert next(results) == 0
+    assert next(results) == 1
+    with pytest.raises(ValueError):
+        next(results)
+
+
+def test_worker_pool__nested():
+    # nested maps share the pool's threads rather than starting their own
+    pool = WorkerPool(3)
+    threads = set()
+
+    def inner(x):
+        threads.add(current_thread())
+        sleep(0.001)
+        return x
+
+    def outer(x):
+        return sum(pool.imap_ordered(inner, range(x * 10, x * 10 + 10)))
+
+    results = list(pool.imap_ordered(outer, range(6)))
+    assert results == [sum(range(x * 10, x * 10 + 10)) for x in range(6)]
+    assert len(threads - {current_thread()}) <= 3
+    pool.shutdown()
+
+
+def test_worker_pool__lazy():
+    # items are only consumed as threads become free
+    consumed = []
+    release = Event()
+
+    def items():
+        for x in range(100):
+            consumed.append(x)
+            yield x
+
+    def function(x):
+        assert x == 0 or release.wait(5)
+        return x
+
+    results = WorkerPool(4).imap_ordered(function, items())
+    assert next(results) == 0
+    assert len(consumed) <= 5
+    release.set()
+    assert list(results) == list(range(1, 100))
+
+
+@pytest.mark.parametrize("backend_type", ["memory", "sqlite"])
+def test_request_json__thread_safety(backend_type, tmpdir):
+    # mixes cached and uncached calls for the same urls across many threads
+    if backend_type == "memory":
+        backend = MemoryCache()
+    else:
+        backend = SQLiteCache(str(tmpdir.join("cache.sqlite")))
+    initial_memo = get_memo()
+    set_memo(None)
+    try:
+        with StubServer() as server:
+            paths = ["/item/%d" % i for i in range(10)]
+            for path in paths:  # warm the cache
+                request_json(server.url + path, cache=backend)
+            server.hits.clear()
+
+            def call(i):
+                path = paths[i % len(paths)]
+                cache = backend if (i // len(paths)) % 2 else False
+                status, content = request_json(server.url + path, cache=cache)
+                return path, status, content
+
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                results = list(executor.map(call, range(400)))
+    finally:
+        set_memo(initial_memo)
+    for path, status, content in results:
+        assert status == 200
+        assert content == {"path": path}
+    # only uncached calls may reach the server
+    assert sum(server.hits.values()) == 200
+    assert all(server.hits[path] == 20 for path in paths)
+
+
+@pytest.fixture
+def example_prefix():
+    yield "https://api.example.org"
+    unmount_adapter("https://api.example.org")
+
+
+def test_mount_adapter(example_prefix):
+    adapter = mount_adapter(example_prefix, 4, True)
+    session = get_session()
+    assert session.get_adapter("https://api.example.org/x") is adapter
+    assert session.get_adapter("https://example.org/x") is not adapter
+    assert adapter._pool_maxsize == 4
+    assert adapter._pool_block is True
+
+
+def test_mount_adapter__reused(example_prefix):
+    adapter = mount_adapter(example_prefix, 4, True)
+    assert mount_adapter(example_prefix, 4, True) is adapter
+
+
+def test_mount_adapter__replaced(example_prefix):
+    adapter = mount_adapter(example_prefix, 4, True)
+    with patch.object(adapter, "close") as mock_close:
+        replacement = mount_adapter(example_prefix, 8, True)
+    mock_close.assert_called_once_with()
+    assert replacement is not adapter
+    assert get_session().get_adapter(example_prefix + "/x") is replacement
+
+
+def test_unmount_adapter(example_prefix):
+    default = get_session().get_adapter(example_prefix + "/x")
+    adapter = mount_adapter(example_prefix, 4, True)
+    with patch.object(adapter, "close") as mock_close:
+        unmount_adapter(example_prefix)
+    mock_close.assert_called_once_with()
+    assert get_session().get_adapter(example_prefix + "/x") is default
+
+
+def test_unmount_adapter__default():
+    default = get_session().get_adapter("https://example.org/x")
+    unmount_adapter("https://")
+    assert get_session().get_adapter("https://example.org/x") is default
+
+
+def test_mount_adapter__connection_reuse():
+    with StubServer() as server:
+        mount_adapter(server.url, pool_maxsize=4, pool_block=True)
+        urls = ["%s/item/%d" % (server.url, i) for i in range(100)]
+        try:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(lambda u: request_json(u, cache=False), urls))
+        finally:
+            unmount_adapter(server.url)
+    assert sum(server.hits.values()) == 100
+    assert server.connections <= 4
+
+
+def test_retry_policy__delay_jitter():
+    policy = RetryPolicy(backoff=1, backoff_max=5)
+    for attempt in range(6):
+        for _ in range(20):
+            assert 0 <= policy.delay(attempt) <= min(2**attempt, 5)
+
+
+@pytest.mark.parametrize("retry_after", ["7", 7])
+def test_retry_policy__delay_retry_after_seconds(retry_after):
+    assert RetryPolicy().delay(0, retry_after) == 7
+
+
+def test_retry_policy__delay_retry_after_date():
+    retry_after = formatdate(time() + 10, usegmt=True)
+    assert 8 <= RetryPolicy().delay(0, retry_after) <= 10
+
+
+def test_retry_policy__delay_retry_after_capped():
+    assert RetryPolicy(backoff_max=5).delay(0, "3600") == 5
+
+
+def test_retry_policy__timeout():
+    policy = RetryPolicy(connect_timeout=1, read_timeout=2, read_timeout_max=5)
+    assert policy.timeout(0) == (1, 2)
+    assert policy.timeout(1) == (1, 4)
+    assert policy.timeout(2) == (1, 5)
+
+
+def test_set_retry_policy():
+    policy = RetryPolicy(retries=0)
+    set_retry_policy("https://api.example.net", policy)
+    try:
+        assert get_retry_policy("https://api.example.net/x") is policy
+        assert get_retry_policy("https://example.net/x") is DEFAULT_RETRY_POLICY
+    finally:
+        set_retry_policy("https://api.example.net", None)
+    assert get_retry_policy("https://api.example.net/x") is DEFAULT_RETRY_POLICY
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__retry_argument(mock_request, mock_sleep):
+    mock_request.side_effect = ConnectTimeout("connect timed out")
+    with pytest.raises(MapiNetworkException):
+        request_json("http://...", cache=False, retry=RetryPolicy(retries=1))
+    assert mock_request.call_count == 2
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__retry_status(mock_request, mock_sleep):
+    mock_request.side_effect = [
+        MockRequestResponse(503, "{}"),
+        MockRequestResponse(429, "{}", {"Retry-After": "2"}),
+        MockRequestResponse(200, '{"status":true}'),
+    ]
+    status, content = request_json("http://...", cache=False)
+    assert status == 200
+    assert content == {"status": True}
+    assert mock_request.call_count == 3
+    assert mock_sleep.call_args_list[1][0] == (2,)
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__retry_status_exhausted(mock_request, mock_sleep):
+    mock_request.return_value = MockRequestResponse(429, "{}")
+    status, content = request_json("http://...", cache=False)
+    assert status == 429
+    assert content is None
+    assert mock_request.call_count == DEFAULT_RETRY_POLICY.retries + 1
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__retry_timeout(mock_request):
+    mock_request.side_effect = ConnectTimeout("connect timed out")
+    with pytest.raises(MapiNetworkException) as exc_info:
+        request_json("http://...", cache=False)
+    assert "connect timed out" in str(exc_info.value)
+    assert mock_request.call_count == DEFAULT_RETRY_POLICY.retries + 1
+    timeouts = [kwargs["timeout"] for _, kwargs in mock_request.call_args_list]
+    assert timeouts == [DEFAULT_RETRY_POLICY.timeout(i) for i in range(4)]
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__no_retry_client_error(mock_request):
+    mock_request.return_value = MockRequestResponse(404, "{}")
+    status, _ = request_json("http://...", cache=False)
+    assert status == 404
+    assert mock_request.call_count == 1
+
+
+def test_request_json__coalesced():
+    with StubServer(delay=0.2) as server:
+        url = server.url + "/series/1"
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(
+                executor.map(
+                    lambda _: request_json(url, cache=MemoryCache()), range(8)
+                )
+            )
+    assert server.hits["/series/1"] == 1
+    assert all(result == (200, {"path": "/series/1"}) for result in results)
+
+
+def test_request_json__coalesced_copies(tmpdir):
+    backend = SQLiteCache(str(tmpdir.join("cache.sqlite")))
+    with StubServer(delay=0.2) as server:
+        url = server.url + "/series/1"
+
+        def call(_):
+            _, content = request_json(url, cache=backend)
+            content["mutated"] = True
+            return content
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(call, range(8)))
+    assert server.hits["/series/1"] == 1
+    assert len(set(map(id, results))) == 8
+
+
+def test_request_json__not_coalesced_uncached():
+    with StubServer(delay=0.2) as server:
+        url = server.url + "/series/1"
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(
+                executor.map(lambda _: request_json(url, cache=False), range(8))
+            )
+    assert server.hits["/series/1"] == 8
+
+
+def test_request_json__coalesced_by_authorization():
+    with StubServer(delay=0.2) as server:
+        url = server.url + "/series/1"
+
+        def call(i):
+            headers = {"Authorization": "Bearer %d" % (i % 2)}
+            return request_json(url, headers=headers, cache=MemoryCache())
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(call, range(8)))
+    assert server.hits["/series/1"] == 2
+
+
+@patch("mapi.utils.Session.request")
+def test_request_json__coalesced_error(mock_request):
+    def timeout(**_):
+        sleep(0.05)
+        raise ConnectTimeout("connect timed out")
+
+    mock_request.side_effect = timeout
+
+    def call(_):
+        with pytest.raises(MapiNetworkException) as e:
+            request_json("http://...", cache=MemoryCache())
+        return e.value
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        errors = list(executor.map(call, range(4)))
+    assert mock_request.call_count == DEFAULT_RETRY_POLICY.retries + 1
+    assert len(set(map(id, errors))) == 4
+    assert all(str(error) == str(errors[0]) for error in errors)
@@ -0,0 +1,182 @@
+# coding=utf-8
+
+"""Unit tests for mapi/warm.py and mapi/__main__.py."""
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from mock import MagicMock, call, patch
+
+from mapi.__main__ import main
+from mapi.exceptions import MapiNotFoundException
+from mapi.metadata import MetadataTelevision
+from mapi.warm import parse_item, read_items, warm
+
+ITEMS = [
+    ("imdb", "tt0089218"),
+    ("tmdb", "9340"),
+    ("tvdb", "73739"),
+    ("title", ("The Goonies", "1985")),
+    ("title", ("The Goonies", None)),
+]
+
+
+@pytest.fixture
+def mock_factory():
+    providers = {}
+
+    def factory(name, **options):
+        provider = providers[name] = MagicMock()
+        provider.options = options
+        provider.search.return_value = iter([])
+        return provider
+
+    with patch("mapi.warm.provider_factory", side_effect=factory), patch.dict(
+        "os.environ", {"API_KEY_OMDB": "key", "API_KEY_TMDB": "key"}
+    ):
+        yield providers
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("tt0089218\n", ("imdb", "tt0089218")),
+        ("tmdb:9340", ("tmdb", "9340")),
+        ("TVDB: 73739", ("tvdb", "73739")),
+        ("The Goonies (1985)", ("title", ("The Goonies", "1985"))),
+        ("The Goonies,1985", ("title", ("The Goonies", "1985"))),
+        ("The Goonies\t1985", ("title", ("The Goonies", "1985"))),
+        ("2001: A Space Odyssey", ("title", ("2001: A Space Odyssey", None))),
+        ("  ", None),
+        ("# comment", None),
+    ],
+)
+def test_parse_item(line, expected):
+    assert parse_item(line) == expected
+
+
+def test_read_items(tmpdir):
+    file_path = str(tmpdir.join("items.txt"))
+    with io.open(file_path, "w", encoding="utf-8") as fp:
+        fp.write(u"tt0089218\ntmdb:9340\n\ntt0089218\nAmélie (2001)\n")
+    assert read_items(file_path) == [
+        ("imdb", "tt0089218"),
+        ("tmdb", "9340"),
+        ("title", (u"Amélie", "2001")),
+    ]
+
+
+def test_warm(mock_factory):
+    progress = MagicMock()
+    stats = warm(ITEMS, concurrency=4, progress=progress, cache=False)
+    assert (stats.done, stats.failed, stats.skipped) == (5, 0, 0)
+    assert progress.call_count == 5
+    mock_factory["omdb"].search.assert_called_once_with(id_imdb="tt0089218")
+    mock_factory["tvdb"].search.assert_called_once_with(id_tvdb="73739")
+    assert mock_factory["tmdb"].search.call_count == 3
+    assert mock_factory["tvdb"].options == {"cache": False}
+
+
+def test_warm__tvdb_episodes():
+    def search(id_tvdb, season=None, episode=None):
+        if season is None:
+            return iter(
+                [
+                    MetadataTelevision(season=s, episode=e, id_tvdb=id_tvdb)
+                    for s, e in [(1, 1), (1, 2), (2, 1), (1, 1)]
+                ]
+            )
+        if (season, episode) == (2, 1):
+            raise MapiNotFoundException
+        return iter([])
+
+    provider = MagicMock()
+    provider.search.side_effect = search
+    with patch("mapi.warm.provider_factory", return_value=provider):
+        stats = warm([("tvdb", "73739")])
+    assert stats.done == 1
+    assert provider.search.call_args_list == [
+        call(id_tvdb="73739"),
+        call(id_tvdb="73739", season=1, episode=1),
+        call(id_tvdb="73739", season=1, episode=2),
+        call(id_tvdb="73739", season=2, episode=1),
+    ]
+
+
+def test_warm__bounded_queue(mock_factory):
+    progress = MagicMock()
+    queued = []  # items submitted but not yet reported, as each is submitted
+
+    class Executor(ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            queued.append(len(queued) + 1 - progress.call_count)
+            return super(Executor, self).submit(fn, *args, **kwargs)
+
+    items = [("tmdb", str(i)) for i in range(50)]
+    with patch("mapi.warm.ThreadPoolExecutor", Executor):
+        stats = warm(items, concurrency=2, progress=progress)
+    assert stats.done == 50
+    assert max(queued) <= 4
+
+
+def test_warm__movie_provider_fallback(mock_factory):
+    with patch.dict("os.environ", {"API_KEY_OMDB": ""}):
+        warm(ITEMS[:1])
+    assert set(mock_factory) == {"tmdb"}
+
+
+def test_warm__failures():
+    def warm_item(providers, item):
+        if item[0] == "imdb":
+            raise MapiNotFoundException
+
+    with patch("mapi.warm._warm_item", side_effect=warm_item):
+        stats = warm(ITEMS)
+    assert (stats.done, stats.failed) == (4, 1)
+    assert list(stats.errors) == ["imdb:tt0089218"]
+    assert stats.errors["imdb:tt0089218"] == "MapiNotFoundException"
+
+
+def test_warm__resume(mock_factory, tmpdir):
+    state_path = str(tmpdir.join("state"))
+    warm(ITEMS[:2], state_path=state_path)
+    stats = warm(ITEMS, state_path=state_path)
+    assert (stats.done, stats.skipped) == (3, 2)
+    stats = warm(ITEMS, state_path=state_path)
+    assert (stats.done, stats.skipped) == (0, 5)
+
+
+def test_main__warm(mock_factory, tmpdir, capsys):
+    file_path = str(tmpdir.join("items.txt"))
+    with io.open(file_path, "w", encoding="utf-8") as fp:
+        fp.write(u"tt0089218\ntmdb:9340\n")
+    assert main(["warm", file_path]) == 0
+    out, err = capsys.readouterr()
+    assert "Warmed 2 items (0 failed, 0 skipped)" in out
+    assert "2/2 items" in err
+    assert main(["warm", "--quiet", file_path]) == 0
+    out, err = capsys.readouterr()
+    assert "Warmed 0 items (0 failed, 2 skipped)" in out
+    assert err == ""
+    mock_factory.clear()
+    assert main(["warm", "--restart", "--cache", "memory", file_path]) == 0
+    assert mock_factory["omdb"].options == {"cache": "memory"}
+
+
+def test_main__warm_failures(mock_factory, tmpdir, capsys):
+    file_path = str(tmpdir.join("items.txt"))
+    with io.open(file_path, "w", encoding="utf-8") as fp:
+        fp.write(u"tmdb:9340\n")
+    with patch("mapi.warm._warm_item", side_effect=MapiNotFoundException("x")):
+        assert main(["warm", "-q", file_path]) == 1
+    out, _ = capsys.readouterr()
+    assert "tmdb:9340: x" in out
+
+
+def test_main__no_command(capsys):
+    with pytest.raises(SystemExit) as e:
+        main([])
+    assert e.value.code == 2
+    _, err = capsys.readouterr()
+    assert err.startswith("usage: python -m mapi")